@@ -0,0 +1,14 @@
+from django.apps import AppConfig
+
+
+class ApiConfig(AppConfig):
+    name = 'api'
+
+    def ready(self):
+        from .signature import install_reload_signal
+        from .validators.plan import compile_plans
+
+        # let operators rotate the collateral keys without a restart
+        install_reload_signal()
+        # the collateral of each environment in the form the body checks compare
+        compile_plans()
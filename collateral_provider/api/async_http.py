@@ -0,0 +1,184 @@
+import asyncio
+import gzip
+import json
+import ssl
+import weakref
+from urllib.parse import urlsplit
+
+
+class AsyncHTTPError(Exception):
+    """
+    No usable reply. A reply with a status that isn't a success carries
+    the status and its body.
+    """
+
+    def __init__(self, message: str, status: int = None, body: bytes = None):
+        super().__init__(message)
+        self.status = status
+        self.body = body
+
+
+class AsyncJSONPool:
+    """
+    A minimal keep-alive HTTP/1.1 client that POSTs JSON to one URL from an
+    event loop. It only speaks what the evaluation upstream needs: a JSON
+    request body, and a response framed by content-length, chunked encoding
+    or connection close, optionally gzipped. Unlike the requests read
+    timeout, read_timeout bounds the whole exchange, writing the request
+    and reading every byte of the reply.
+    """
+
+    def __init__(self, url: str, max_connections: int, connect_timeout: float, read_timeout: float,
+                 retries: int = 0, backoff_factor: float = 0.0):
+        parts = urlsplit(url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self.host_header = parts.netloc
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self._ssl = ssl.create_default_context() if parts.scheme == "https" else None
+        self._idle = []
+        self._slots = asyncio.Semaphore(max_connections)
+
+    async def _open(self):
+        return await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=self._ssl),
+            self.connect_timeout,
+        )
+
+    @staticmethod
+    def _close(connection) -> None:
+        connection[1].close()
+
+    async def _read_body(self, reader, headers: dict) -> tuple:
+        """
+        Returns the body and whether the connection may be reused.
+        """
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";", 1)[0], 16)
+                if size == 0:
+                    # skip trailers
+                    while await reader.readuntil(b"\r\n") != b"\r\n":
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b"".join(chunks)
+            reusable = True
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+            reusable = True
+        else:
+            body = await reader.read()
+            reusable = False
+        if headers.get("connection", "").lower() == "close":
+            reusable = False
+        if headers.get("content-encoding", "").lower() == "gzip":
+            body = gzip.decompress(body)
+        return body, reusable
+
+    async def _exchange(self, connection, payload: bytes) -> tuple:
+        reader, writer = connection
+        writer.write(
+            f"POST {self.target} HTTP/1.1\r\n"
+            f"Host: {self.host_header}\r\n"
+            "Accept: application/json\r\n"
+            "Accept-Encoding: gzip\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            "Connection: keep-alive\r\n\r\n".encode("latin-1") + payload
+        )
+        await writer.drain()
+        status_line = await reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        body, reusable = await self._read_body(reader, headers)
+        return status, body, reusable
+
+    async def post_json(self, payload: dict) -> dict:
+        """
+        POSTs a JSON document and returns the decoded JSON reply. A status
+        other than a success raises AsyncHTTPError, 502, 503 and 504 after
+        the retries.
+        """
+        data = json.dumps(payload).encode()
+        attempt = 0
+        async with self._slots:
+            while attempt <= self.retries:
+                reused = bool(self._idle)
+                try:
+                    connection = self._idle.pop() if reused else await self._open()
+                except (OSError, asyncio.TimeoutError) as e:
+                    error = e
+                    attempt = await self._backoff(attempt)
+                    continue
+                try:
+                    status, body, reusable = await asyncio.wait_for(self._exchange(connection, data), self.read_timeout)
+                except asyncio.TimeoutError as e:
+                    # before OSError, it's a subclass of it
+                    self._close(connection)
+                    error = e
+                    attempt = await self._backoff(attempt)
+                    continue
+                except (OSError, ValueError, IndexError, asyncio.IncompleteReadError,
+                        asyncio.LimitOverrunError) as e:
+                    self._close(connection)
+                    error = e
+                    # an idle keep-alive socket the server already closed is not a real attempt
+                    if not reused:
+                        attempt = await self._backoff(attempt)
+                    continue
+                except BaseException:
+                    # cancelled mid exchange, the connection is left half read
+                    self._close(connection)
+                    raise
+                if reusable:
+                    self._idle.append(connection)
+                else:
+                    self._close(connection)
+                if status in (502, 503, 504):
+                    error = AsyncHTTPError(f"Upstream Status {status}")
+                    attempt = await self._backoff(attempt)
+                    continue
+                if not 200 <= status < 300:
+                    raise AsyncHTTPError(f"Upstream Status {status}", status, body)
+                try:
+                    return json.loads(body)
+                except ValueError as e:
+                    raise AsyncHTTPError(f"Invalid JSON From Upstream: {e}") from e
+        raise AsyncHTTPError(f"Upstream Unavailable: {error!r}")
+
+    async def _backoff(self, attempt: int) -> int:
+        if attempt < self.retries:
+            await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+        return attempt + 1
+
+    def close(self) -> None:
+        while self._idle:
+            self._close(self._idle.pop())
+
+
+# connections belong to the loop that opened them, so pools are kept per loop
+_pools = weakref.WeakKeyDictionary()
+
+
+def get_pool(url: str, **options) -> AsyncJSONPool:
+    loop = asyncio.get_running_loop()
+    pools = _pools.setdefault(loop, {})
+    pool = pools.get(url)
+    if pool is None:
+        pool = AsyncJSONPool(url, **options)
+        pools[url] = pool
+    return pool
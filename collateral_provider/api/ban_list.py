@@ -1,8 +1,161 @@
-# strings of ip addresses that are banned. Think bots, scammers etc.
-# example: '127.0.0.1'
+import ipaddress
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger('api')
+
+# strings of ip addresses or CIDR ranges that are banned. Think bots, scammers etc.
+# example: '127.0.0.1' or '10.0.0.0/8'
+# these are always banned, on top of the ban list file in settings.BAN_LIST_PATH
 banned_ip_address = []
 
 
 # strings of the key hashes of addresses. Think scam contracts, deadends, etc.
 # example: '70abcdef1234567890abcdef1234567890abcdef1234567890abcdef12'
 banned_addresses = []
+
+# seconds between checks of the ban list file for changes
+BAN_LIST_CHECK_INTERVAL = 1.0
+
+
+class NetworkIndex:
+    """
+    Banned IPv4 and IPv6 ranges indexed by prefix length. Each length keeps
+    a set of the network bits, so a lookup is one set probe per distinct
+    prefix length in the list. A single address is a /32 or a /128.
+    """
+
+    def __init__(self, networks):
+        self._prefixes = {4: {}, 6: {}}
+        for network in networks:
+            shift = network.max_prefixlen - network.prefixlen
+            self._prefixes[network.version].setdefault(network.prefixlen, set()).add(int(network.network_address) >> shift)
+        # longest first so single addresses, the common case, match first
+        self._lookup = {
+            version: sorted(((32 if version == 4 else 128) - prefixlen, frozenset(bits))
+                            for prefixlen, bits in prefixes.items())
+            for version, prefixes in self._prefixes.items()
+        }
+
+    def __contains__(self, ip_address) -> bool:
+        try:
+            address = ipaddress.ip_address(ip_address)
+        except ValueError:
+            return False
+        # an ipv4 client seen through an ipv6 socket
+        if address.version == 6 and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        value = int(address)
+        for shift, bits in self._lookup[address.version]:
+            if value >> shift in bits:
+                return True
+        return False
+
+
+class BanList:
+    """
+    The banned ip ranges and the banned addresses as raw bytes.
+    """
+
+    def __init__(self, ip_addresses=(), addresses=()):
+        networks = []
+        for entry in ip_addresses:
+            try:
+                networks.append(ipaddress.ip_network(entry.strip(), strict=False))
+            except (ValueError, AttributeError):
+                logger.warning("Skipping Invalid Banned IP: %s", entry)
+        raw = set()
+        for entry in addresses:
+            try:
+                raw.add(bytes.fromhex(entry.strip()))
+            except (ValueError, AttributeError):
+                logger.warning("Skipping Invalid Banned Address: %s", entry)
+        self.networks = NetworkIndex(networks)
+        self.addresses = frozenset(raw)
+
+    def ip_is_banned(self, ip_address: str) -> bool:
+        return ip_address is not None and ip_address in self.networks
+
+    def address_is_banned(self, address: bytes) -> bool:
+        return address in self.addresses
+
+
+def read_ban_list(path: str) -> BanList:
+    """
+    Reads a ban list file on top of the lists in this module.
+
+    The file is JSON with an "ip_addresses" list of addresses or CIDR ranges
+    and an "addresses" list of hex encoded addresses. A missing file bans
+    nothing extra.
+    """
+    data = {}
+    if path and os.path.exists(path):
+        with open(path, "r") as file:
+            data = json.load(file)
+    return BanList(
+        list(banned_ip_address) + list(data.get("ip_addresses", [])),
+        list(banned_addresses) + list(data.get("addresses", [])),
+    )
+
+
+class BanListLoader:
+    """
+    Keeps the ban list in memory and reloads it when the file changes, at
+    most once every BAN_LIST_CHECK_INTERVAL seconds. A file that fails to
+    parse is logged and the previous list stays in force.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = self._stat()
+        self._checked_at = time.monotonic()
+        try:
+            self._ban_list = read_ban_list(path)
+        except (OSError, ValueError, AttributeError) as e:
+            logger.error("Failed To Load Ban List %s: %s", path, e)
+            self._ban_list = BanList(banned_ip_address, banned_addresses)
+
+    def _stat(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except (OSError, TypeError):
+            return None
+
+    def get(self) -> BanList:
+        now = time.monotonic()
+        if now - self._checked_at >= BAN_LIST_CHECK_INTERVAL:
+            with self._lock:
+                if now - self._checked_at >= BAN_LIST_CHECK_INTERVAL:
+                    self._checked_at = now
+                    mtime = self._stat()
+                    if mtime != self._mtime:
+                        try:
+                            self._ban_list = read_ban_list(self.path)
+                            logger.info("Reloaded Ban List From %s", self.path)
+                        except (OSError, ValueError, AttributeError) as e:
+                            logger.error("Keeping Previous Ban List, Failed To Load %s: %s", self.path, e)
+                        self._mtime = mtime
+        return self._ban_list
+
+
+# one loader per path for the life of the worker
+_loaders = {}
+_loaders_lock = threading.Lock()
+
+
+def get_ban_list() -> BanList:
+    path = settings.BAN_LIST_PATH
+    loader = _loaders.get(path)
+    if loader is None:
+        with _loaders_lock:
+            loader = _loaders.get(path)
+            if loader is None:
+                loader = BanListLoader(path)
+                _loaders[path] = loader
+    return loader.get()
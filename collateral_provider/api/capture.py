@@ -0,0 +1,184 @@
+import hashlib
+import hmac
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+
+import orjson
+from django.conf import settings
+
+from api.reasons import outcome_of
+from api.util import get_client_ip
+
+# only the single endpoint, one tx per line
+CAPTURED_PATH = re.compile(r'^/(?P<environment>[^/]+)/collateral/?$')
+
+
+def enabled() -> bool:
+    return settings.CAPTURE['PATH'] is not None
+
+
+def client_key(ip_address: str) -> str:
+    """
+    Stands in for the client ip. The same ip gets the same key, so a
+    replay throttles the same clients together, but the ip can't be read
+    back without the secret key.
+    """
+    digest = hmac.new(settings.SECRET_KEY.encode(), (ip_address or '').encode(), hashlib.sha256)
+    return digest.hexdigest()[:12]
+
+
+logger = logging.getLogger('api')
+
+
+class CaptureWriter:
+    """
+    Appends captured lines to one file from a background thread, so a
+    request never waits on the disk. The file is opened for append and each
+    line goes out in one write, so every worker of a server can share it,
+    and nothing is ever rotated away under another worker. Once the file
+    holds max_bytes capturing stops. A line that finds the queue full is
+    dropped, the drops are logged as a warning and never land in the file.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 0, queue_size: int = 10000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self._closed = False
+        self._start(queue_size)
+        # the writer thread doesn't survive a fork, a forked worker starts its own
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _start(self, queue_size: int):
+        self.queue = queue.Queue(queue_size)
+        self.thread = threading.Thread(target=self._run, name='capture-writer', daemon=True)
+        self.thread.start()
+
+    def _after_fork(self):
+        if not self._closed:
+            # the parent's queue may have been locked mid put
+            self._start(self.queue.maxsize)
+
+    def write(self, line: bytes) -> None:
+        try:
+            self.queue.put_nowait(line)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def _take_dropped(self) -> int:
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        return dropped
+
+    def _run(self):
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        full = False
+        try:
+            while True:
+                line = self.queue.get()
+                try:
+                    dropped = self._take_dropped()
+                    if dropped:
+                        logger.warning("Dropped %s Captured Requests", dropped)
+                    if line is None:
+                        return
+                    if self.max_bytes and os.fstat(fd).st_size >= self.max_bytes:
+                        if not full:
+                            logger.warning("Capture File %s Is Full, Capturing Stopped", self.path)
+                        full = True
+                        continue
+                    os.write(fd, line)
+                finally:
+                    self.queue.task_done()
+        finally:
+            os.close(fd)
+
+    def flush(self):
+        # waits for the writer to drain the queue
+        self.queue.join()
+
+    def close(self):
+        self._closed = True
+        self.queue.put(None)
+        self.thread.join()
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(path: str) -> CaptureWriter:
+    """
+    The capture writer of a path, shared by every thread of a worker.
+    """
+    writer = _writers.get(path)
+    if writer is None:
+        with _writers_lock:
+            writer = _writers.get(path)
+            if writer is None:
+                writer = CaptureWriter(path, max_bytes=settings.CAPTURE['MAX_BYTES'])
+                _writers[path] = writer
+    return writer
+
+
+def should_capture(request):
+    """
+    The environment of a sampled /collateral/ request, or None.
+    """
+    if not enabled() or request.method != 'POST':
+        return None
+    match = CAPTURED_PATH.match(request.path)
+    if match is None or random.random() >= settings.CAPTURE['SAMPLE_RATE']:
+        return None
+    return match['environment']
+
+
+def tx_body_of(request):
+    # reading the body here keeps it readable for the view
+    try:
+        data = orjson.loads(request.body)
+    except orjson.JSONDecodeError:
+        return None
+    tx_body = data.get('tx_body') if isinstance(data, dict) else None
+    return tx_body if isinstance(tx_body, str) else None
+
+
+def record(environment: str, client: str, tx_body: str, arrival: float, response, seconds: float) -> None:
+    # a streamed response has no content to read the outcome from
+    content = b'' if getattr(response, 'streaming', False) else response.content
+    line = orjson.dumps({
+        'arrival': round(arrival, 3),
+        'environment': environment,
+        'client': client,
+        'tx_body': tx_body,
+        'status': response.status_code,
+        'outcome': outcome_of(response.status_code, content),
+        'latency_ms': round(seconds * 1000, 3),
+    }, option=orjson.OPT_APPEND_NEWLINE)
+    get_writer(settings.CAPTURE['PATH']).write(line)
+
+
+class Capture:
+    """
+    One captured request, from the moment it arrived to its response.
+    """
+
+    def __init__(self, request, environment: str):
+        self.environment = environment
+        self.tx_body = tx_body_of(request)
+        self.client = client_key(get_client_ip(request))
+        self.arrival = time.time()
+        self.start = time.perf_counter()
+
+    def finish(self, response) -> None:
+        # a body without a tx can't be replayed
+        if self.tx_body is not None:
+            record(self.environment, self.client, self.tx_body, self.arrival, response,
+                   time.perf_counter() - self.start)
@@ -0,0 +1,255 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+
+try:
+    import brotli
+except ImportError:  # optional, responses are still gzipped without it
+    brotli = None
+
+logger = logging.getLogger('api')
+
+# seconds between checks of the known hosts file for changes
+KNOWN_HOSTS_CHECK_INTERVAL = 1.0
+
+# how a client reaches a host, and the field of a network entry holding it
+TRANSPORTS = {'https': 'url', 'onion': 'onion'}
+
+
+class Rendered:
+    """
+    One response body held in memory with its strong ETag, plus gzip and
+    brotli copies made once when it is rendered. Each encoding has its own
+    ETag because the bytes on the wire differ.
+    """
+
+    def __init__(self, body: bytes, content_type: str):
+        self.content_type = content_type
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.variants = {'identity': (body, f'"{digest}"')}
+        compressed = gzip.compress(body, compresslevel=9, mtime=0)
+        # tiny bodies don't get smaller
+        if len(compressed) < len(body):
+            self.variants['gzip'] = (compressed, f'"{digest}-gzip"')
+        if brotli is not None:
+            compressed = brotli.compress(body)
+            if len(compressed) < len(body):
+                self.variants['br'] = (compressed, f'"{digest}-br"')
+
+
+class KnownHosts:
+    """
+    A snapshot of known.hosts.json. Renderings of it are made once and kept
+    with the snapshot, so a changed file drops them all at once. The hosts
+    are indexed by network and by pkh when the snapshot is made.
+    """
+
+    def __init__(self, data: dict, found: bool = True):
+        self.data = data
+        self.found = found
+        self.networks = {}
+        self.pkhs = {}
+        for pkh, host in data.items():
+            # skip the $pkh template entry
+            if pkh.startswith('$') or not isinstance(host, dict):
+                continue
+            for network, entry in host.items():
+                if network == 'public_key' or not isinstance(entry, dict):
+                    continue
+                self.networks.setdefault(network, {})[pkh] = entry
+                self.pkhs.setdefault(pkh, {})[network] = entry
+        self._rendered = {}
+        self._lock = threading.Lock()
+
+    def filter_key(self, network: str = None, pkh: str = None, transport: str = None) -> tuple:
+        """
+        The filters with unknown networks and pkhs folded into '', which
+        matches nothing, so there is one cached rendering per indexed value.
+        """
+        if network is not None and network not in self.networks:
+            network = ''
+        if pkh is not None and pkh not in self.pkhs:
+            pkh = ''
+        return network, pkh, transport
+
+    def select(self, network: str = None, pkh: str = None, transport: str = None) -> dict:
+        """
+        The hosts matching the filters, in the shape of the file.
+
+        Args:
+            network (str, optional): Only entries for this network.
+            pkh (str, optional): Only this host.
+            transport (str, optional): Only entries reachable over https or onion.
+
+        Returns:
+            dict: pkh to the matching network entries and the public key.
+        """
+        if pkh is not None:
+            candidates = {pkh: self.pkhs.get(pkh, {})}
+        elif network is not None:
+            candidates = {host: {network: entry} for host, entry in self.networks.get(network, {}).items()}
+        else:
+            candidates = self.pkhs
+        selected = {}
+        for host, entries in candidates.items():
+            matches = {}
+            for entry_network, entry in entries.items():
+                if network is not None and entry_network != network:
+                    continue
+                if transport is not None and not reachable(entry, transport):
+                    continue
+                matches[entry_network] = entry
+            if matches:
+                matches['public_key'] = self.data[host].get('public_key', '')
+                selected[host] = matches
+        return selected
+
+    def rendered(self, key, render) -> Rendered:
+        """
+        Returns the cached rendering under `key`, calling render(self) for
+        the body bytes and the content type the first time.
+        """
+        rendered = self._rendered.get(key)
+        if rendered is None:
+            with self._lock:
+                rendered = self._rendered.get(key)
+                if rendered is None:
+                    rendered = Rendered(*render(self))
+                    self._rendered[key] = rendered
+        return rendered
+
+
+def reachable(entry: dict, transport: str) -> bool:
+    address = entry.get(TRANSPORTS[transport])
+    if not isinstance(address, str):
+        return False
+    return address.startswith('https://') if transport == 'https' else bool(address)
+
+
+def read_known_hosts(path: str) -> KnownHosts:
+    try:
+        with open(path, 'r') as json_file:
+            return KnownHosts(json.load(json_file))
+    except FileNotFoundError:
+        return KnownHosts({}, found=False)
+
+
+class KnownHostsLoader:
+    """
+    Keeps the known hosts in memory and reloads them when the file changes,
+    at most once every KNOWN_HOSTS_CHECK_INTERVAL seconds. A file that fails
+    to parse is logged and the previous snapshot keeps being served.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = self._stat()
+        self._checked_at = time.monotonic()
+        try:
+            self._hosts = read_known_hosts(path)
+        except (OSError, ValueError) as e:
+            logger.error("Failed To Load Known Hosts %s: %s", path, e)
+            self._hosts = KnownHosts({}, found=False)
+
+    def _stat(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def get(self) -> KnownHosts:
+        now = time.monotonic()
+        if now - self._checked_at >= KNOWN_HOSTS_CHECK_INTERVAL:
+            with self._lock:
+                if now - self._checked_at >= KNOWN_HOSTS_CHECK_INTERVAL:
+                    self._checked_at = now
+                    mtime = self._stat()
+                    if mtime != self._mtime:
+                        try:
+                            self._hosts = read_known_hosts(self.path)
+                            logger.info("Reloaded Known Hosts From %s", self.path)
+                        except (OSError, ValueError) as e:
+                            logger.error("Keeping Previous Known Hosts, Failed To Load %s: %s", self.path, e)
+                        self._mtime = mtime
+        return self._hosts
+
+
+# one loader per path for the life of the worker
+_loaders = {}
+_loaders_lock = threading.Lock()
+
+
+def get_known_hosts() -> KnownHosts:
+    path = settings.KNOWN_HOSTS_PATH
+    loader = _loaders.get(path)
+    if loader is None:
+        with _loaders_lock:
+            loader = _loaders.get(path)
+            if loader is None:
+                loader = KnownHostsLoader(path)
+                _loaders[path] = loader
+    return loader.get()
+
+
+def accepted_encodings(header: str) -> set:
+    """
+    The content codings an Accept-Encoding header allows, q=0 excluded.
+    """
+    encodings = set()
+    for part in header.split(','):
+        name, _, params = part.partition(';')
+        name = name.strip().lower()
+        q = params.strip()
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            encodings.add(name)
+    return encodings
+
+
+def none_match(header: str, etag: str) -> bool:
+    """
+    Whether an If-None-Match header matches the etag. The comparison is
+    weak (RFC 9110 13.1.2), a W/ prefix on either tag is ignored.
+    """
+    if header.strip() == '*':
+        return True
+    opaque = etag.removeprefix('W/')
+    return any(tag.strip().removeprefix('W/') == opaque for tag in header.split(','))
+
+
+def respond(request, rendered: Rendered) -> HttpResponse:
+    """
+    Serves a rendering in the best encoding the client accepts, or a 304
+    when the client already holds it.
+    """
+    accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    encoding = 'identity'
+    for candidate in ('br', 'gzip'):
+        if candidate in rendered.variants and (candidate in accepted or '*' in accepted):
+            encoding = candidate
+            break
+    body, etag = rendered.variants[encoding]
+
+    if none_match(request.META.get('HTTP_IF_NONE_MATCH', ''), etag):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type=rendered.content_type)
+        if encoding != 'identity':
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Cache-Control'] = f"public, max-age={settings.KNOWN_HOSTS_MAX_AGE}"
+    response['Vary'] = 'Accept-Encoding'
+    return response
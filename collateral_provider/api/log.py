@@ -0,0 +1,159 @@
+import datetime
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+import orjson
+from cachetools import TTLCache
+
+# attributes every LogRecord has, anything else on a record came from extra=
+RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line with the time, level, logger, module and
+    message, plus whatever was passed in extra=, e.g. the client ip.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return orjson.dumps(entry, default=str).decode()
+
+
+class SampleFilter(logging.Filter):
+    """
+    Lets the first `burst` copies of a message from one ip through per
+    `window` seconds and drops the rest, so a client repeating the same bad
+    request can't flood the log. The first copy let through in the next
+    window carries how many were dropped. Records without an ip are keyed by
+    the message alone. The message is never rendered here, on the request
+    thread, it is keyed by its format string and arguments.
+    """
+
+    def __init__(self, burst: int = 5, window: float = 60.0, max_keys: int = 10000):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        # idle keys expire, a key that keeps repeating stays
+        self._seen = TTLCache(maxsize=max_keys, ttl=window)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(record: logging.LogRecord) -> tuple:
+        msg = record.msg if isinstance(record.msg, str) else type(record.msg)
+        key = (getattr(record, 'ip', None), record.levelno, msg, record.args)
+        try:
+            hash(key)
+        except TypeError:
+            # e.g. serializer.errors, the format string alone stands in for it
+            key = key[:3]
+        return key
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.burst <= 0:
+            return True
+        key = self.key(record)
+        now = time.monotonic()
+        with self._lock:
+            start, count, dropped = self._seen.get(key, (now, 0, 0))
+            if now - start >= self.window:
+                start, count = now, 0
+            if count < self.burst:
+                self._seen[key] = (start, count + 1, 0)
+                if dropped:
+                    record.suppressed = dropped
+                return True
+            self._seen[key] = (start, count, dropped + 1)
+        return False
+
+
+class QueueListener(logging.handlers.QueueListener):
+
+    def enqueue_sentinel(self):
+        # waits for room, the writer is still draining a full queue
+        self.queue.put(self._sentinel)
+
+
+class QueuedHandler(logging.handlers.QueueHandler):
+    """
+    A rotating log file written by a background thread. A request only puts
+    the record on a bounded queue, it never waits on the disk or on a
+    rotation, and the record is formatted by the writer. When the queue is
+    full the record is dropped and counted, and the count is logged once
+    the writer catches up.
+    """
+
+    def __init__(self, filename: str, maxBytes: int = 0, backupCount: int = 0, queue_size: int = 10000):
+        super().__init__(queue.Queue(queue_size))
+        self.target = logging.handlers.RotatingFileHandler(
+            filename, maxBytes=maxBytes, backupCount=backupCount, delay=True
+        )
+        self.dropped = 0
+        self.listener = None
+        self._closed = False
+        self._start()
+        # the writer thread doesn't survive a fork, a forked worker starts its own
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _start(self):
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def _after_fork(self):
+        if not self._closed:
+            # the parent's queue may have been locked mid put
+            self.queue = queue.Queue(self.queue.maxsize)
+            self._start()
+
+    def setFormatter(self, fmt):
+        # formatting happens in the writer
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # the queue never leaves the process, so the record goes as is
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            if self.dropped:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    'name': record.name, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                    'msg': 'Dropped %s Log Records', 'args': (self.dropped,),
+                }))
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def flush(self):
+        # waits for the writer to drain the queue
+        if self.listener is not None:
+            self._stop()
+            self.target.flush()
+            self._start()
+
+    def close(self):
+        self._closed = True
+        self._stop()
+        self.target.close()
+        super().close()
@@ -0,0 +1,195 @@
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import time
+import tracemalloc
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from rest_framework import serializers
+
+from api.serializers import ProvideCollateralSerializer
+from api.signature import create_witness_cbor, tx_id, witness_tx_cbor
+from api.synthetic import MAX_TX_SIZE, SHAPES, TxShape, synthetic_tx
+from api.validators.cbor import CborValidator
+from api.validators.plan import get_plan
+from benchmarks.common import percentile, temporary_directory
+from benchmarks.fixtures import FIXTURE_TX, FIXTURE_VKEY, bench_settings
+
+# rejections are expected while probing the cases, none of them are logged
+quiet = logging.getLogger('api.bench')
+quiet.disabled = True
+
+DEFAULT_BASELINE = os.path.join(settings.BASE_DIR, 'benchmarks', 'hot_path.baseline.json')
+
+# bytes a case may allocate past its baseline before the threshold applies
+ALLOCATION_SLACK = 64
+
+
+def transactions() -> dict:
+    txs = {
+        'valid': FIXTURE_TX,
+        # twice the limit, check_cbor_hex turns it away
+        'big': synthetic_tx(TxShape(size=2 * MAX_TX_SIZE)),
+    }
+    # from a plain payment up to the 16 KB limit
+    for name, shape in SHAPES.items():
+        txs[f'synthetic-{name}'] = synthetic_tx(shape)
+    return txs
+
+
+def cases(skey_path: str, vkey_path: str, env_settings: dict) -> dict:
+    """
+    Every hot path function against every tx, as name: zero argument call.
+    """
+    validator = CborValidator(quiet)
+    plan = get_plan('preprod', env_settings)
+    context = {'environment': 'preprod', 'env_settings': env_settings,
+               'ip_address': '127.0.0.1', 'networks': ['preprod']}
+    serializer = ProvideCollateralSerializer(context=context)
+    signature = '00' * 64
+
+    found = {'create_witness_cbor': lambda: create_witness_cbor(FIXTURE_VKEY, signature)}
+    for name, tx_hex in transactions().items():
+        tx_bytes = bytes.fromhex(tx_hex)
+        found[f'tx_id[{name}]'] = lambda tx_hex=tx_hex: tx_id(tx_hex)
+        found[f'witness_tx_cbor[{name}]'] = lambda tx_hex=tx_hex: witness_tx_cbor(tx_hex, skey_path, vkey_path)
+        found[f'check_cbor_hex[{name}]'] = lambda tx_hex=tx_hex: validator.check_cbor_hex(tx_hex)
+        found[f'check_tx_shape[{name}]'] = lambda tx_bytes=tx_bytes: validator.check_tx_shape(tx_bytes)
+        found[f'check_tx_body[{name}]'] = lambda tx_bytes=tx_bytes: validator.check_tx_body(tx_bytes)
+        try:
+            body = validator.check_tx_body(tx_bytes)
+        except serializers.ValidationError:
+            body = None
+        if body is not None:
+            found[f'check_body[{name}]'] = lambda body=body: validator.check_body(body, plan)
+        found[f'validate_tx_body[{name}]'] = lambda tx_hex=tx_hex: serializer.validate_tx_body(tx_hex)
+    return found
+
+
+def measure(call, iterations: int, warmup: int, alloc_iterations: int) -> dict:
+    for _ in range(warmup):
+        call()
+    timings = []
+    # like timeit, a collection landing in one sample would skew it
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            begin = time.perf_counter_ns()
+            call()
+            timings.append(time.perf_counter_ns() - begin)
+        elapsed = time.perf_counter() - start
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    # tracemalloc slows every allocation down, so memory gets its own pass
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(alloc_iterations):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            call()
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+    return {
+        'ops': iterations / elapsed,
+        'p50_us': percentile(timings, 50) / 1000,
+        'p95_us': percentile(timings, 95) / 1000,
+        'p99_us': percentile(timings, 99) / 1000,
+        'peak_bytes': int(statistics.median(peaks)) if peaks else 0,
+    }
+
+
+def regressions(results: dict, baseline: dict, threshold: float) -> list:
+    found = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['p50_us'] > base['p50_us'] * (1 + threshold):
+            found.append(f"{name}: p50 {base['p50_us']:.2f} us -> {result['p50_us']:.2f} us")
+        if result['peak_bytes'] > max(base['peak_bytes'] * (1 + threshold), base['peak_bytes'] + ALLOCATION_SLACK):
+            found.append(f"{name}: peak {base['peak_bytes']} B -> {result['peak_bytes']} B")
+    return found
+
+
+class Command(BaseCommand):
+    help = ("Benchmarks hashing, witnessing and the tx checks against the fixture and synthetic txs, "
+            "and fails when a case regresses past its stored baseline.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=1000, help="timed calls per case")
+        parser.add_argument('--warmup', type=int, default=50, help="untimed calls per case first")
+        parser.add_argument('--alloc-iterations', type=int, default=50, help="calls per case traced for memory")
+        parser.add_argument('--filter', default='', help="only the cases whose name contains this")
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="the baseline json file")
+        parser.add_argument('--save', action='store_true', help="store this run as the baseline")
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help="fraction a case's p50 or peak memory may grow past its baseline")
+
+    def handle(self, *args, **options):
+        with temporary_directory() as directory:
+            overrides = bench_settings(directory, 'http://127.0.0.1:9')
+            # every call evaluates, a cached verdict would skip the stubbed upstream
+            overrides['VERDICT_CACHE'] = dict(settings.VERDICT_CACHE, ENABLED=False)
+            with override_settings(**overrides), \
+                    patch('api.validators.transaction.evaluate_transaction', return_value={'result': []}):
+                results = self.run(options, overrides['SKEY_PATH'], overrides['VKEY_PATH'],
+                                   overrides['ENVIRONMENTS']['preprod'])
+
+        baseline = self.load_baseline(options['baseline'])
+        self.report(results, baseline)
+        if options['save']:
+            with open(options['baseline'], 'w') as file:
+                json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                           'cases': {**baseline, **results}}, file, indent=2, sort_keys=True)
+            self.stdout.write(f"Baseline Saved To {options['baseline']}")
+            return
+        if not baseline:
+            self.stdout.write("No Baseline, Run With --save To Store One")
+            return
+        found = regressions(results, baseline, options['threshold'])
+        if found:
+            raise CommandError("Regressed Past {:.0%}:\n  {}".format(options['threshold'], '\n  '.join(found)))
+
+    def run(self, options, skey_path, vkey_path, env_settings) -> dict:
+        results = {}
+        for name, call in cases(skey_path, vkey_path, env_settings).items():
+            if options['filter'] not in name:
+                continue
+            try:
+                call()
+            except serializers.ValidationError as e:
+                # a fixture the function rejects, e.g. the big tx is over the size limit
+                self.stdout.write(f"{name:<36} skipped, {e.detail[0]}")
+                continue
+            results[name] = measure(call, options['iterations'], options['warmup'], options['alloc_iterations'])
+        return results
+
+    @staticmethod
+    def load_baseline(path: str) -> dict:
+        try:
+            with open(path) as file:
+                return json.load(file)['cases']
+        except FileNotFoundError:
+            return {}
+
+    def report(self, results: dict, baseline: dict) -> None:
+        self.stdout.write(f"{'case':<36} {'ops/s':>11} {'p50 us':>9} {'p95 us':>9} {'p99 us':>9} "
+                          f"{'peak B':>9} {'vs base':>8}")
+        for name, result in results.items():
+            base = baseline.get(name)
+            change = f"{result['p50_us'] / base['p50_us'] - 1:>+8.1%}" if base else f"{'':>8}"
+            self.stdout.write(
+                f"{name:<36} {result['ops']:>11.0f} {result['p50_us']:>9.2f} {result['p95_us']:>9.2f} "
+                f"{result['p99_us']:>9.2f} {result['peak_bytes']:>9} {change}"
+            )
@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.profiler import get_profile_store
+
+
+class Command(BaseCommand):
+    help = "Lists the kept profiles of slow requests, or prints one as collapsed stacks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('profile_id', nargs='?', help="the profile to print, newest first when listed")
+        parser.add_argument('--json', action='store_true', help="print the whole profile or the list as json")
+
+    def handle(self, *args, **options):
+        store = get_profile_store()
+        if options['profile_id'] is None:
+            summaries = store.summaries()
+            if options['json']:
+                self.stdout.write(json.dumps(summaries, indent=2))
+                return
+            for summary in summaries:
+                self.stdout.write(
+                    f"{summary['id']}  {summary['duration_ms']:>10.1f} ms  {summary['status']}  "
+                    f"{summary['samples']:>5} samples  {summary['path']}"
+                )
+            return
+        profile = store.load(options['profile_id'])
+        if profile is None:
+            raise CommandError(f"Profile Not Found: {options['profile_id']}")
+        if options['json']:
+            self.stdout.write(json.dumps(profile, indent=2))
+        else:
+            self.stdout.write(profile['collapsed'], ending='')
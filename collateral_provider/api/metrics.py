@@ -0,0 +1,313 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from api.reasons import reason_of
+from api.store import get_store
+from api.util import internal_request_allowed
+
+logger = logging.getLogger('api')
+
+# upper bounds in seconds, from a hex decode to a slow upstream
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name: (type, help)
+METRICS = {
+    'collateral_requests_in_flight': ('gauge', 'Requests being handled right now.'),
+    'collateral_request_seconds': ('histogram', 'Time to handle a request, by route.'),
+    'collateral_responses_total': ('counter', 'Responses sent, by route and status code.'),
+    'collateral_stage_seconds': ('histogram', 'Time spent in each stage of checking and witnessing a tx.'),
+    'collateral_rejections_total': ('counter', 'Rejected requests, by reason.'),
+}
+
+# distinct reasons kept per worker, anything new past this is 'Other'
+MAX_REASONS = 100
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS metrics ("
+    "worker TEXT PRIMARY KEY, updated REAL NOT NULL, data TEXT NOT NULL)",
+)
+
+# the row dead workers' counters are folded into, so the totals never go down
+RETIRED = 'retired'
+
+
+class Registry:
+    """
+    The metrics of one worker. Counters and histograms only go up, keyed by
+    name and a tuple of (label, value) pairs. Histogram values are the
+    count per bucket, then +Inf, then the sum.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self.reasons = set()
+
+    def inc(self, name: str, labels: tuple = (), amount: float = 1) -> None:
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def add(self, name: str, labels: tuple = (), amount: float = 1) -> None:
+        key = (name, labels)
+        with self._lock:
+            self.gauges[key] = self.gauges.get(key, 0) + amount
+
+    def observe(self, name: str, labels: tuple, seconds: float) -> None:
+        key = (name, labels)
+        index = 0
+        while index < len(BUCKETS) and seconds > BUCKETS[index]:
+            index += 1
+        with self._lock:
+            values = self.histograms.get(key)
+            if values is None:
+                values = self.histograms[key] = [0] * (len(BUCKETS) + 2)
+            values[index] += 1
+            values[-1] += seconds
+
+    def reject(self, message: str) -> None:
+        reason = reason_of(str(message))
+        with self._lock:
+            if reason not in self.reasons:
+                if len(self.reasons) >= MAX_REASONS:
+                    reason = 'Other'
+                else:
+                    self.reasons.add(reason)
+        self.inc('collateral_rejections_total', (('reason', reason),))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, list(labels), list(values)] for (name, labels), values in self.histograms.items()],
+                'gauges': [[name, list(labels), value] for (name, labels), value in self.gauges.items()],
+            }
+
+
+def merge(snapshots: list, gauges: bool = True, into: Registry = None) -> Registry:
+    """
+    Adds up the snapshots of several workers, leaving out the gauges when
+    `gauges` is false.
+    """
+    total = into if into is not None else Registry()
+    for snapshot in snapshots:
+        for name, labels, value in snapshot.get('counters', []):
+            total.inc(name, tuple(map(tuple, labels)), value)
+        for name, labels, values in snapshot.get('histograms', []):
+            key = (name, tuple(map(tuple, labels)))
+            current = total.histograms.setdefault(key, [0] * (len(BUCKETS) + 2))
+            for index, value in enumerate(values):
+                current[index] += value
+        if gauges:
+            for name, labels, value in snapshot.get('gauges', []):
+                total.add(name, tuple(map(tuple, labels)), value)
+    return total
+
+
+def escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def number(value) -> str:
+    # whole counts without an exponent, the format must not round them
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def label_text(labels: tuple, extra: tuple = ()) -> str:
+    pairs = tuple(labels) + extra
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+
+def render(registry: Registry) -> str:
+    """
+    The registry in the Prometheus text format.
+    """
+    lines = []
+    series = {}
+    for (name, labels), value in list(registry.counters.items()) + list(registry.gauges.items()):
+        series.setdefault(name, []).append((labels, value))
+    for (name, labels), values in registry.histograms.items():
+        series.setdefault(name, []).append((labels, values))
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'gauge' and name not in series:
+            lines.append(f'{name} 0')
+        for labels, value in sorted(series.get(name, []), key=lambda item: item[0]):
+            if kind != 'histogram':
+                lines.append(f'{name}{label_text(labels)} {number(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), value[:-1]):
+                cumulative += count
+                lines.append(f'{name}_bucket{label_text(labels, (("le", bound),))} {cumulative}')
+            lines.append(f'{name}_sum{label_text(labels)} {number(value[-1])}')
+            lines.append(f'{name}_count{label_text(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+class Exporter:
+    """
+    Shares the metrics of every worker on the host through the shared
+    store. Each worker writes its snapshot to its own row from a background
+    thread every `interval` seconds, so requests never touch the store. A
+    scrape adds the rows up. Gauges only count workers that wrote recently,
+    and the counters of workers gone for `retire_after` seconds are folded
+    into one row so the totals never go down.
+    """
+
+    def __init__(self, registry: Registry, interval: float, retire_after: float):
+        self.registry = registry
+        self.interval = interval
+        self.retire_after = retire_after
+        self.worker = f"{socket.gethostname()}:{os.getpid()}:{time.time():.0f}"
+        self._thread = None
+        self._lock = threading.Lock()
+        self._failed_at = 0.0
+
+    def _conn(self) -> sqlite3.Connection:
+        store = get_store()
+        store.ensure_schema('metrics', SCHEMA)
+        return store.connection()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='metrics-flush', daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                # once a minute at most, a broken store would fill the log
+                if time.monotonic() - self._failed_at >= 60:
+                    self._failed_at = time.monotonic()
+                    logger.warning("Metrics Flush Failed: %s", e)
+
+    def flush(self) -> None:
+        self._conn().execute(
+            "INSERT OR REPLACE INTO metrics (worker, updated, data) VALUES (?, ?, ?)",
+            (self.worker, time.time(), json.dumps(self.registry.snapshot())),
+        )
+
+    def collect(self) -> Registry:
+        self.flush()
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute("SELECT worker, updated, data FROM metrics").fetchall()
+            retired = [row for row in rows if row[0] != RETIRED and row[1] < now - self.retire_after]
+            if retired:
+                kept = [json.loads(row[2]) for row in rows if row[0] == RETIRED]
+                folded = merge(kept + [json.loads(row[2]) for row in retired], gauges=False)
+                conn.execute(
+                    "INSERT OR REPLACE INTO metrics (worker, updated, data) VALUES (?, ?, ?)",
+                    (RETIRED, now, json.dumps(folded.snapshot())),
+                )
+                conn.executemany("DELETE FROM metrics WHERE worker = ?", [(row[0],) for row in retired])
+                rows = conn.execute("SELECT worker, updated, data FROM metrics").fetchall()
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        # a worker that stopped writing no longer has requests in flight
+        live = now - max(self.interval * 5, 5.0)
+        total = merge([json.loads(data) for worker, updated, data in rows if worker == RETIRED or updated >= live])
+        return merge([json.loads(data) for worker, updated, data in rows if worker != RETIRED and updated < live],
+                     gauges=False, into=total)
+
+
+_registry = Registry()
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def _after_fork():
+    # a worker starts from zero, its parent's numbers are the parent's
+    global _registry, _exporter
+    _registry = Registry()
+    _exporter = None
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def enabled() -> bool:
+    return settings.METRICS['ENABLED']
+
+
+def get_registry() -> Registry:
+    return _registry
+
+
+def get_exporter() -> Exporter:
+    global _exporter
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                _exporter = Exporter(_registry, settings.METRICS['FLUSH_INTERVAL'], settings.METRICS['RETIRE_AFTER'])
+                _exporter.start()
+    return _exporter
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Times a block as one stage of a request.
+    """
+    if not enabled():
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        get_registry().observe('collateral_stage_seconds', (('stage', name),), time.perf_counter() - start)
+
+
+def reject(detail) -> None:
+    """
+    Counts a rejection under each message of a ValidationError detail.
+    """
+    if not enabled():
+        return
+    if isinstance(detail, dict):
+        for value in detail.values():
+            reject(value)
+    elif isinstance(detail, (list, tuple)):
+        for value in detail:
+            reject(value)
+    else:
+        get_registry().reject(detail)
+
+
+def request_started() -> None:
+    get_exporter()
+    get_registry().add('collateral_requests_in_flight')
+
+
+def request_finished(route: str, status_code: int, seconds: float) -> None:
+    registry = get_registry()
+    registry.add('collateral_requests_in_flight', amount=-1)
+    registry.observe('collateral_request_seconds', (('route', route),), seconds)
+    registry.inc('collateral_responses_total', (('route', route), ('status', str(status_code))))
+
+
+def scrape_allowed(request) -> bool:
+    return internal_request_allowed(request, settings.METRICS.get('TOKEN'), settings.METRICS['ALLOWED_IPS'])
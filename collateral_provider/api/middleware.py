@@ -1,38 +1,243 @@
 import logging
+import time
 
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.conf import settings
 from django.core.exceptions import DisallowedHost
 from django.http import HttpResponseBadRequest
 
+from api import capture, metrics
+from api.profiler import RequestProfile, should_profile
+
 logger = logging.getLogger("api")
 
 
 class HandleDisallowedHostMiddleware:
+    # runs natively in both stacks so the async view never hops to a thread here
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        rejected = self.check_host(request)
+        if rejected is not None:
+            return rejected
+
+        # Try to handle the response within the context of the request
+        try:
+            response = self.get_response(request)
+            return response
+        except Exception as e:
+            return self.handle_exception(request, e)
+
+    async def __acall__(self, request):
+        rejected = self.check_host(request)
+        if rejected is not None:
+            return rejected
+        try:
+            return await self.get_response(request)
+        except Exception as e:
+            return self.handle_exception(request, e)
+
+    def check_host(self, request):
         host = request.META.get('HTTP_HOST')
 
         if host:
             host = host.split(':')[0]
             if host not in settings.ALLOWED_HOSTS:
-                logger.warning(f"DisallowedHost: Invalid Host - {host}")
+                logger.warning("DisallowedHost: Invalid Host - %s", host)
                 return HttpResponseBadRequest("Invalid Host Header")
         else:
             # Log a message or handle as appropriate if HTTP_HOST is missing
             logger.warning("DisallowedHost: Missing HTTP_HOST Header")
             return HttpResponseBadRequest("Invalid Host Header")
+        return None
 
-        # Try to handle the response within the context of the request
+    def handle_exception(self, request, e):
+        if isinstance(e, DisallowedHost):
+            # If DisallowedHost is raised, log the warning
+            logger.warning("DisallowedHost: %s - Host: %s", e, request.META.get('HTTP_HOST', 'unknown'))
+            return HttpResponseBadRequest("Invalid Host Header")
+        # Optionally catch any other exceptions
+        logger.error("Unexpected Error: %s", e)
+        return HttpResponseBadRequest("An Error Occurred")
+
+
+class ProfilerMiddleware:
+    """
+    Profiles a sampled fraction of collateral requests, their stacks and
+    their memory, and keeps a dump of the ones over the latency threshold.
+    Does nothing unless settings.PROFILER['ENABLED'] is on. Under ASGI the
+    sampled thread is the event loop, so the stacks of other requests on
+    the loop show up too.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not should_profile(request):
+            return self.get_response(request)
+        profile = RequestProfile(request)
+        profile.start()
+        status_code = 500
         try:
             response = self.get_response(request)
+            status_code = response.status_code
             return response
-        except DisallowedHost as e:
-            # If DisallowedHost is raised, log the warning
-            logger.warning(f"DisallowedHost: {str(e)} - Host: {request.META.get('HTTP_HOST', 'unknown')}")
-            return HttpResponseBadRequest("Invalid Host Header")
-        except Exception as e:
-            # Optionally catch any other exceptions
-            logger.error(f"Unexpected Error: {str(e)}")
-            return HttpResponseBadRequest("An Error Occurred")
+        finally:
+            profile.finish(status_code)
+
+    async def __acall__(self, request):
+        if not should_profile(request):
+            return await self.get_response(request)
+        profile = RequestProfile(request)
+        profile.start()
+        status_code = 500
+        try:
+            response = await self.get_response(request)
+            status_code = response.status_code
+            return response
+        finally:
+            profile.finish(status_code)
+
+
+class CaptureMiddleware:
+    """
+    Appends sampled /collateral/ requests to settings.CAPTURE['PATH'] as
+    JSON lines for stress_test.replay, the tx, its arrival and the outcome
+    with the client ip replaced by a key. Does nothing unless the path is
+    set.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        environment = capture.should_capture(request)
+        if environment is None:
+            return self.get_response(request)
+        captured = capture.Capture(request, environment)
+        response = self.get_response(request)
+        captured.finish(response)
+        return response
+
+    async def __acall__(self, request):
+        environment = capture.should_capture(request)
+        if environment is None:
+            return await self.get_response(request)
+        captured = capture.Capture(request, environment)
+        response = await self.get_response(request)
+        captured.finish(response)
+        return response
+
+
+class TimedStream:
+    """
+    Passes a streamed response through and calls `done` once the server
+    closes it, after the last chunk or when the client went away.
+    """
+
+    def __init__(self, content, done):
+        self.content = content
+        self.done = done
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.content)
+
+    def close(self):
+        if self.done is not None:
+            done, self.done = self.done, None
+            done()
+
+
+class AsyncTimedStream(TimedStream):
+    # only async iteration, or Django would iterate it synchronously
+    __iter__ = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await anext(self.content)
+
+
+class MetricsMiddleware:
+    """
+    Counts the requests in flight and times each request by route. A
+    streamed response is timed until the server closes the stream.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not metrics.enabled():
+            return self.get_response(request)
+        start = time.perf_counter()
+        metrics.request_started()
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            metrics.request_finished(self.route(request), 500, time.perf_counter() - start)
+            raise
+        return self.finish(request, response, start)
+
+    async def __acall__(self, request):
+        if not metrics.enabled():
+            return await self.get_response(request)
+        start = time.perf_counter()
+        metrics.request_started()
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            metrics.request_finished(self.route(request), 500, time.perf_counter() - start)
+            raise
+        return self.finish(request, response, start)
+
+    def finish(self, request, response, start: float):
+        route = self.route(request)
+
+        def done():
+            metrics.request_finished(route, response.status_code, time.perf_counter() - start)
+
+        if not response.streaming:
+            done()
+        elif response.is_async:
+            response.streaming_content = AsyncTimedStream(response.streaming_content, done)
+        else:
+            response.streaming_content = TimedStream(response.streaming_content, done)
+        return response
+
+    @staticmethod
+    def route(request) -> str:
+        # the url name keeps the label set small, unmatched paths share one
+        match = getattr(request, 'resolver_match', None)
+        return match.url_name if match is not None and match.url_name else 'other'
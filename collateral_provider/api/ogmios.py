@@ -0,0 +1,144 @@
+import asyncio
+import itertools
+import json
+import threading
+
+from websockets.asyncio.client import connect
+from websockets.exceptions import WebSocketException
+
+from api.simulate import EvaluationUnavailable
+
+
+class OgmiosClient:
+    """
+    One long-lived websocket to an Ogmios server that multiplexes concurrent
+    JSON-RPC calls, matching each reply to its caller by request id. The
+    socket lives on a private event loop thread and is reopened on demand
+    after it drops.
+    """
+
+    def __init__(self, url: str, connect_timeout: float = 5.0):
+        self.url = url
+        self.connect_timeout = connect_timeout
+        self._ids = itertools.count()
+        # request id -> (socket, future waiting for the reply)
+        self._pending = {}
+        self._ws = None
+        self._connecting = None
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name=f"ogmios {url}", daemon=True)
+        self._thread.start()
+
+    async def _connection(self):
+        if self._ws is not None:
+            return self._ws
+        # the first caller opens the socket, the rest wait on the same attempt
+        if self._connecting is None:
+            self._connecting = self.loop.create_task(self._open())
+        try:
+            return await asyncio.shield(self._connecting)
+        finally:
+            if self._connecting is not None and self._connecting.done():
+                self._connecting = None
+
+    async def _open(self):
+        try:
+            ws = await asyncio.wait_for(connect(self.url, max_size=None), self.connect_timeout)
+        except (OSError, asyncio.TimeoutError, WebSocketException) as e:
+            raise EvaluationUnavailable(f"Ogmios Unreachable At {self.url}: {e!r}") from e
+        self._ws = ws
+        self.loop.create_task(self._read(ws))
+        return ws
+
+    async def _read(self, ws):
+        try:
+            async for message in ws:
+                try:
+                    reply = json.loads(message)
+                    _, future = self._pending.pop(reply.get("id"), (None, None))
+                except (ValueError, AttributeError, TypeError):
+                    continue
+                if future is not None and not future.done():
+                    future.set_result(reply)
+        except WebSocketException:
+            pass
+        finally:
+            if self._ws is ws:
+                self._ws = None
+            # fail whatever was in flight on this socket, callers may retry
+            for request_id, (owner, future) in list(self._pending.items()):
+                if owner is ws:
+                    self._pending.pop(request_id, None)
+                    if not future.done():
+                        future.set_exception(EvaluationUnavailable("Ogmios Connection Closed"))
+                        # its caller may have failed on the send already, don't warn if nobody waits
+                        future.exception()
+
+    async def request(self, method: str, params: dict, timeout: float) -> dict:
+        """
+        Sends one JSON-RPC call and waits for its reply. Must run on `self.loop`.
+        """
+        for attempt in range(2):
+            # raises EvaluationUnavailable when the server can't be reached
+            ws = await self._connection()
+            request_id = next(self._ids)
+            future = self.loop.create_future()
+            self._pending[request_id] = (ws, future)
+            try:
+                await ws.send(json.dumps({"jsonrpc": "2.0", "method": method, "params": params, "id": request_id}))
+                return await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError as e:
+                raise EvaluationUnavailable(f"Ogmios Timed Out After {timeout}s") from e
+            except (WebSocketException, EvaluationUnavailable):
+                # the socket dropped under us, reconnect once since evaluation is idempotent
+                if self._ws is ws:
+                    self._ws = None
+                if attempt:
+                    raise EvaluationUnavailable("Ogmios Connection Closed")
+            finally:
+                self._pending.pop(request_id, None)
+
+    async def evaluate_async(self, tx_body_cbor_hex: str, timeout: float) -> dict:
+        """Evaluates a transaction from any event loop."""
+        future = asyncio.run_coroutine_threadsafe(self._evaluate(tx_body_cbor_hex, timeout), self.loop)
+        return await asyncio.wrap_future(future)
+
+    def evaluate(self, tx_body_cbor_hex: str, timeout: float) -> dict:
+        """Evaluates a transaction from a synchronous worker thread."""
+        future = asyncio.run_coroutine_threadsafe(self._evaluate(tx_body_cbor_hex, timeout), self.loop)
+        return future.result()
+
+    def _evaluate(self, tx_body_cbor_hex: str, timeout: float):
+        return self.request("evaluateTransaction", {"transaction": {"cbor": tx_body_cbor_hex}}, timeout)
+
+    def close(self) -> None:
+        async def _close():
+            if self._ws is not None:
+                await self._ws.close()
+        asyncio.run_coroutine_threadsafe(_close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+# one websocket per ogmios url for the life of the worker
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(url: str, connect_timeout: float = 5.0) -> OgmiosClient:
+    client = _clients.get(url)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(url)
+            if client is None:
+                client = OgmiosClient(url, connect_timeout)
+                _clients[url] = client
+    return client
+
+
+def close_clients() -> None:
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
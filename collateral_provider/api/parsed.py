@@ -0,0 +1,85 @@
+import hashlib
+from collections.abc import Mapping
+from functools import cached_property
+
+import cbor2
+
+from api.scanner import CBORScanError, _read_head, tx_body_span
+
+
+class TransactionView(Mapping):
+    """
+    The transaction body map, decoded one field at a time. The map is
+    indexed by key from the raw bytes and a value is only decoded with
+    cbor2 the first time it is read, so outputs, scripts and datums the
+    validators never look at are never built. A field reads back exactly
+    as it would from a full decode, sets and tuples included.
+    """
+
+    def __init__(self, tx_bytes: bytes, entries: list):
+        """
+        Args:
+            tx_bytes (bytes): The transaction CBOR.
+            entries (list): The body map entries from scan_tx or map_item_spans.
+        """
+        self._data = memoryview(tx_bytes)
+        self._offsets = {}
+        for (key_start, key_end), value_span in entries:
+            major, _, arg, head_end = _read_head(self._data, key_start)
+            # body keys are uints in every era, an array or map key can't even be held in a dict
+            if major != 0 or head_end != key_end:
+                raise CBORScanError("body key is not a uint")
+            # a repeated key keeps the last value, like a full decode
+            self._offsets[arg] = value_span
+        self._fields = {}
+
+    def __getitem__(self, key):
+        try:
+            return self._fields[key]
+        except KeyError:
+            pass
+        start, end = self._offsets[key]
+        value = cbor2.loads(self._data[start:end])
+        self._fields[key] = value
+        return value
+
+    def __iter__(self):
+        return iter(self._offsets)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+
+class ParsedTransaction:
+    """
+    A request-scoped transaction that is hex-decoded and CBOR-decoded once,
+    then shared by the validators, the evaluator and the signer.
+    """
+
+    def __init__(self, cbor_hex: str, tx_bytes: bytes, body, body_span: tuple = None):
+        # the hex as submitted, used by the evaluator
+        self.cbor_hex = cbor_hex
+        # the raw transaction bytes
+        self.tx_bytes = tx_bytes
+        # the transaction body, a TransactionView when it came through check_tx
+        self.body = body
+        # a witness reused from the verdict cache, if any
+        self.witness = None
+        # the pre-scan already located the body
+        if body_span is not None:
+            self.body_span = body_span
+
+    @cached_property
+    def body_span(self) -> tuple:
+        """The (start, end) offsets of the body inside the raw bytes."""
+        return tx_body_span(self.tx_bytes)
+
+    @cached_property
+    def tx_hash(self) -> bytes:
+        """The Blake2b-256 hash of the original body bytes."""
+        start, end = self.body_span
+        return hashlib.blake2b(memoryview(self.tx_bytes)[start:end], digest_size=32).digest()
+
+    @property
+    def tx_id(self) -> str:
+        return self.tx_hash.hex()
@@ -0,0 +1,167 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from api.metrics import stage
+from api.parsed import ParsedTransaction
+from api.signature import witness_tx
+from api.singleflight import coalesce, coalesce_async
+from api.validators.cbor import CborValidator
+from api.validators.environment import EnvironmentValidator
+from api.validators.plan import get_plan
+from api.validators.transaction import TransactionValidator
+from api.verdicts import get_verdict_cache, remember_witness
+
+
+@functools.lru_cache(maxsize=8)
+def validators_for(logger):
+    # validators only hold their logger, so one pair serves every request
+    return EnvironmentValidator(logger), CborValidator(logger)
+
+
+def check_tx(tx_body_cbor, environment, env_settings, ip_address, networks, logger):
+    """
+    Runs every local check on a submitted tx, everything but the evaluation.
+
+    Args:
+        tx_body_cbor (str): The transaction CBOR from the API.
+        environment (str): The requested network.
+        env_settings (dict): The settings of that network.
+        ip_address (str): The client IP address.
+        networks (list): The configured networks.
+        logger (Logger): Where rejections are logged.
+
+    Returns:
+        ParsedTransaction: The decoded transaction.
+    """
+    env_validator, cbor_validator = validators_for(logger)
+    with stage('environment'):
+        env_validator.check_ip_address(ip_address)
+        env_validator.check_environment(environment, networks)
+
+    with stage('hex_decode'):
+        tx_bytes = cbor_validator.check_cbor_hex(tx_body_cbor)
+    with stage('cbor_decode'):
+        scan = cbor_validator.check_tx_shape(tx_bytes)
+        body = cbor_validator.check_tx_body(tx_bytes, scan)
+    with stage('validators'):
+        cbor_validator.check_body(body, get_plan(environment, env_settings))
+
+    # decode once, the evaluator and the signer use this same object
+    return ParsedTransaction(tx_body_cbor, tx_bytes, body, body_span=scan.spans[0])
+
+
+def evaluate(environment, tx, logger):
+    """
+    Evaluates a checked tx once for all identical requests in flight.
+
+    Concurrent requests for the same tx share one evaluation, in this
+    process directly and across workers through the verdict cache.
+
+    Args:
+        environment (str): The requested network.
+        tx (ParsedTransaction): The checked transaction.
+        logger (Logger): Where rejections are logged.
+
+    Returns:
+        Verdict: The passing verdict, a failing one raises a ValidationError.
+    """
+    tx_validator = TransactionValidator(logger)
+    cache = get_verdict_cache()
+    lookup = None
+    with stage('evaluate'):
+        if cache is not None:
+            def lookup():
+                return cache.get(environment, tx.tx_hash)
+            verdict = lookup()
+        else:
+            verdict = None
+        if verdict is None:
+            verdict = coalesce(
+                f"verdict:{environment}:{tx.tx_hash.hex()}",
+                lambda: tx_validator.check_valid_tx(tx.cbor_hex, environment, tx.tx_hash),
+                lookup,
+            )
+    # a failure published by another worker still has to be rejected here
+    tx_validator.check_verdict(verdict)
+    tx.witness = verdict.witness
+    return verdict
+
+
+async def evaluate_async(environment, tx, logger):
+    """
+    The event loop version of evaluate.
+    """
+    tx_validator = TransactionValidator(logger)
+    cache = get_verdict_cache()
+    lookup = None
+    with stage('evaluate'):
+        if cache is not None:
+            async def lookup():
+                return await asyncio.to_thread(cache.get, environment, tx.tx_hash)
+            verdict = await lookup()
+        else:
+            verdict = None
+        if verdict is None:
+            verdict = await coalesce_async(
+                f"verdict:{environment}:{tx.tx_hash.hex()}",
+                lambda: tx_validator.check_valid_tx_async(tx.cbor_hex, environment, tx.tx_hash),
+                lookup,
+            )
+    tx_validator.check_verdict(verdict)
+    tx.witness = verdict.witness
+    return verdict
+
+
+def witness_for(environment, tx):
+    """
+    Witnesses a validated tx and caches the witness for retries.
+
+    Args:
+        environment (str): The requested network.
+        tx (ParsedTransaction): The validated transaction.
+
+    Returns:
+        witness_cbor (str): The CBOR of a valid witness
+    """
+    def sign():
+        witness_cbor = witness_tx(tx, settings.SKEY_PATH, settings.VKEY_PATH)
+        remember_witness(environment, tx, witness_cbor)
+        return witness_cbor
+
+    # signing is cheaper than a lease in the shared store, other workers
+    # pick the witness up from the verdict cache instead
+    with stage('sign'):
+        return coalesce(f"witness:{environment}:{tx.tx_hash.hex()}", sign, None)
+
+
+def collateral_for(tx_body_cbor, environment, env_settings, ip_address, networks, logger):
+    """
+    Takes one submitted tx through every check, the evaluation and the signing.
+
+    Returns:
+        witness_cbor (str): The CBOR of a valid witness
+    """
+    tx = check_tx(tx_body_cbor, environment, env_settings, ip_address, networks, logger)
+    evaluate(environment, tx, logger)
+    return witness_for(environment, tx)
+
+
+# one pool per worker bounds the batch evaluations in flight
+_batch_pool = None
+_batch_pool_lock = threading.Lock()
+
+
+def get_batch_pool() -> ThreadPoolExecutor:
+    global _batch_pool
+    if _batch_pool is None:
+        with _batch_pool_lock:
+            if _batch_pool is None:
+                _batch_pool = ThreadPoolExecutor(
+                    max_workers=settings.BATCH['WORKERS'],
+                    thread_name_prefix='collateral-batch',
+                )
+    return _batch_pool
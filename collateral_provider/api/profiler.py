@@ -0,0 +1,224 @@
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from django.conf import settings
+
+logger = logging.getLogger('api')
+
+# the requests worth profiling, the batch endpoint streams its work after
+# the middleware has returned, so only the single endpoint
+PROFILED_PATH = re.compile(r'^/[^/]+/collateral/?$')
+
+# dump ids are file names, nothing else is read back
+PROFILE_ID = re.compile(r'^[0-9]+-[0-9]+-[0-9]+$')
+
+
+class StackSampler:
+    """
+    Samples the stack of one thread from a background thread every
+    `interval` seconds and counts each distinct stack. The counts are the
+    collapsed stack format that flamegraph.pl and speedscope read. The
+    profiled thread runs untouched, so the cost is the sampler's.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_qualname}")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+# tracemalloc is process wide, one sampled request at a time traces its
+# memory, another would reset its peak halfway through
+_tracing_lock = threading.Lock()
+_started_tracing = False
+
+
+def start_tracing():
+    """
+    The traced memory before the request, or None when another request in
+    this process is already tracing.
+    """
+    global _started_tracing
+    if not _tracing_lock.acquire(blocking=False):
+        return None
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _started_tracing = True
+    tracemalloc.reset_peak()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def stop_tracing(before: int, top: int) -> dict:
+    """
+    The memory allocated while the request ran, and when `top` is set the
+    lines that allocated most of what is still held. Allocations of the
+    other threads in the same window are counted too.
+    """
+    global _started_tracing
+    try:
+        current, peak = tracemalloc.get_traced_memory()
+        memory = {'allocated': current - before, 'peak': peak - before}
+        if top:
+            snapshot = tracemalloc.take_snapshot()
+            memory['top'] = [
+                {'line': str(stat.traceback[0]), 'size': stat.size, 'count': stat.count}
+                for stat in snapshot.statistics('lineno')[:top]
+            ]
+        return memory
+    finally:
+        if _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+        _tracing_lock.release()
+
+
+class ProfileStore:
+    """
+    The dumps of slow requests, one JSON file each in a directory, keeping
+    only the newest `keep`.
+    """
+
+    def __init__(self, directory: str, keep: int):
+        self.directory = directory
+        self.keep = keep
+
+    def ids(self) -> list:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        ids = [name[:-5] for name in names if name.endswith('.json') and PROFILE_ID.match(name[:-5])]
+        # newest first, the id starts with the time in microseconds
+        return sorted(ids, key=lambda profile_id: int(profile_id.split('-')[0]), reverse=True)
+
+    def path(self, profile_id: str) -> str:
+        return os.path.join(self.directory, f"{profile_id}.json")
+
+    def save(self, profile: dict) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = f"{int(profile['started'] * 1e6)}-{os.getpid()}-{threading.get_ident() % 100000}"
+        tmp = self.path(profile_id) + '.tmp'
+        with open(tmp, 'w') as file:
+            json.dump(profile, file)
+        os.replace(tmp, self.path(profile_id))
+        for old in self.ids()[self.keep:]:
+            try:
+                os.remove(self.path(old))
+            except FileNotFoundError:
+                # another worker pruned it first
+                pass
+        return profile_id
+
+    def load(self, profile_id: str) -> dict:
+        if not PROFILE_ID.match(profile_id):
+            return None
+        try:
+            with open(self.path(profile_id)) as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def summaries(self) -> list:
+        summaries = []
+        for profile_id in self.ids():
+            profile = self.load(profile_id)
+            if profile is not None:
+                summaries.append({
+                    'id': profile_id,
+                    'path': profile['path'],
+                    'status': profile['status'],
+                    'duration_ms': profile['duration_ms'],
+                    'started': profile['started'],
+                    'samples': profile['samples'],
+                })
+        return summaries
+
+
+def get_profile_store() -> ProfileStore:
+    return ProfileStore(settings.PROFILER['DIR'], settings.PROFILER['KEEP'])
+
+
+class RequestProfile:
+    """
+    Profiles one request on the current thread, its stacks and its memory,
+    and saves a dump when it took longer than the threshold.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.options = settings.PROFILER
+        self.sampler = StackSampler(threading.get_ident(), self.options['INTERVAL_MS'] / 1000)
+        self.memory_before = None
+
+    def start(self):
+        self.started = time.time()
+        self.start_time = time.perf_counter()
+        if self.options['MEMORY']:
+            self.memory_before = start_tracing()
+        self.sampler.start()
+
+    def finish(self, status_code: int):
+        self.sampler.stop()
+        duration_ms = (time.perf_counter() - self.start_time) * 1000
+        slow = duration_ms >= self.options['THRESHOLD_MS']
+        memory = None
+        if self.memory_before is not None:
+            # the top lines need a snapshot, only slow requests pay for it
+            memory = stop_tracing(self.memory_before, self.options['TOP_ALLOCATIONS'] if slow else 0)
+        if not slow:
+            return None
+        profile = {
+            'path': self.request.path,
+            'method': self.request.method,
+            'status': status_code,
+            'started': self.started,
+            'duration_ms': round(duration_ms, 3),
+            'interval_ms': self.options['INTERVAL_MS'],
+            'samples': sum(self.sampler.stacks.values()),
+            'collapsed': self.sampler.collapsed(),
+            'memory': memory,
+        }
+        try:
+            return get_profile_store().save(profile)
+        except OSError as e:
+            logger.warning("Saving Profile Failed: %s", e)
+            return None
+
+
+def should_profile(request) -> bool:
+    options = settings.PROFILER
+    if not options['ENABLED'] or not PROFILED_PATH.match(request.path):
+        return False
+    return random.random() < options['SAMPLE_RATE']
@@ -0,0 +1,46 @@
+import re
+
+import orjson
+
+# messages that carry the request's own values are counted under one reason
+REASONS = (
+    (re.compile(r'^The IP: .* Is Banned$'), 'The IP Is Banned'),
+    (re.compile(r'^The Address: .* Is Banned$'), 'The Address Is Banned'),
+    (re.compile(r'^Invalid Environment'), 'Invalid Environment'),
+    (re.compile(r'^Batch Exceeds \d+ Transactions$'), 'Batch Exceeds Max Transactions'),
+    (re.compile(r'^JSON parse error'), 'JSON Parse Error'),
+    (re.compile(r'^Unsupported media type'), 'Unsupported Media Type'),
+    (re.compile(r'^Request was throttled'), 'Throttled'),
+)
+
+
+def reason_of(message: str) -> str:
+    for pattern, reason in REASONS:
+        if pattern.match(message):
+            return reason
+    return message
+
+
+def first_message(data):
+    if isinstance(data, str):
+        return data
+    values = data.values() if isinstance(data, dict) else data if isinstance(data, list) else ()
+    for value in values:
+        message = first_message(value)
+        if message is not None:
+            return message
+    return None
+
+
+def outcome_of(status_code: int, content: bytes) -> str:
+    """
+    What a /collateral/ response came down to, 'witness' or the reason it
+    was rejected, without the client's own values.
+    """
+    if status_code == 200:
+        return 'witness'
+    try:
+        message = first_message(orjson.loads(content))
+    except orjson.JSONDecodeError:
+        message = None
+    return reason_of(message) if message is not None else f'HTTP {status_code}'
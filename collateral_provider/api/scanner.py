@@ -0,0 +1,283 @@
+"""
+A span-tracking CBOR scanner.
+
+It walks the raw bytes of a CBOR item without building any Python objects,
+so callers can locate the exact byte range of an element and work with the
+original encoding, e.g. hashing the transaction body as the wallet built it.
+"""
+
+
+from collections import namedtuple
+
+# the outer major type, the spans of the tx elements and the body map entries
+TxScan = namedtuple('TxScan', ['major', 'spans', 'body_entries'])
+
+
+class CBORScanError(ValueError):
+    pass
+
+
+class CBORBudgetError(CBORScanError):
+    """The item is well formed so far but nests too deep or holds too many items."""
+    pass
+
+
+def _read_head(data, pos: int) -> tuple:
+    """
+    Reads the initial byte and argument of a CBOR data item.
+
+    Args:
+        data (bytes | memoryview): The CBOR bytes.
+        pos (int): The offset of the item head.
+
+    Returns:
+        tuple: (major type, additional info, argument, offset after the head).
+        The argument is None for indefinite lengths.
+    """
+    try:
+        initial = data[pos]
+    except IndexError:
+        raise CBORScanError("Truncated CBOR") from None
+    major = initial >> 5
+    info = initial & 0x1F
+    pos += 1
+    if info < 24:
+        return major, info, info, pos
+    if info <= 27:
+        size = 1 << (info - 24)
+        if pos + size > len(data):
+            raise CBORScanError("Truncated CBOR")
+        return major, info, int.from_bytes(data[pos:pos + size], "big"), pos + size
+    if info == 31 and major in (2, 3, 4, 5, 7):
+        return major, info, None, pos
+    raise CBORScanError("Reserved CBOR Additional Info")
+
+
+def item_end(data, pos: int = 0) -> int:
+    """
+    Finds where the CBOR item starting at `pos` ends.
+
+    Args:
+        data (bytes | memoryview): The CBOR bytes.
+        pos (int): The offset of the item.
+
+    Returns:
+        int: The offset just past the item.
+    """
+    return _walk(data, pos)[0]
+
+
+def _walk(data, pos: int, max_depth: int = None, max_items: int = None) -> tuple:
+    """
+    Walks one CBOR item, optionally within a nesting and an item budget.
+
+    The head decoding of _read_head is inlined here, this loop runs once
+    per data item of every submitted transaction.
+
+    Returns:
+        tuple: The offset just past the item and the number of items in it.
+    """
+    size = len(data)
+    # a budget can't be hit by more items than there are bytes
+    depth_limit = size if max_depth is None else max_depth
+    item_limit = size if max_items is None else max_items
+    # items left to read in each open container, None when indefinite
+    stack = []
+    items = 0
+    while True:
+        if pos >= size:
+            raise CBORScanError("Truncated CBOR")
+        initial = data[pos]
+        pos += 1
+        items += 1
+        if items > item_limit:
+            raise CBORBudgetError("Too Many CBOR Items")
+        major = initial >> 5
+        info = initial & 0x1F
+        if info < 24:
+            arg = info
+        elif info <= 27:
+            width = 1 << (info - 24)
+            if pos + width > size:
+                raise CBORScanError("Truncated CBOR")
+            arg = int.from_bytes(data[pos:pos + width], "big")
+            pos += width
+        elif info == 31 and major in (2, 3, 4, 5, 7):
+            arg = None
+        else:
+            raise CBORScanError("Reserved CBOR Additional Info")
+
+        if major in (2, 3):
+            if arg is None:
+                # indefinite strings are a run of definite chunks of the same type
+                while True:
+                    chunk_major, chunk_info, chunk_len, pos = _read_head(data, pos)
+                    if chunk_major == 7 and chunk_info == 31:
+                        break
+                    if chunk_major != major or chunk_len is None:
+                        raise CBORScanError("Invalid Indefinite String Chunk")
+                    pos += chunk_len
+            else:
+                pos += arg
+            if pos > size:
+                raise CBORScanError("Truncated CBOR")
+        elif 4 <= major <= 6:
+            if major == 6:
+                # a tag wraps exactly one item
+                count = 1
+            elif arg is None:
+                count = None
+            else:
+                count = arg * 2 if major == 5 else arg
+            if count != 0:
+                if len(stack) >= depth_limit:
+                    raise CBORBudgetError("CBOR Nested Too Deep")
+                stack.append(count)
+                continue
+        elif major == 7 and arg is None:
+            # a break closes the innermost indefinite container
+            if not stack or stack[-1] is not None:
+                raise CBORScanError("Unexpected CBOR Break")
+            stack.pop()
+
+        # one item is finished, close every container it completes
+        while stack:
+            remaining = stack[-1]
+            if remaining is None:
+                # inside an indefinite container, only a break can close it
+                break
+            if remaining > 1:
+                stack[-1] = remaining - 1
+                break
+            stack.pop()
+        else:
+            return pos, items
+
+
+def array_item_span(data, index: int) -> tuple:
+    """
+    Locates the byte range of one element of a top-level CBOR array.
+
+    Args:
+        data (bytes | memoryview): The CBOR bytes of an array.
+        index (int): The element to locate.
+
+    Returns:
+        tuple: (start, end) offsets of the element.
+    """
+    major, _, count, pos = _read_head(data, 0)
+    if major != 4:
+        raise CBORScanError("CBOR Is Not An Array")
+    current = 0
+    while count is None or current < count:
+        if count is None and pos < len(data) and data[pos] == 0xFF:
+            break
+        end = item_end(data, pos)
+        if current == index:
+            return pos, end
+        pos = end
+        current += 1
+    raise CBORScanError("CBOR Array Index Out Of Range")
+
+
+def map_item_spans(data, pos: int = 0) -> list:
+    """
+    Locates the keys and values of a CBOR map.
+
+    Args:
+        data (bytes | memoryview): The CBOR bytes.
+        pos (int): The offset of the map.
+
+    Returns:
+        list: ((key start, key end), (value start, value end)) per entry.
+    """
+    major, _, count, pos = _read_head(data, pos)
+    if major != 5:
+        raise CBORScanError("CBOR Is Not A Map")
+    spans = []
+    while count is None or len(spans) < count:
+        if count is None and pos < len(data) and data[pos] == 0xFF:
+            break
+        key_end = item_end(data, pos)
+        value_end = item_end(data, key_end)
+        spans.append(((pos, key_end), (key_end, value_end)))
+        pos = value_end
+    return spans
+
+
+def tx_body_span(tx_bytes) -> tuple:
+    """
+    Locates the transaction body, element 0 of the transaction array.
+
+    Args:
+        tx_bytes (bytes | memoryview): The transaction CBOR.
+
+    Returns:
+        tuple: (start, end) offsets of the body.
+    """
+    return array_item_span(tx_bytes, 0)
+
+
+def _walk_map(data, pos: int, max_depth: int, max_items: int) -> tuple:
+    """
+    Walks a definite or indefinite map like _walk while recording its entries.
+
+    Returns:
+        tuple: The offset past the map, the items in it and the entry spans
+        as returned by map_item_spans.
+    """
+    if max_depth < 1:
+        raise CBORBudgetError("CBOR Nested Too Deep")
+    _, _, count, pos = _read_head(data, pos)
+    items = 1
+    entries = []
+    while count is None or len(entries) < count:
+        if count is None and pos < len(data) and data[pos] == 0xFF:
+            pos += 1
+            break
+        key_end, used = _walk(data, pos, max_depth - 1, max_items - items)
+        items += used
+        value_end, used = _walk(data, key_end, max_depth - 1, max_items - items)
+        items += used
+        entries.append(((pos, key_end), (key_end, value_end)))
+        pos = value_end
+    if items > max_items:
+        raise CBORBudgetError("Too Many CBOR Items")
+    return pos, items, entries
+
+
+def scan_tx(tx_bytes, max_depth: int, max_items: int) -> TxScan:
+    """
+    Walks a whole transaction within budgets without building any objects,
+    so malformed and adversarial input is rejected before any decode. The
+    body map entries are indexed on the way so the body is walked once.
+
+    Args:
+        tx_bytes (bytes | memoryview): The transaction CBOR.
+        max_depth (int): The deepest nesting allowed, the outer array is depth 1.
+        max_items (int): The most data items allowed in the whole transaction.
+
+    Returns:
+        TxScan: The major type of the outer item, the (start, end) offsets of
+        its elements when it is an array, and the body map entries when the
+        first element is a map.
+    """
+    major, _, count, pos = _read_head(tx_bytes, 0)
+    if major != 4:
+        _walk(tx_bytes, 0, max_depth, max_items)
+        return TxScan(major, [], None)
+    size = len(tx_bytes)
+    spans = []
+    body_entries = None
+    items = 1
+    while count is None or len(spans) < count:
+        if count is None and pos < size and tx_bytes[pos] == 0xFF:
+            break
+        if not spans and pos < size and tx_bytes[pos] >> 5 == 5:
+            end, used, body_entries = _walk_map(tx_bytes, pos, max_depth - 1, max_items - items)
+        else:
+            end, used = _walk(tx_bytes, pos, max_depth - 1, max_items - items)
+        spans.append((pos, end))
+        pos = end
+        items += used
+    return TxScan(major, spans, body_entries)
@@ -3,9 +3,9 @@ import logging
 from django.conf import settings
 from rest_framework import serializers
 
-from .validators.cbor import CborValidator
+from .pipeline import check_tx, evaluate
+from .util import log_and_raise_error
 from .validators.environment import EnvironmentValidator
-from .validators.transaction import TransactionValidator
 
 # Initialize the logger
 logger = logging.getLogger('api')
@@ -25,23 +25,39 @@ class ProvideCollateralSerializer(serializers.Serializer):
         ip_address = self.context.get('ip_address')
         networks = self.context.get('networks')
 
-        logger.debug(f"Validating Tx Body From {ip_address}")
+        logger.debug("Validating Tx Body From %s", ip_address, extra={'ip': ip_address})
 
-        env_validator = EnvironmentValidator(logger)
-        env_validator.check_ip_address(ip_address)
-        env_validator.check_environment(environment, networks)
-
-        cbor_validator = CborValidator(logger)
-        tx_bytes = cbor_validator.check_cbor_hex(tx_body_cbor)
-        body = cbor_validator.check_tx_body(tx_bytes)
-        cbor_validator.check_inputs(body, env_settings)
-        cbor_validator.check_outputs(body)
-        cbor_validator.check_collateral(body, env_settings)
-        cbor_validator.check_signers(body, settings.PKH)
+        tx = check_tx(tx_body_cbor, environment, env_settings, ip_address, networks, logger)
 
-        tx_validator = TransactionValidator(logger)
-        tx_validator.check_valid_tx(tx_body_cbor, environment)
+        evaluate(environment, tx, logger)
 
         # At this point collateral is not being spent, it's in the collateral inputs,
         # the pkh is being used to sign the tx, and the tx is valid.
+        self._tx = tx
         return tx_body_cbor
+
+    def validate(self, attrs):
+        # hand the parsed transaction to the view through validated_data
+        attrs['tx'] = self._tx
+        return attrs
+
+
+class BatchCollateralSerializer(serializers.Serializer):
+
+    tx_bodies = serializers.ListField(
+        child=serializers.CharField(allow_blank=False, trim_whitespace=True),
+        allow_empty=False
+    )
+
+    def validate_tx_bodies(self, tx_bodies):
+        max_size = settings.BATCH['MAX_SIZE']
+        if len(tx_bodies) > max_size:
+            log_and_raise_error(logger, f"Batch Exceeds {max_size} Transactions")
+
+        # a banned ip or a bad environment fails the whole batch up front
+        env_validator = EnvironmentValidator(logger)
+        env_validator.check_ip_address(self.context.get('ip_address'))
+        env_validator.check_environment(self.context.get('environment'), self.context.get('networks'))
+
+        # each tx is checked on its own so one bad tx only fails its own line
+        return tx_bodies
@@ -1,13 +1,20 @@
 import json
+import os
+import signal
+import threading
+import time
 import hashlib
 import binascii
 import cbor2
 from nacl.signing import SigningKey, VerifyKey
 from nacl.exceptions import BadSignatureError
 from nacl.encoding import RawEncoder
-from pycardano.serialization import (
-    OrderedSet,
-)
+
+from api.scanner import tx_body_span
+
+# how often, in seconds, the resident signer stats the key files for changes
+KEY_CHECK_INTERVAL = 1.0
+
 
 def get_key_from_file(file_path: str) -> str:
     """
@@ -73,6 +80,21 @@ def verify(vkey: str, signature: str, msg: str) -> bool:
         return False
 
 
+def body_hash(tx_bytes: bytes) -> bytes:
+    """
+    Performs the Blake2b-256 hash on the original bytes of a tx body.
+
+    Args:
+        tx_bytes (bytes): The transaction CBOR in byte form.
+
+    Returns:
+        bytes: The transaction hash.
+    """
+    start, end = tx_body_span(tx_bytes)
+    # hash the body exactly as the wallet encoded it, no copy of the slice
+    return hashlib.blake2b(memoryview(tx_bytes)[start:end], digest_size=32).digest()
+
+
 def tx_id(tx_cbor: str) -> str:
     """
     Performs the Blake2b-256 hash on a tx body.
@@ -83,40 +105,7 @@ def tx_id(tx_cbor: str) -> str:
     Returns:
         tx_hash (str): The transaction hash in hexadecimal format.
     """
-    tx_bytes = bytes.fromhex(tx_cbor)
-    tx = cbor2.loads(tx_bytes)
-    tx_body = tx[0]
-
-    # we need to reorder the things that are sets
-
-    # inputs
-    tx_body[0] = OrderedSet(sorted(tx_body[0]), use_tag=True).to_primitive()
-    # this may not exist
-    try:
-        # certificates
-        tx_body[4] = OrderedSet(sorted(tx_body[4]), use_tag=True).to_primitive()
-    except KeyError:
-        pass
-    # collateral inputs
-    tx_body[13] = OrderedSet(sorted(tx_body[13]), use_tag=True).to_primitive()
-    # required signers
-    tx_body[14] = OrderedSet(sorted(tx_body[14]), use_tag=True).to_primitive()
-    # this may not exist
-    try:
-        # reference inputs
-        tx_body[18] = OrderedSet(sorted(tx_body[18]), use_tag=True).to_primitive()
-    except KeyError:
-        pass
-    # this may not exist
-    try:
-        # proposal_procedures
-        tx_body[20] = OrderedSet(sorted(tx_body[20]), use_tag=True).to_primitive()
-    except KeyError:
-        pass
-
-    # all the sets are taken place so now we can dump it and hash it
-    tx_body_cbor = cbor2.dumps(tx_body).hex()
-    return hashlib.blake2b(binascii.unhexlify(tx_body_cbor), digest_size=32).hexdigest()
+    return body_hash(bytes.fromhex(tx_cbor)).hex()
 
 
 def create_witness_cbor(public_key: str, signature: str) -> str:
@@ -134,6 +123,125 @@ def create_witness_cbor(public_key: str, signature: str) -> str:
         [0, [binascii.unhexlify(public_key), binascii.unhexlify(signature)]]
     ).hex()
 
+class Signer:
+    """
+    A process-resident signer that holds the expanded signing key and the
+    constant CBOR prefix of the vkey witness, reloading the key files only
+    when they change on disk or a reload is requested.
+    """
+
+    def __init__(self, skey_path: str, vkey_path: str):
+        self.skey_path = skey_path
+        self.vkey_path = vkey_path
+        self._lock = threading.Lock()
+        self._stale = False
+        self._checked_at = 0.0
+        # (signing key, witness prefix, key file mtimes) swapped as one
+        self._state = None
+        self.load()
+
+    def _mtimes(self) -> tuple:
+        return (os.stat(self.skey_path).st_mtime_ns, os.stat(self.vkey_path).st_mtime_ns)
+
+    def load(self) -> None:
+        """
+        Reads both key files, expands the signing key, and precomputes the
+        witness prefix `[0, [vkey, <sig>]]` up to the signature bytes.
+        """
+        with self._lock:
+            mtimes = self._mtimes()
+            signing_key = SigningKey(bytes.fromhex(get_key_from_file(self.skey_path)))
+            public_key = bytes.fromhex(get_key_from_file(self.vkey_path))
+            if len(public_key) != 32:
+                raise ValueError(f"Invalid Verification Key Length In {self.vkey_path}")
+            # array(2), uint(0), array(2), bytes(32) vkey, bytes(64) header
+            prefix = b"\x82\x00\x82\x58\x20" + public_key + b"\x58\x40"
+            self._state = (signing_key, prefix, mtimes)
+            self._stale = False
+            self._checked_at = time.monotonic()
+
+    def mark_stale(self) -> None:
+        """Forces a reload of the key files on the next use."""
+        self._stale = True
+
+    def refresh(self) -> None:
+        """Reloads the keys if they were marked stale or changed on disk."""
+        if self._stale:
+            self.load()
+            return
+        now = time.monotonic()
+        if now - self._checked_at < KEY_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        if self._mtimes() != self._state[2]:
+            self.load()
+
+    @property
+    def public_key(self) -> bytes:
+        return self._state[1][5:37]
+
+    def witness(self, tx_hash: bytes) -> str:
+        """
+        Signs a transaction hash and returns the vkey witness CBOR.
+
+        Args:
+            tx_hash (bytes): The Blake2b-256 hash of the transaction body.
+
+        Returns:
+            witness_cbor (str): The CBOR of a valid witness
+        """
+        self.refresh()
+        signing_key, prefix, _ = self._state
+        sig = signing_key.sign(tx_hash, encoder=RawEncoder).signature
+        return (prefix + sig).hex()
+
+
+# one resident signer per key pair for the life of the process
+_signers = {}
+_signers_lock = threading.Lock()
+
+
+def get_signer(skey_path: str, vkey_path: str) -> Signer:
+    """
+    Returns the resident signer for a key pair, creating it on first use.
+
+    Args:
+        skey_path (str): The secret key path.
+        vkey_path (str): The verification key path.
+
+    Returns:
+        Signer: The process-resident signer.
+    """
+    key = (skey_path, vkey_path)
+    signer = _signers.get(key)
+    if signer is None:
+        with _signers_lock:
+            signer = _signers.get(key)
+            if signer is None:
+                signer = Signer(skey_path, vkey_path)
+                _signers[key] = signer
+    return signer
+
+
+def reload_signers(*args) -> None:
+    """Marks every resident signer stale, usable as a SIGHUP handler."""
+    for signer in list(_signers.values()):
+        signer.mark_stale()
+
+
+def install_reload_signal() -> None:
+    """
+    Reloads the keys on SIGHUP when nothing else owns that signal. Gunicorn
+    resets SIGHUP to the default in its workers, so this is safe there.
+    """
+    if not hasattr(signal, "SIGHUP"):
+        return
+    if threading.current_thread() is not threading.main_thread():
+        return
+    if signal.getsignal(signal.SIGHUP) in (signal.SIG_DFL, None):
+        signal.signal(signal.SIGHUP, reload_signers)
+
+
 def witness_tx_cbor(tx_cbor: str, skey_path: str, vkey_path: str) -> str:
     """
     Create the witness CBOR given the tx CBOR, the skey, and the vkey paths.
@@ -146,11 +254,28 @@ def witness_tx_cbor(tx_cbor: str, skey_path: str, vkey_path: str) -> str:
     Returns:
         witness_cbor (str): The CBOR of a valid witness
     """
-    # get the keys
-    sk = get_key_from_file(skey_path)
-    pk = get_key_from_file(vkey_path)
+    # the keys are loaded once and kept in memory
+    signer = get_signer(skey_path, vkey_path)
     # get the hash
-    tx_hash = tx_id(tx_cbor)
+    tx_hash = body_hash(bytes.fromhex(tx_cbor))
     # sign and create the witness
-    sig = sign(sk, tx_hash)
-    return create_witness_cbor(pk, sig)
+    return signer.witness(tx_hash)
+
+
+def witness_tx(tx, skey_path: str, vkey_path: str) -> str:
+    """
+    Create the witness CBOR for an already parsed transaction.
+
+    Args:
+        tx (ParsedTransaction): The transaction validated by the serializer.
+        skey_path (str): The secret key path.
+        vkey_path (str): The verification key path.
+
+    Returns:
+        witness_cbor (str): The CBOR of a valid witness
+    """
+    signer = get_signer(skey_path, vkey_path)
+    # a cached witness is reused only if it was made with the current key
+    if tx.witness is not None and bytes.fromhex(tx.witness[10:74]) == signer.public_key:
+        return tx.witness
+    return signer.witness(tx.tx_hash)
@@ -1,9 +1,94 @@
+import json
+import threading
+
 import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class EvaluationUnavailable(Exception):
+    """The evaluation upstream could not be reached or gave no usable answer."""
+
+
+# one keep-alive connection pool per environment for the life of the worker
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def koios_url(environment: str) -> str:
+    env_settings = settings.ENVIRONMENTS.get(environment) or {}
+    url = env_settings.get('KOIOS_URL')
+    if url:
+        return url
+    prefix = "api" if environment == "mainnet" else environment
+    return f"https://{prefix}.koios.rest/api/v1/ogmios"
+
+
+def get_session(environment: str) -> requests.Session:
+    """
+    Returns the pooled session for an environment, creating it on first use.
+
+    Args:
+        environment (str): The network name, e.g. preprod or mainnet.
+
+    Returns:
+        requests.Session: A session with keep-alive and bounded retries.
+    """
+    session = _sessions.get(environment)
+    if session is not None:
+        return session
+    with _sessions_lock:
+        session = _sessions.get(environment)
+        if session is None:
+            koios = settings.KOIOS
+            retries = Retry(
+                total=koios['RETRIES'],
+                backoff_factor=koios['BACKOFF_FACTOR'],
+                status_forcelist=(502, 503, 504),
+                # evaluateTransaction has no side effects so a POST is safe to retry
+                allowed_methods=frozenset({"POST"}),
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=koios['POOL_SIZE'], max_retries=retries)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update({
+                "accept": "application/json",
+                "accept-encoding": "gzip",
+                "content-type": "application/json",
+            })
+            _sessions[environment] = session
+    return session
+
+
+def close_sessions() -> None:
+    """Closes every pooled connection, e.g. after settings change in tests."""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
 
 
 def evaluate_transaction(tx_body_cbor_hex: str, environment: str) -> dict:
+    env_settings = settings.ENVIRONMENTS.get(environment) or {}
+    if env_settings.get('EVALUATOR') == 'ogmios':
+        return evaluate_on_ogmios(tx_body_cbor_hex, env_settings)
+    return evaluate_on_koios(tx_body_cbor_hex, environment)
+
+
+def evaluate_on_ogmios(tx_body_cbor_hex: str, env_settings: dict) -> dict:
+    # websockets is only imported by environments that use it
+    from api.ogmios import get_client
+
+    client = get_client(env_settings['OGMIOS_URL'], settings.OGMIOS['CONNECT_TIMEOUT'])
+    return client.evaluate(tx_body_cbor_hex, settings.OGMIOS['TIMEOUT'])
+
+
+def evaluation_payload(tx_body_cbor_hex: str) -> dict:
     # Set up the payload for the POST request
-    payload = {
+    return {
         "jsonrpc": "2.0",
         "method": "evaluateTransaction",
         "params": {
@@ -12,14 +97,66 @@ def evaluate_transaction(tx_body_cbor_hex: str, environment: str) -> dict:
             }
         }
     }
-    headers = {
-        "accept": "application/json",
-        "content-type": "application/json"
-    }
 
-    # Send the POST request
-    prefix = "api" if environment == "mainnet" else environment
-    response = requests.post(f"https://{prefix}.koios.rest/api/v1/ogmios", headers=headers, json=payload)
 
+def evaluation_reply(status: int, body: bytes) -> dict:
+    """
+    The decoded reply of an evaluation over http. A success carries the
+    result or a JSON-RPC error, and a tx that fails to evaluate may also come
+    back as a 400 with the JSON-RPC error. Any other status, a 429 or a 500
+    included, says nothing about the tx and raises EvaluationUnavailable.
+    """
+    if not (200 <= status < 300 or status == 400):
+        raise EvaluationUnavailable(f"Upstream Status {status}")
+    try:
+        reply = json.loads(body)
+    except ValueError as e:
+        raise EvaluationUnavailable(f"Invalid JSON From Upstream: {e}") from e
+    if status == 400 and not (isinstance(reply, dict) and 'error' in reply):
+        raise EvaluationUnavailable(f"Upstream Status {status}")
+    return reply
+
+
+def evaluate_on_koios(tx_body_cbor_hex: str, environment: str) -> dict:
+    payload = evaluation_payload(tx_body_cbor_hex)
+
+    # Send the POST request over the pooled connection, never wait forever
+    session = get_session(environment)
+    timeout = (settings.KOIOS['CONNECT_TIMEOUT'], settings.KOIOS['READ_TIMEOUT'])
+    try:
+        response = session.post(koios_url(environment), json=payload, timeout=timeout)
+    except requests.RequestException as e:
+        raise EvaluationUnavailable(str(e)) from e
     # Return the result of the evaluation
-    return response.json()
+    return evaluation_reply(response.status_code, response.content)
+
+
+async def evaluate_transaction_async(tx_body_cbor_hex: str, environment: str) -> dict:
+    """
+    The event loop version of evaluate_transaction used by the async view.
+    """
+    env_settings = settings.ENVIRONMENTS.get(environment) or {}
+    if env_settings.get('EVALUATOR') == 'ogmios':
+        from api.ogmios import get_client
+
+        client = get_client(env_settings['OGMIOS_URL'], settings.OGMIOS['CONNECT_TIMEOUT'])
+        return await client.evaluate_async(tx_body_cbor_hex, settings.OGMIOS['TIMEOUT'])
+
+    from api.async_http import AsyncHTTPError, get_pool
+
+    koios = settings.KOIOS
+    pool = get_pool(
+        koios_url(environment),
+        max_connections=koios['ASYNC_POOL_SIZE'],
+        connect_timeout=koios['CONNECT_TIMEOUT'],
+        read_timeout=koios['READ_TIMEOUT'],
+        retries=koios['RETRIES'],
+        backoff_factor=koios['BACKOFF_FACTOR'],
+    )
+    try:
+        return await pool.post_json(evaluation_payload(tx_body_cbor_hex))
+    except AsyncHTTPError as e:
+        if e.status is not None:
+            # the same statuses count as an answer as for the sync client
+            return evaluation_reply(e.status, e.body)
+        raise EvaluationUnavailable(str(e)) from e
@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import weakref
+
+from django.conf import settings
+
+from api.store import get_store
+
+logger = logging.getLogger('api')
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS inflight (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)",
+)
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs one call per key at a time inside a process. Threads asking for a
+    key that is already in flight wait for that call and share its result
+    or its exception.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+class AsyncSingleFlight:
+    """
+    The event loop version of SingleFlight, one per loop. A cancelled call
+    isn't shared, the tasks waiting on it start the call again.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, fn):
+        future = self._calls.get(key)
+        while future is not None:
+            # unlike awaiting the future, wait doesn't raise when only the future was cancelled
+            await asyncio.wait([future])
+            if not future.cancelled():
+                return future.result()
+            future = self._calls.get(key)
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # the leader re-raises, don't warn if nobody else was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+
+class LockTable:
+    """
+    Per-key leases in the shared store so only one worker on the host works
+    on a key at a time. A lease expires on its own if its worker dies.
+    """
+
+    def __init__(self, store, ttl: float):
+        self.store = store
+        self.ttl = ttl
+        self.owner = str(os.getpid())
+
+    def _conn(self) -> sqlite3.Connection:
+        self.store.ensure_schema('inflight', SCHEMA)
+        return self.store.connection()
+
+    def acquire(self, key: str) -> bool:
+        now = time.time()
+        conn = self._conn()
+        conn.execute("DELETE FROM inflight WHERE key = ? AND expires <= ?", (key, now))
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO inflight (key, owner, expires) VALUES (?, ?, ?)",
+            (key, self.owner, now + self.ttl),
+        )
+        return cursor.rowcount == 1
+
+    def release(self, key: str) -> None:
+        self._conn().execute("DELETE FROM inflight WHERE key = ? AND owner = ?", (key, self.owner))
+
+
+_flight = SingleFlight()
+_async_flights = weakref.WeakKeyDictionary()
+_lock_tables = {}
+
+
+def get_lock_table():
+    """
+    Returns the cross-worker lock table, or None when it is disabled.
+    """
+    config = settings.SINGLE_FLIGHT
+    if not config['ACROSS_WORKERS']:
+        return None
+    path = settings.SHARED_STORE_PATH
+    table = _lock_tables.get((path, os.getpid()))
+    if table is None:
+        table = LockTable(get_store(path), config['LOCK_TTL'])
+        _lock_tables[(path, os.getpid())] = table
+    return table
+
+
+def coalesce(key: str, work, lookup):
+    """
+    Runs `work` once for every concurrent caller with the same key.
+
+    Callers in this process share one call. Across workers the first to
+    take the lease runs `work` while the others poll `lookup` for the
+    result it publishes. They fall back to running `work` themselves if the
+    lease is dropped without a result or the wait runs out.
+
+    Args:
+        key (str): What identifies identical work, e.g. the tx hash.
+        work (callable): Computes and publishes the result.
+        lookup (callable): Returns a published result, or None. Without
+            one the work is only shared inside this process.
+
+    Returns:
+        The result of `work` or the one `lookup` found.
+    """
+    return _flight.do(key, lambda: _across_workers(key, work, lookup))
+
+
+def _across_workers(key, work, lookup):
+    locks = get_lock_table() if lookup is not None else None
+    if locks is None:
+        return work()
+    config = settings.SINGLE_FLIGHT
+    deadline = time.monotonic() + config['WAIT']
+    while True:
+        try:
+            acquired = locks.acquire(key)
+        except sqlite3.Error as e:
+            logger.warning("Single Flight Lock Failed: %s", e)
+            return work()
+        if acquired:
+            try:
+                return work()
+            finally:
+                try:
+                    locks.release(key)
+                except sqlite3.Error as e:
+                    logger.warning("Single Flight Release Failed: %s", e)
+        # another worker is on it, wait for what it publishes
+        time.sleep(config['POLL_INTERVAL'])
+        result = lookup()
+        if result is not None:
+            return result
+        if time.monotonic() > deadline:
+            return work()
+
+
+async def coalesce_async(key: str, work, lookup):
+    """
+    The event loop version of coalesce, `work` and `lookup` are coroutine functions.
+    """
+    loop = asyncio.get_running_loop()
+    flight = _async_flights.get(loop)
+    if flight is None:
+        flight = _async_flights[loop] = AsyncSingleFlight()
+    return await flight.do(key, lambda: _across_workers_async(key, work, lookup))
+
+
+async def _across_workers_async(key, work, lookup):
+    locks = get_lock_table() if lookup is not None else None
+    if locks is None:
+        return await work()
+    config = settings.SINGLE_FLIGHT
+    deadline = time.monotonic() + config['WAIT']
+    while True:
+        try:
+            acquired = await asyncio.to_thread(locks.acquire, key)
+        except sqlite3.Error as e:
+            logger.warning("Single Flight Lock Failed: %s", e)
+            return await work()
+        if acquired:
+            try:
+                return await work()
+            finally:
+                try:
+                    await asyncio.to_thread(locks.release, key)
+                except sqlite3.Error as e:
+                    logger.warning("Single Flight Release Failed: %s", e)
+        await asyncio.sleep(config['POLL_INTERVAL'])
+        result = await lookup()
+        if result is not None:
+            return result
+        if time.monotonic() > deadline:
+            return await work()
@@ -0,0 +1,59 @@
+import os
+import sqlite3
+import threading
+
+from django.conf import settings
+
+
+class SharedStore:
+    """
+    A small SQLite file shared by every worker on the host. Each thread of
+    each process gets its own connection, and features create their tables
+    with `ensure_schema` the first time they use the store.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._schemas = set()
+        self._lock = threading.Lock()
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        # a forked worker must not reuse its parent's connection
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def ensure_schema(self, name: str, statements: tuple) -> None:
+        """Runs the CREATE statements of a feature once per process."""
+        if name in self._schemas:
+            return
+        with self._lock:
+            if name in self._schemas:
+                return
+            conn = self.connection()
+            for statement in statements:
+                conn.execute(statement)
+            self._schemas.add(name)
+
+
+# one store per path for the life of the worker
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(path: str = None) -> SharedStore:
+    path = path or settings.SHARED_STORE_PATH
+    store = _stores.get(path)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(path)
+            if store is None:
+                store = SharedStore(path)
+                _stores[path] = store
+    return store
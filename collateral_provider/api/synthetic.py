@@ -0,0 +1,154 @@
+# api/synthetic.py
+"""
+Seeded Conway era transactions of a chosen shape, for tests, benchmarks and
+load tests. The same seed and shape always give the same tx.
+
+    synthetic_tx(TxShape(inputs=64, outputs=64, assets=4), seed=7)
+    synthetic_tx(SHAPES['max'], seed=1)
+
+Only the shape is realistic. Nothing is spendable and no script would run,
+which is fine for every check the provider makes before the evaluation.
+"""
+import random
+from dataclasses import dataclass, replace
+
+from cbor2 import CBORTag
+from pycardano import (Address, Asset, AssetName, ExecutionUnits, MultiAsset,
+                       Network, NonEmptyOrderedSet, PlutusV3Script,
+                       RawPlutusData, Redeemer, RedeemerTag, ScriptHash,
+                       Transaction, TransactionBody, TransactionInput,
+                       TransactionOutput, TransactionWitnessSet, Value,
+                       VerificationKeyHash)
+from pycardano.serialization import OrderedSet
+
+# the collateral and pkh of valid_tx_body_cbor_with_collateral
+DEFAULT_COLLATERAL = ('1e0b413409dd9591b2a69bca80d7d776e8bb5130f02af0bf886e08ce5b6e183a', 0)
+DEFAULT_PKH = 'c59da4ec6e515c2efc8866274dee6ac9a64b5945efd365f3a999e760'
+
+# the limit check_cbor_hex enforces
+MAX_TX_SIZE = 16384
+
+
+@dataclass(frozen=True)
+class TxShape:
+    inputs: int = 1
+    outputs: int = 1
+    reference_inputs: int = 0
+    # policies in each output's bundle, and token names per policy
+    assets: int = 0
+    tokens: int = 1
+    # outputs carrying an inline datum of datum_bytes
+    datums: int = 0
+    datum_bytes: int = 64
+    # plutus v3 scripts in the witness set, each with a spend redeemer
+    scripts: int = 0
+    script_bytes: int = 256
+    # pads the tx with a datum until it is about this many bytes
+    size: int = None
+    collateral: bool = True
+    signer: bool = True
+
+
+# the shapes the benchmarks and load tests run, from a plain payment to the limit
+SHAPES = {
+    'minimal': TxShape(),
+    'typical': TxShape(inputs=3, outputs=3, reference_inputs=1, assets=1, tokens=2, datums=1),
+    'many-io': TxShape(inputs=64, outputs=64),
+    'multi-asset': TxShape(inputs=4, outputs=8, assets=8, tokens=4),
+    'scripts': TxShape(inputs=4, outputs=4, reference_inputs=4, datums=4, datum_bytes=256, scripts=4, script_bytes=1024),
+    'max': TxShape(inputs=8, outputs=8, reference_inputs=4, assets=2, tokens=2, datums=2, scripts=1,
+                   size=MAX_TX_SIZE - 64),
+}
+
+
+def random_input(rng: random.Random) -> TransactionInput:
+    return TransactionInput.from_primitive([rng.randbytes(32), rng.randrange(16)])
+
+
+def datum(rng: random.Random, size: int) -> RawPlutusData:
+    # plutus bytes are at most 64 long, a constructor holds the chunks
+    chunks = [rng.randbytes(min(64, size - start)) for start in range(0, size, 64)]
+    return RawPlutusData(CBORTag(121, chunks))
+
+
+def bundle(rng: random.Random, shape: TxShape) -> MultiAsset:
+    assets = MultiAsset()
+    for _ in range(shape.assets):
+        tokens = Asset()
+        for _ in range(shape.tokens):
+            tokens[AssetName(rng.randbytes(rng.randrange(4, 33)))] = rng.randrange(1, 1_000_000_000)
+        assets[ScriptHash(rng.randbytes(28))] = tokens
+    return assets
+
+
+def output(rng: random.Random, shape: TxShape, with_datum: bool, datum_bytes: int) -> TransactionOutput:
+    address = Address(VerificationKeyHash(rng.randbytes(28)), VerificationKeyHash(rng.randbytes(28)),
+                      network=Network.TESTNET)
+    amount = Value(rng.randrange(1_000_000, 100_000_000), bundle(rng, shape))
+    if with_datum:
+        return TransactionOutput(address, amount, datum=datum(rng, datum_bytes), post_alonzo=True)
+    return TransactionOutput(address, amount)
+
+
+def build(shape: TxShape, rng: random.Random, collateral: tuple, pkh: str, padding: int) -> Transaction:
+    inputs = [random_input(rng) for _ in range(shape.inputs)]
+    outputs = [output(rng, shape, index < shape.datums, shape.datum_bytes) for index in range(shape.outputs)]
+    if padding:
+        outputs.append(output(rng, replace(shape, assets=0), True, padding))
+    body = TransactionBody(
+        inputs=OrderedSet(inputs),
+        outputs=outputs,
+        fee=rng.randrange(170_000, 2_000_000),
+        ttl=rng.randrange(50_000_000, 150_000_000),
+    )
+    if shape.reference_inputs:
+        body.reference_inputs = NonEmptyOrderedSet([random_input(rng) for _ in range(shape.reference_inputs)])
+    if shape.collateral:
+        body.collateral = NonEmptyOrderedSet([TransactionInput.from_primitive([bytes.fromhex(collateral[0]), collateral[1]])])
+    if shape.signer:
+        body.required_signers = NonEmptyOrderedSet([VerificationKeyHash(bytes.fromhex(pkh))])
+
+    witness_set = TransactionWitnessSet()
+    if shape.scripts:
+        witness_set.plutus_v3_script = NonEmptyOrderedSet(
+            [PlutusV3Script(rng.randbytes(shape.script_bytes)) for _ in range(shape.scripts)]
+        )
+        redeemers = []
+        for index in range(shape.scripts):
+            redeemer = Redeemer(datum(rng, 32), ExecutionUnits(rng.randrange(10**6, 10**7), rng.randrange(10**8, 10**9)))
+            redeemer.tag = RedeemerTag.SPEND
+            redeemer.index = index
+            redeemers.append(redeemer)
+        witness_set.redeemer = redeemers
+    return Transaction(body, witness_set)
+
+
+def synthetic_tx(shape: TxShape = TxShape(), seed: int = 0, collateral: tuple = DEFAULT_COLLATERAL,
+                 pkh: str = DEFAULT_PKH) -> str:
+    """
+    A tx of the given shape as CBOR hex. The collateral (tx id hex, index)
+    and the pkh are included unless the shape leaves them out.
+    """
+    tx = build(shape, random.Random(f"{seed}:{shape}"), collateral, pkh, 0)
+    size = len(tx.to_cbor())
+    if shape.size is None or size >= shape.size:
+        return tx.to_cbor_hex()
+    # one padding output, its datum sized to what is left, then trimmed to fit
+    padding = shape.size - size
+    for _ in range(3):
+        padded = build(shape, random.Random(f"{seed}:{shape}"), collateral, pkh, padding)
+        excess = len(padded.to_cbor()) - shape.size
+        if excess <= 0:
+            return padded.to_cbor_hex()
+        padding -= excess
+    return padded.to_cbor_hex()
+
+
+def configured(environment: str = 'preprod') -> dict:
+    """
+    The collateral and pkh in settings, as keyword arguments for synthetic_tx.
+    """
+    from django.conf import settings
+
+    env_settings = settings.ENVIRONMENTS[environment]
+    return {'collateral': (env_settings['TXID'], env_settings['TXIDX']), 'pkh': settings.PKH}
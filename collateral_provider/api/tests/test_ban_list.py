@@ -0,0 +1,64 @@
+# api/tests/test_ban_list.py
+import json
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from api.ban_list import BanList, BanListLoader
+
+
+class BanListTestCase(TestCase):
+
+    def test_single_addresses_and_ranges(self):
+        ban_list = BanList(ip_addresses=["127.0.0.1", "10.0.0.0/8", "192.168.1.7/24", "2001:db8::/32", "::1"])
+        for ip_address in ("127.0.0.1", "10.1.2.3", "192.168.1.200", "2001:db8::dead:beef", "::1", "::ffff:10.0.0.1"):
+            self.assertTrue(ban_list.ip_is_banned(ip_address), ip_address)
+        for ip_address in ("127.0.0.2", "11.0.0.1", "192.168.2.1", "2001:db9::1", "::2", None, "not an ip"):
+            self.assertFalse(ban_list.ip_is_banned(ip_address), ip_address)
+
+    def test_addresses_are_raw_bytes(self):
+        address = "7025891024cd6915ab6f7d85d43869c7bfc7021b7008bad86e70a7c6ce"
+        ban_list = BanList(addresses=[address, "not hex"])
+        self.assertTrue(ban_list.address_is_banned(bytes.fromhex(address)))
+        self.assertFalse(ban_list.address_is_banned(bytes.fromhex(address)[:-1]))
+
+
+class BanListLoaderTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "ban.list.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, content):
+        with open(self.path, "w") as file:
+            file.write(content if isinstance(content, str) else json.dumps(content))
+        # make the change visible even on coarse mtime clocks
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    def test_missing_file_bans_nothing(self):
+        loader = BanListLoader(self.path)
+        self.assertFalse(loader.get().ip_is_banned("127.0.0.1"))
+
+    @patch("api.ban_list.BAN_LIST_CHECK_INTERVAL", 0)
+    def test_reloads_on_change(self):
+        self.write({"ip_addresses": ["127.0.0.1"]})
+        loader = BanListLoader(self.path)
+        self.assertTrue(loader.get().ip_is_banned("127.0.0.1"))
+        self.write({"ip_addresses": ["10.0.0.0/8"], "addresses": ["70ab"]})
+        ban_list = loader.get()
+        self.assertFalse(ban_list.ip_is_banned("127.0.0.1"))
+        self.assertTrue(ban_list.ip_is_banned("10.9.9.9"))
+        self.assertTrue(ban_list.address_is_banned(b"\x70\xab"))
+
+    @patch("api.ban_list.BAN_LIST_CHECK_INTERVAL", 0)
+    def test_broken_file_keeps_previous_list(self):
+        self.write({"ip_addresses": ["127.0.0.1"]})
+        loader = BanListLoader(self.path)
+        self.write("{")
+        self.assertTrue(loader.get().ip_is_banned("127.0.0.1"))
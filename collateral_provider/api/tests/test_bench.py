@@ -0,0 +1,51 @@
+# api/tests/test_bench.py
+import io
+import json
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+
+class BenchTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.baseline = os.path.join(self.tmp.name, "baseline.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def bench(self, *args):
+        out = io.StringIO()
+        call_command('bench', '--iterations', '5', '--warmup', '1', '--alloc-iterations', '2',
+                     '--baseline', self.baseline, *args, stdout=out)
+        return out.getvalue()
+
+    def test_synthetic_txs_pass_every_check(self):
+        self.bench('--filter', '[synthetic-minimal]', '--save')
+        with open(self.baseline) as file:
+            cases = json.load(file)['cases']
+        self.assertEqual(sorted(cases), [
+            'check_body[synthetic-minimal]', 'check_cbor_hex[synthetic-minimal]', 'check_tx_body[synthetic-minimal]',
+            'check_tx_shape[synthetic-minimal]', 'tx_id[synthetic-minimal]', 'validate_tx_body[synthetic-minimal]',
+            'witness_tx_cbor[synthetic-minimal]',
+        ])
+
+    def test_regressions_fail(self):
+        self.assertIn('No Baseline', self.bench('--filter', 'create_witness_cbor'))
+        self.bench('--filter', 'create_witness_cbor', '--save')
+        with open(self.baseline) as file:
+            baseline = json.load(file)
+        baseline['cases']['create_witness_cbor']['p50_us'] = 1e6
+        with open(self.baseline, 'w') as file:
+            json.dump(baseline, file)
+        self.assertIn('create_witness_cbor', self.bench('--filter', 'create_witness_cbor'))
+
+        baseline['cases']['create_witness_cbor']['p50_us'] = 1e-6
+        with open(self.baseline, 'w') as file:
+            json.dump(baseline, file)
+        with self.assertRaisesMessage(CommandError, 'create_witness_cbor: p50'):
+            self.bench('--filter', 'create_witness_cbor')
@@ -0,0 +1,97 @@
+# api/tests/test_capture.py
+import json
+import os
+import threading
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api import capture
+from api.reasons import outcome_of
+
+from .test_data import valid_tx_body_cbor_with_collateral
+from .test_provide_collateral import WitnessingTestMixin
+
+
+class CaptureTestCase(WitnessingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient(HTTP_HOST='localhost')
+        self.url = reverse('collateral', kwargs={'environment': 'preprod'})
+        self.path = os.path.join(self.tmp.name, "capture.jsonl")
+        self.capture_override = override_settings(CAPTURE={'PATH': self.path, 'SAMPLE_RATE': 1.0, 'MAX_BYTES': 0})
+        self.capture_override.enable()
+
+    def tearDown(self):
+        writer = capture._writers.pop(self.path, None)
+        if writer is not None:
+            writer.close()
+        self.capture_override.disable()
+        super().tearDown()
+
+    def captured(self):
+        capture.get_writer(self.path).flush()
+        with open(self.path) as file:
+            return [json.loads(line) for line in file]
+
+    @patch("api.validators.transaction.evaluate_transaction", return_value={"result": []})
+    def test_requests_are_captured_without_the_ip(self, mock_evaluate):
+        tx_cbor = valid_tx_body_cbor_with_collateral()
+        self.client.post(self.url, {'tx_body': tx_cbor}, format='json', REMOTE_ADDR='10.1.2.3')
+        self.client.post(self.url, {'tx_body': 'acab'}, format='json', REMOTE_ADDR='10.1.2.3')
+        self.client.post(self.url, {'tx_body': 'acab'}, format='json', HTTP_X_FORWARDED_FOR='10.9.9.9')
+        # nothing to replay without a tx
+        self.client.post(self.url, {'other': 'acab'}, format='json')
+
+        lines = self.captured()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[0]['environment'], 'preprod')
+        self.assertEqual(lines[0]['tx_body'], tx_cbor)
+        self.assertEqual((lines[0]['status'], lines[0]['outcome']), (200, 'witness'))
+        self.assertEqual((lines[1]['status'], lines[1]['outcome']), (400, 'Invalid CBOR Data In Tx'))
+        self.assertLessEqual(lines[0]['arrival'], lines[1]['arrival'])
+        self.assertGreater(lines[0]['latency_ms'], 0)
+        # one key per client, and the ip itself is nowhere
+        self.assertEqual(lines[0]['client'], lines[1]['client'])
+        self.assertNotEqual(lines[1]['client'], lines[2]['client'])
+        with open(self.path) as file:
+            content = file.read()
+        self.assertNotIn('10.1.2.3', content)
+        self.assertNotIn('10.9.9.9', content)
+
+    def test_capture_is_opt_in(self):
+        with override_settings(CAPTURE={'PATH': None, 'SAMPLE_RATE': 1.0, 'MAX_BYTES': 0}):
+            self.client.post(self.url, {'tx_body': 'acab'}, format='json')
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_outcomes_leave_out_the_clients_values(self):
+        self.assertEqual(outcome_of(200, b'{"witness": "8200"}'), 'witness')
+        self.assertEqual(outcome_of(400, b'{"tx_body": ["The IP: 10.0.0.1 Is Banned"]}'), 'The IP Is Banned')
+        self.assertEqual(outcome_of(429, b'{"detail": "Request was throttled. Expected available in 3 seconds."}'),
+                         'Throttled')
+        self.assertEqual(outcome_of(502, b'<html>Bad Gateway</html>'), 'HTTP 502')
+
+    def test_a_full_capture_stops_and_drops_are_only_logged(self):
+        writer = capture.CaptureWriter(os.path.join(self.tmp.name, "full.jsonl"), max_bytes=10)
+        with self.assertLogs('api', level='WARNING') as logs:
+            writer.write(b'{"first": 1}\n')
+            writer.write(b'{"second": 2}\n')
+            writer.close()
+        with open(writer.path) as file:
+            self.assertEqual(file.read(), '{"first": 1}\n')
+        self.assertIn('Is Full', logs.output[0])
+
+        release = threading.Event()
+        writer = capture.CaptureWriter(os.path.join(self.tmp.name, "dropped.jsonl"), queue_size=1)
+        with patch('api.capture.os.write', side_effect=lambda fd, line: release.wait()), \
+                self.assertLogs('api', level='WARNING') as logs:
+            for _ in range(3):
+                writer.write(b'{}\n')
+            release.set()
+            writer.close()
+        self.assertRegex(logs.output[0], r'Dropped [12] Captured Requests')
+        with open(writer.path) as file:
+            self.assertNotIn('Dropped', file.read())
@@ -1,3 +1,6 @@
+from benchmarks.fixtures import FIXTURE_TX
+
+
 def invalid_tx_body_missing_collateral():
     return "84ab00d90102828258206277d223169cbe56cae912c7b4789ce55d88470b7f93475f9f8adecfb8c28230018258208174ded24eda90cdeb4f1b093e101148d9304053ff7b34a7c9478337fa00cc92020dd90102818258206277d223169cbe56cae912c7b4789ce55d88470b7f93475f9f8adecfb8c282300112d9010281825820d84783b8cdd75aa688fa4505cc6143e8b3fd9069a65629b002efe3b1aed9b641010182a300581d70e8a957100f3c633592eae6bf810c2e26d97bd92ecdb59d5e84afbc7c01821a0018dbfca1581ce8a957100f3c633592eae6bf810c2e26d97bd92ecdb59d5e84afbc7ca158205eed0e1f7361736467016277d223169cbe56cae912c7b4789ce55d88470b7f9301028201d8185868d8799f583097f1d3a73197d7942695638c4fa9ac0fc3688c4f9774b905a14e3a3f171bac586c55e83ff97a1aeffb3af00adb22c6bb5830aac1314842462403009f917f388184f6fe8db6745cff08adb336bcd0a3c21fe27c7b4f862d7d8fea2a395dd77bf9a786ff82581d60a2d0bdf9260505f38e22ea0fb3bbedc327b7eaea628f9317bcbab9be1a0195a8ed1082581d60a2d0bdf9260505f38e22ea0fb3bbedc327b7eaea628f9317bcbab9be1a0165c671111a0005f57c021a0003f8fd0ed9010282581ca2d0bdf9260505f38e22ea0fb3bbedc327b7eaea628f9317bcbab9be581cefac7006bfd7a40966142ff2a0f4ede13da67ff35cce4166c6f4e05109a1581ce8a957100f3c633592eae6bf810c2e26d97bd92ecdb59d5e84afbc7ca158205eed0e1f7361736467016277d223169cbe56cae912c7b4789ce55d88470b7f93010b58209d923c45f20f13502ea8847057afbd9c955859a175f1767ee0c51cb607abe48c075820300f0cd73535a8137c850425ca635fce566de135890bfbe4ae43ea979e3a6722a105a182010082457361736467821a000179691a01a30740f5d90103a100a10063796573"
 
@@ -11,7 +14,7 @@ def valid_tx_body_cbor_but_no_collateral():
 
 
 def valid_tx_body_cbor_with_collateral():
-    return "84a900d9010282825820cb2cc3a624803cf82d85f191b33990de574b1d7286f1118b9ed85bc9e8d434f100825820cb2cc3a624803cf82d85f191b33990de574b1d7286f1118b9ed85bc9e8d434f1010dd90102818258201e0b413409dd9591b2a69bca80d7d776e8bb5130f02af0bf886e08ce5b6e183a0012d90102818258205d8a5d172c7edf3c491f418d33a69bee784e35593163eaf39853f292b81fd95c010182a300581d7047a9877e549b91e775bd40fae36dfbdac072098fb382822faf47b4df01821a0041b31aa1581c0d87a0d951d4d2b04207a8bdafa39c24876c0cb9659045c2365102cca15820b786c5adf265db88e0c6287abb5dbc25202d50ab4b504bc342734bdd24b9e50001028201d8185902d4d8799f581cf4a78bbff6d5e7e492915986abc495382247af659018451a25cec92cd8799f9f581cd858ecf3e73e18bef8383a16e856778e033cfd1c8867c70dc9b68b42581c10a20db9464d89dab407b3397e67facf83db8d442e601b627c0a351f581c121ce13907d40c7a598d182ed751d39279cf30d50decb17151b3a587ff02ffd8799f581c1e3105f23f2ac91b3fb4c35fa4fe301421028e356e114944e902005bd8799f581c8f7b0ce283a92df9a3b69ac0b8f10d8bc8bcf8fbd1fe72596ee8bd6c40ffffd8799f581ca7c1a7fa1f60a3625002664e5aade3277666f370c1456825e2aa7e16581c988fee4370c5b5855ed3c52ea3d5e1e01371b39bf479bfb0e92b7a5a581cc18afab1a36848dad72d37a6a0be5698533dff11a014026ab5521c51581c1e44710275537a2f905e369ad37754afb36e1cfedfe5ca6c198e9cc6581c3bfaa6703f4d78efdf03dbae43d88ea9b309be0f66ed38a7008c2eb1ffd8799f1a000f42401a000f42401a000f4240ff581cb2f24e2ec2bfd520646fcec685cd8c1eb3e8272da30d8311fd397678d8799f581ce4d33c4f86ac40278cdd80572abfa7e91b01fbba68d8fa258bf7ef46581c916c03c8f98c44a176de6660e6e45ac0cd59aa4fe6c332bed1e8d79d9f4444618a674445b555bd444cae2fd24457d8ea10445f3a83b8446aa8bd5d44726aaa90448be2ee9c448c4234e844d05fd9e244ecf39067440892f565440c55ccd7443d4d980744520fc569445c99b6b44463e2123b4478820b6c44a16af81444ad997a9244e7982636ff581c47f7fbe11f6d176632a4d73a5a0be81810c4918281f55df0d3485685ffd8799f581cb07d22a4dc75abdba1b8c80033a15b85305b76521a0114b17f291a87581c362e3f869c98ce971ead0e2705c56df467ddd2aecb44f6f216c3e1d54a4f7261636c6546656564581c769c4c6e9bc3ba5406b9b89fb7beb6819e638ff2e2de63f008d5bcff45744e45574d1b000000746a528800ffff82581d60f4a78bbff6d5e7e492915986abc495382247af659018451a25cec92c1a11c8a0d31082581d60f4a78bbff6d5e7e492915986abc495382247af659018451a25cec92c1a00431d9c111a00092da4021a00061e6d0ed9010285581c10a20db9464d89dab407b3397e67facf83db8d442e601b627c0a351f581c121ce13907d40c7a598d182ed751d39279cf30d50decb17151b3a587581cc59da4ec6e515c2efc8866274dee6ac9a64b5945efd365f3a999e760581cd858ecf3e73e18bef8383a16e856778e033cfd1c8867c70dc9b68b42581cf4a78bbff6d5e7e492915986abc495382247af659018451a25cec92c0b5820cc1eb6b650d646141719844845959d0e14ca1087be4663af6b63973b89688a50a105a182000082d87980821a000c4f8c1a0da69936f5f6"
+    return FIXTURE_TX
 
 
 def invalid_tx_body_cbor_spending_collateral():
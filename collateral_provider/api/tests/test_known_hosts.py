@@ -0,0 +1,157 @@
+# api/tests/test_known_hosts.py
+import gzip
+import json
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api.known_hosts import KnownHostsLoader, accepted_encodings
+
+HOSTS = {
+    "$pkh": {"$network": {"$utxo": {"$id": "", "$idx": 0}, "$url": "", "$onion": ""}, "public_key": ""},
+    "7c24c22d1dc252d31f6022ff22ccc838c2ab83a461172d7c2dae61f4": {
+        "preprod": {
+            "utxo": {"id": "1d388e615da2dca607e28f704130d04e39da6f251d551d66d054b75607e0393f", "idx": 0},
+            "url": "https://www.giveme.my/preprod/collateral/",
+            "onion": "http://fjy3v62j7vqytvtviixsbixcmgyxgfolb7pg5bb3vcozxn4rrlu7z6ad.onion/preprod/collateral/",
+        },
+        "mainnet": {
+            "utxo": {"id": "e62351eacbdd001aee77a91805840d2b81f77feebbf2439fb01b79e76c42c839", "idx": 0},
+            "url": "https://www.giveme.my/mainnet/collateral/",
+            "onion": "http://fjy3v62j7vqytvtviixsbixcmgyxgfolb7pg5bb3vcozxn4rrlu7z6ad.onion/mainnet/collateral/",
+        },
+        "public_key": "fa2025e788fae01ce10deffff386f992f62a311758819e4e3792887396c171ba",
+    },
+    "c59da4ec6e515c2efc8866274dee6ac9a64b5945efd365f3a999e760": {
+        "preprod": {
+            "utxo": {"id": "1e0b413409dd9591b2a69bca80d7d776e8bb5130f02af0bf886e08ce5b6e183a", "idx": 0},
+            "url": "https://preprod.example.com/collateral/",
+            "onion": "",
+        },
+        "public_key": "51c20cf42a2a10f64f5ab6bfe4a4c0d6e6a3d9a1f0a5e5e69f4a9e0ed4acb3ed",
+    }
+}
+
+
+class KnownHostsTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "known.hosts.json")
+        self.write(HOSTS)
+        self.settings_override = override_settings(
+            KNOWN_HOSTS_PATH=self.path,
+            PKH="c59da4ec6e515c2efc8866274dee6ac9a64b5945efd365f3a999e760",
+        )
+        self.settings_override.enable()
+        self.client = APIClient(HTTP_HOST='localhost')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmp.cleanup()
+
+    def write(self, content):
+        with open(self.path, "w") as file:
+            file.write(content if isinstance(content, str) else json.dumps(content))
+        # make the change visible even on coarse mtime clocks
+        stat = os.stat(self.path)
+        self.mtime = getattr(self, "mtime", stat.st_mtime_ns) + 1_000_000_000
+        os.utime(self.path, ns=(stat.st_atime_ns, self.mtime))
+
+    def test_known_hosts_matches_the_file(self):
+        response = self.client.get(reverse('known_hosts'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), HOSTS)
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('max-age=', response['Cache-Control'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_matching_etag_is_not_modified(self):
+        etag = self.client.get(reverse('known_hosts'))['ETag']
+        response = self.client.get(reverse('known_hosts'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        response = self.client.get(reverse('known_hosts'), HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_none_match_is_weak(self):
+        etag = self.client.get(reverse('known_hosts'))['ETag']
+        # a proxy that changed the body's encoding may have weakened the tag
+        for header in (f'W/{etag}', f'"stale", W/{etag}', '*'):
+            response = self.client.get(reverse('known_hosts'), HTTP_IF_NONE_MATCH=header)
+            self.assertEqual(response.status_code, 304, header)
+        response = self.client.get(reverse('known_hosts'), HTTP_IF_NONE_MATCH='W/"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_gzip_when_accepted(self):
+        plain = self.client.get(reverse('landing_page'))
+        response = self.client.get(reverse('landing_page'), HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertNotEqual(response['ETag'], plain['ETag'])
+        self.assertIn(b"c59da4ec6e515c2efc8866274dee6ac9a64b5945efd365f3a999e760", plain.content)
+
+    @patch("api.known_hosts.KNOWN_HOSTS_CHECK_INTERVAL", 0)
+    def test_changed_file_changes_the_etag(self):
+        before = self.client.get(reverse('known_hosts'))
+        hosts = dict(HOSTS, extra={"preprod": {"url": "https://other.example.com/"}})
+        self.write(hosts)
+        after = self.client.get(reverse('known_hosts'), HTTP_IF_NONE_MATCH=before['ETag'])
+        self.assertEqual(after.status_code, 200)
+        self.assertEqual(after.json(), hosts)
+        self.assertNotEqual(after['ETag'], before['ETag'])
+
+    def test_missing_file(self):
+        with override_settings(KNOWN_HOSTS_PATH=os.path.join(self.tmp.name, "missing.json")):
+            response = self.client.get(reverse('known_hosts'))
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(response.json(), {'error': 'File Not Found'})
+            response = self.client.get(reverse('landing_page'))
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(b"Public Key Hash Not Found In Known Hosts", response.content)
+
+    @patch("api.known_hosts.KNOWN_HOSTS_CHECK_INTERVAL", 0)
+    def test_broken_file_keeps_previous_hosts(self):
+        loader = KnownHostsLoader(self.path)
+        self.write("{not json")
+        self.assertEqual(loader.get().data, HOSTS)
+
+    def test_filter_by_network(self):
+        response = self.client.get(reverse('known_hosts'), {'network': 'mainnet'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            "7c24c22d1dc252d31f6022ff22ccc838c2ab83a461172d7c2dae61f4": {
+                "mainnet": HOSTS["7c24c22d1dc252d31f6022ff22ccc838c2ab83a461172d7c2dae61f4"]["mainnet"],
+                "public_key": "fa2025e788fae01ce10deffff386f992f62a311758819e4e3792887396c171ba",
+            }
+        })
+
+    def test_filter_by_pkh_and_transport(self):
+        pkh = "c59da4ec6e515c2efc8866274dee6ac9a64b5945efd365f3a999e760"
+        response = self.client.get(reverse('known_hosts'), {'pkh': pkh})
+        self.assertEqual(list(response.json()), [pkh])
+        response = self.client.get(reverse('known_hosts'), {'pkh': pkh, 'transport': 'onion'})
+        self.assertEqual(response.json(), {})
+        response = self.client.get(reverse('known_hosts'), {'network': 'preprod', 'transport': 'onion'})
+        self.assertEqual(list(response.json()), ["7c24c22d1dc252d31f6022ff22ccc838c2ab83a461172d7c2dae61f4"])
+        response = self.client.get(reverse('known_hosts'), {'network': 'preprod', 'transport': 'https'})
+        self.assertEqual(len(response.json()), 2)
+
+    def test_filter_unknown_values(self):
+        for params in ({'network': 'nope'}, {'pkh': '$pkh'}, {'pkh': 'ab', 'network': 'preprod'}):
+            response = self.client.get(reverse('known_hosts'), params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), {})
+        response = self.client.get(reverse('known_hosts'), {'transport': 'carrier-pigeon'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Invalid Transport: carrier-pigeon'})
+
+    def test_accepted_encodings(self):
+        self.assertEqual(accepted_encodings("gzip;q=1.0, br;q=0, identity"), {"gzip", "identity"})
+        self.assertEqual(accepted_encodings(""), set())
@@ -0,0 +1,97 @@
+# api/tests/test_log.py
+import json
+import logging
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from api.log import JsonFormatter, QueuedHandler, SampleFilter
+
+
+def record(message, *args, level=logging.ERROR, **extra):
+    log_record = logging.LogRecord('api', level, __file__, 1, message, args, None)
+    log_record.__dict__.update(extra)
+    return log_record
+
+
+class JsonFormatterTestCase(TestCase):
+
+    def test_message_and_extras(self):
+        entry = json.loads(JsonFormatter().format(record('Invalid Data From IP: %s: %s', '10.0.0.1', {'tx_body': ['x']}, ip='10.0.0.1')))
+        self.assertEqual(entry['message'], "Invalid Data From IP: 10.0.0.1: {'tx_body': ['x']}")
+        self.assertEqual(entry['ip'], '10.0.0.1')
+        self.assertEqual(entry['level'], 'ERROR')
+        self.assertEqual(entry['logger'], 'api')
+        self.assertNotIn('args', entry)
+
+
+class SampleFilterTestCase(TestCase):
+
+    @patch('api.log.time.monotonic')
+    def test_repeats_per_ip_are_sampled(self, mock_monotonic):
+        mock_monotonic.return_value = 100.0
+        sample = SampleFilter(burst=2, window=60)
+        passed = [sample.filter(record('Tx Is Too Complex', ip='10.0.0.1')) for _ in range(5)]
+        self.assertEqual(passed, [True, True, False, False, False])
+        # another ip, and another message, have their own budget
+        self.assertTrue(sample.filter(record('Tx Is Too Complex', ip='10.0.0.2')))
+        self.assertTrue(sample.filter(record('Invalid CBOR Data In Tx', ip='10.0.0.1')))
+        # the next window lets it through again with the dropped count
+        mock_monotonic.return_value = 161.0
+        next_window = record('Tx Is Too Complex', ip='10.0.0.1')
+        self.assertTrue(sample.filter(next_window))
+        self.assertEqual(next_window.suppressed, 3)
+
+    def test_messages_are_not_rendered(self):
+        sample = SampleFilter(burst=1, window=60)
+        errors = record('Invalid Data From IP: %s: %s', '10.0.0.1', {'tx_body': ['x']}, ip='10.0.0.1')
+        with patch.object(logging.LogRecord, 'getMessage', side_effect=AssertionError):
+            self.assertTrue(sample.filter(errors))
+            self.assertFalse(sample.filter(record('Invalid Data From IP: %s: %s', '10.0.0.1', {'other': ['y']}, ip='10.0.0.1')))
+            # hashable arguments keep their own budget
+            self.assertTrue(sample.filter(record('Tx Is Banned From %s', 'a', ip='10.0.0.1')))
+            self.assertTrue(sample.filter(record('Tx Is Banned From %s', 'b', ip='10.0.0.1')))
+
+    def test_zero_burst_logs_everything(self):
+        sample = SampleFilter(burst=0)
+        self.assertTrue(all(sample.filter(record('same', ip='10.0.0.1')) for _ in range(100)))
+
+
+class QueuedHandlerTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'debug.log')
+        self.handler = QueuedHandler(self.path, maxBytes=1024 * 1024, backupCount=1, queue_size=4)
+        self.handler.setFormatter(JsonFormatter())
+
+    def tearDown(self):
+        self.handler.close()
+        self.tmp.cleanup()
+
+    def lines(self):
+        self.handler.flush()
+        with open(self.path) as file:
+            return [json.loads(line) for line in file]
+
+    def test_records_are_written_by_the_writer(self):
+        self.handler.handle(record('Request Received From IP: %s', '10.0.0.1', level=logging.INFO, ip='10.0.0.1'))
+        lines = self.lines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(lines[0]['message'], 'Request Received From IP: 10.0.0.1')
+        self.assertEqual(lines[0]['ip'], '10.0.0.1')
+
+    def test_full_queue_drops_and_reports(self):
+        # a stopped writer leaves the queue to fill up
+        self.handler._stop()
+        for index in range(10):
+            self.handler.handle(record('flood %s', index))
+        self.assertEqual(self.handler.dropped, 6)
+        self.handler._start()
+        self.handler.flush()
+        self.handler.handle(record('after'))
+        messages = [line['message'] for line in self.lines()]
+        self.assertEqual(messages[:4], ['flood 0', 'flood 1', 'flood 2', 'flood 3'])
+        self.assertIn('Dropped 6 Log Records', messages)
@@ -0,0 +1,112 @@
+# api/tests/test_metrics.py
+from unittest.mock import patch
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api import metrics
+from api.metrics import Exporter, Registry, reason_of, render
+
+
+class RegistryTestCase(TestCase):
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = Registry()
+        for seconds in (0.0001, 0.003, 0.003, 30.0):
+            registry.observe('collateral_stage_seconds', (('stage', 'hex_decode'),), seconds)
+        text = render(registry)
+        self.assertIn('collateral_stage_seconds_bucket{stage="hex_decode",le="0.0005"} 1\n', text)
+        self.assertIn('collateral_stage_seconds_bucket{stage="hex_decode",le="0.005"} 3\n', text)
+        self.assertIn('collateral_stage_seconds_bucket{stage="hex_decode",le="10.0"} 3\n', text)
+        self.assertIn('collateral_stage_seconds_bucket{stage="hex_decode",le="+Inf"} 4\n', text)
+        self.assertIn('collateral_stage_seconds_count{stage="hex_decode"} 4\n', text)
+        self.assertIn('# TYPE collateral_stage_seconds histogram\n', text)
+        self.assertIn('collateral_requests_in_flight 0\n', text)
+
+    def test_rejection_reasons_are_bounded(self):
+        self.assertEqual(reason_of('The IP: 10.0.0.1 Is Banned'), 'The IP Is Banned')
+        self.assertEqual(reason_of('Invalid Environment: nope'), 'Invalid Environment')
+        self.assertEqual(reason_of('Tx Is Too Complex'), 'Tx Is Too Complex')
+        registry = Registry()
+        with patch('api.metrics.MAX_REASONS', 2):
+            for message in ('a', 'b', 'c', 'd', 'a'):
+                registry.reject(message)
+        self.assertEqual(registry.counters[('collateral_rejections_total', (('reason', 'a'),))], 2)
+        self.assertEqual(registry.counters[('collateral_rejections_total', (('reason', 'Other'),))], 2)
+
+    def test_large_counts_are_not_rounded(self):
+        registry = Registry()
+        registry.inc('collateral_responses_total', (('route', 'collateral'), ('status', '200')), 1234567)
+        self.assertIn('collateral_responses_total{route="collateral",status="200"} 1234567\n', render(registry))
+
+
+class ExporterTestCase(TestCase):
+
+    def worker(self, requests, in_flight):
+        registry = Registry()
+        registry.inc('collateral_responses_total', (('route', 'collateral'), ('status', '200')), requests)
+        registry.add('collateral_requests_in_flight', amount=in_flight)
+        return Exporter(registry, interval=1.0, retire_after=3600)
+
+    def test_workers_are_added_up(self):
+        first, second = self.worker(3, 1), self.worker(4, 2)
+        second.worker += ':second'
+        second.flush()
+        total = first.collect()
+        self.assertEqual(total.counters[('collateral_responses_total', (('route', 'collateral'), ('status', '200')))], 7)
+        self.assertEqual(total.gauges[('collateral_requests_in_flight', ())], 3)
+
+    def test_gone_workers_keep_their_counts(self):
+        first, gone = self.worker(3, 1), self.worker(4, 2)
+        gone.worker += ':gone'
+        with patch('api.metrics.time.time', return_value=1000.0):
+            gone.flush()
+        total = first.collect()
+        # its requests still count, its in flight gauge doesn't
+        self.assertEqual(total.counters[('collateral_responses_total', (('route', 'collateral'), ('status', '200')))], 7)
+        self.assertEqual(total.gauges[('collateral_requests_in_flight', ())], 1)
+        # and they are folded into the retired row
+        total = first.collect()
+        self.assertEqual(total.counters[('collateral_responses_total', (('route', 'collateral'), ('status', '200')))], 7)
+        rows = [row[0] for row in first._conn().execute("SELECT worker FROM metrics")]
+        self.assertEqual(sorted(rows), sorted([first.worker, metrics.RETIRED]))
+
+
+class MetricsViewTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient(HTTP_HOST='localhost')
+
+    def test_stages_and_rejections_are_exposed(self):
+        self.client.post(reverse('collateral', kwargs={'environment': 'preprod'}), {'tx_body': 'acab'}, format='json')
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('collateral_stage_seconds_count{stage="hex_decode"}', text)
+        self.assertIn('collateral_rejections_total{reason="Invalid CBOR Data In Tx"}', text)
+        self.assertIn('collateral_responses_total{route="collateral",status="400"}', text)
+
+    def test_streamed_responses_are_timed_until_closed(self):
+        url = reverse('collateral_batch', kwargs={'environment': 'preprod'})
+        with patch('api.middleware.metrics.request_finished') as finished:
+            response = self.client.post(url, {'tx_bodies': ['acab']}, format='json')
+            self.assertTrue(response.streaming)
+            finished.assert_not_called()
+            b''.join(response.streaming_content)
+            finished.assert_called_once()
+        self.assertEqual(finished.call_args.args[:2], ('collateral_batch', 200))
+
+    def test_scrapes_are_restricted(self):
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1').status_code, 404)
+        # a proxied request could come from anyone
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_X_FORWARDED_FOR='127.0.0.1').status_code, 404)
+        with override_settings(METRICS=dict(settings.METRICS, TOKEN='secret')):
+            # loopback still scrapes, anyone else needs the token
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+            self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1',
+                                             HTTP_AUTHORIZATION='Bearer wrong').status_code, 404)
+            response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1', HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code, 200)
@@ -0,0 +1,122 @@
+# api/tests/test_ogmios.py
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.test import TestCase, override_settings
+from websockets.asyncio.server import serve
+
+from api.ogmios import OgmiosClient, close_clients
+from api.simulate import EvaluationUnavailable, evaluate_transaction
+
+
+class FakeOgmios:
+    """A local Ogmios stand-in that answers evaluateTransaction out of order."""
+
+    def __init__(self):
+        self.connections = 0
+        self.requests = 0
+        # close the socket after this many replies, 0 keeps it open
+        self.drop_after = 0
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.server = asyncio.run_coroutine_threadsafe(self._start(), self.loop).result()
+        self.url = f"ws://127.0.0.1:{self.server.sockets[0].getsockname()[1]}"
+
+    async def _start(self):
+        return await serve(self.handler, "127.0.0.1", 0)
+
+    async def handler(self, ws):
+        self.connections += 1
+        replies = 0
+        async for message in ws:
+            request = json.loads(message)
+            self.requests += 1
+            cbor = request["params"]["transaction"]["cbor"]
+            if cbor == "hang":
+                continue
+            # longer transactions answer first to prove replies are matched by id
+            await asyncio.sleep(0.05 / len(cbor))
+            if cbor == "bad":
+                reply = {"jsonrpc": "2.0", "error": {"code": 3010, "message": "bad"}, "id": request["id"]}
+            else:
+                reply = {"jsonrpc": "2.0", "result": [{"cbor": cbor}], "id": request["id"]}
+            await ws.send(json.dumps(reply))
+            replies += 1
+            if self.drop_after and replies >= self.drop_after:
+                await ws.close()
+                return
+
+    def close(self):
+        async def _stop():
+            self.server.close()
+            await self.server.wait_closed()
+        asyncio.run_coroutine_threadsafe(_stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+class OgmiosClientTestCase(TestCase):
+
+    def setUp(self):
+        self.ogmios = FakeOgmios()
+        self.client = OgmiosClient(self.ogmios.url, connect_timeout=1.0)
+
+    def tearDown(self):
+        self.client.close()
+        self.ogmios.close()
+
+    def test_concurrent_calls_share_one_socket(self):
+        cbors = ["a" * n for n in range(1, 21)]
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            replies = list(pool.map(lambda cbor: self.client.evaluate(cbor, 2.0), cbors))
+        self.assertEqual([reply["result"][0]["cbor"] for reply in replies], cbors)
+        self.assertEqual(self.ogmios.connections, 1)
+
+    def test_error_reply_is_returned(self):
+        reply = self.client.evaluate("bad", 2.0)
+        self.assertNotIn("result", reply)
+        self.assertIn("error", reply)
+
+    def test_reconnects_after_drop(self):
+        self.ogmios.drop_after = 1
+        self.assertIn("result", self.client.evaluate("acab", 2.0))
+        self.assertIn("result", self.client.evaluate("abba", 2.0))
+        self.assertEqual(self.ogmios.connections, 2)
+
+    def test_timeout(self):
+        with self.assertRaises(EvaluationUnavailable):
+            self.client.evaluate("hang", 0.1)
+
+    def test_evaluate_async(self):
+        async def main():
+            return await asyncio.gather(*(self.client.evaluate_async(cbor, 2.0) for cbor in ["ab", "abab"]))
+        replies = asyncio.run(main())
+        self.assertEqual([reply["result"][0]["cbor"] for reply in replies], ["ab", "abab"])
+
+    def test_unreachable(self):
+        client = OgmiosClient("ws://127.0.0.1:9", connect_timeout=0.5)
+        try:
+            with self.assertRaises(EvaluationUnavailable):
+                client.evaluate("acab", 1.0)
+        finally:
+            client.close()
+
+
+class OgmiosEvaluatorTestCase(TestCase):
+
+    def setUp(self):
+        self.ogmios = FakeOgmios()
+
+    def tearDown(self):
+        close_clients()
+        self.ogmios.close()
+
+    def test_environment_selects_ogmios(self):
+        environments = {'preprod': {'EVALUATOR': 'ogmios', 'OGMIOS_URL': self.ogmios.url}}
+        with override_settings(ENVIRONMENTS=environments, OGMIOS={'CONNECT_TIMEOUT': 1.0, 'TIMEOUT': 2.0}):
+            reply = evaluate_transaction("acab", "preprod")
+        self.assertEqual(reply["result"], [{"cbor": "acab"}])
+        self.assertEqual(self.ogmios.requests, 1)
@@ -0,0 +1,55 @@
+# api/tests/test_parsed.py
+from unittest.mock import Mock
+
+import cbor2
+from django.test import TestCase
+from rest_framework.exceptions import ValidationError
+
+from api.parsed import TransactionView
+from api.scanner import map_item_spans, tx_body_span
+from api.tests.test_data import (invalid_tx_body_cbor_spending_collateral,
+                                 valid_tx_body_cbor_with_collateral)
+from api.validators.cbor import CborValidator
+
+
+class TransactionViewTestCase(TestCase):
+
+    def test_fields_match_a_full_decode(self):
+        for cbor_hex in (valid_tx_body_cbor_with_collateral(), invalid_tx_body_cbor_spending_collateral()):
+            tx_bytes = bytes.fromhex(cbor_hex)
+            body = cbor2.loads(tx_bytes)[0]
+            view = TransactionView(tx_bytes, map_item_spans(tx_bytes, tx_body_span(tx_bytes)[0]))
+            self.assertEqual(set(view), set(body))
+            for key in body:
+                self.assertEqual(view[key], body[key])
+                self.assertEqual(type(view[key]), type(body[key]))
+
+    def test_only_read_fields_are_decoded(self):
+        tx_bytes = bytes.fromhex(valid_tx_body_cbor_with_collateral())
+        view = TransactionView(tx_bytes, map_item_spans(tx_bytes, tx_body_span(tx_bytes)[0]))
+        self.assertIsInstance(view[0], set)
+        self.assertEqual(list(view._fields), [0])
+        with self.assertRaises(KeyError):
+            view[99]
+
+    def test_repeated_key_keeps_the_last_value(self):
+        tx_bytes = bytes.fromhex("84a200010002a0f5f6")
+        view = TransactionView(tx_bytes, map_item_spans(tx_bytes, tx_body_span(tx_bytes)[0]))
+        self.assertEqual(dict(view), {0: 2})
+
+    def test_bad_field_is_a_validation_error(self):
+        # key 0 holds a set tag around an int
+        tx_bytes = bytes.fromhex("84a100d9010201a0f5f6")
+        validator = CborValidator(Mock())
+        body = validator.check_tx_body(tx_bytes)
+        with self.assertRaises(ValidationError) as context:
+            validator.check_inputs(body, {})
+        self.assertIn("Invalid CBOR Data In Tx", str(context.exception.detail))
+
+    def test_non_uint_body_key_is_a_validation_error(self):
+        validator = CborValidator(Mock())
+        # a list key, a map key and a text key
+        for cbor_hex in ("84a1810000a0f5f6", "84a1a1000000a0f5f6", "84a1616100a0f5f6"):
+            with self.assertRaises(ValidationError) as context:
+                validator.check_tx_body(bytes.fromhex(cbor_hex))
+            self.assertIn("Invalid CBOR Data In Tx", str(context.exception.detail))
@@ -0,0 +1,117 @@
+# api/tests/test_profiler.py
+import io
+import json
+import os
+import time
+from unittest.mock import Mock, patch
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api import profiler
+from api.profiler import ProfileStore, should_profile
+
+from .test_data import valid_tx_body_cbor_with_collateral
+from .test_provide_collateral import WitnessingTestMixin
+
+
+def slow_evaluation(tx_body_cbor, environment):
+    time.sleep(0.05)
+    return {"result": []}
+
+
+class ProfilerTestCase(WitnessingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient(HTTP_HOST='localhost')
+        self.url = reverse('collateral', kwargs={'environment': 'preprod'})
+        self.profiler_override = override_settings(PROFILER=dict(
+            settings.PROFILER, ENABLED=True, SAMPLE_RATE=1.0, THRESHOLD_MS=20, INTERVAL_MS=1,
+            DIR=os.path.join(self.tmp.name, "profiles"),
+        ))
+        self.profiler_override.enable()
+
+    def tearDown(self):
+        self.profiler_override.disable()
+        super().tearDown()
+
+    @patch("api.validators.transaction.evaluate_transaction", side_effect=slow_evaluation)
+    def test_slow_requests_are_kept(self, mock_evaluate):
+        response = self.client.post(self.url, {'tx_body': valid_tx_body_cbor_with_collateral()}, format='json')
+        self.assertEqual(response.status_code, 200)
+        profiles = self.client.get(reverse('profiles')).json()['profiles']
+        self.assertEqual(len(profiles), 1)
+        self.assertEqual(profiles[0]['path'], self.url)
+        self.assertEqual(profiles[0]['status'], 200)
+        self.assertGreaterEqual(profiles[0]['duration_ms'], 50)
+
+        collapsed = self.client.get(reverse('profile', kwargs={'profile_id': profiles[0]['id']}))
+        self.assertTrue(collapsed['Content-Type'].startswith('text/plain'))
+        # the sampled thread was sleeping in the evaluation
+        self.assertIn('test_profiler.py:slow_evaluation', collapsed.content.decode())
+        for line in collapsed.content.decode().splitlines():
+            stack, count = line.rsplit(' ', 1)
+            self.assertTrue(count.isdigit())
+
+        profile = self.client.get(reverse('profile', kwargs={'profile_id': profiles[0]['id']}), {'format': 'json'}).json()
+        self.assertIn('peak', profile['memory'])
+        self.assertLessEqual(len(profile['memory']['top']), settings.PROFILER['TOP_ALLOCATIONS'])
+
+    @patch("api.validators.transaction.evaluate_transaction", return_value={"result": []})
+    def test_fast_and_unsampled_requests_are_not_kept(self, mock_evaluate):
+        with override_settings(PROFILER=dict(settings.PROFILER, THRESHOLD_MS=60_000)):
+            self.client.post(self.url, {'tx_body': valid_tx_body_cbor_with_collateral()}, format='json')
+        with override_settings(PROFILER=dict(settings.PROFILER, THRESHOLD_MS=0, SAMPLE_RATE=0.0)):
+            self.client.post(self.url, {'tx_body': valid_tx_body_cbor_with_collateral()}, format='json')
+        self.assertEqual(self.client.get(reverse('profiles')).json(), {'profiles': []})
+
+    @patch("api.validators.transaction.evaluate_transaction", side_effect=slow_evaluation)
+    def test_memory_is_traced_for_one_request_at_a_time(self, mock_evaluate):
+        # another sampled request in this process holds tracemalloc
+        with profiler._tracing_lock:
+            self.client.post(self.url, {'tx_body': valid_tx_body_cbor_with_collateral()}, format='json')
+        profiles = self.client.get(reverse('profiles')).json()['profiles']
+        profile = self.client.get(reverse('profile', kwargs={'profile_id': profiles[0]['id']}), {'format': 'json'}).json()
+        self.assertIsNone(profile['memory'])
+        self.assertGreater(profile['samples'], 0)
+
+    def test_only_the_single_endpoint_is_sampled(self):
+        request = Mock(path=reverse('collateral', kwargs={'environment': 'preprod'}))
+        self.assertTrue(should_profile(request))
+        request.path = reverse('collateral_batch', kwargs={'environment': 'preprod'})
+        self.assertFalse(should_profile(request))
+
+    def test_profiles_are_restricted(self):
+        self.assertEqual(self.client.get(reverse('profiles'), REMOTE_ADDR='10.0.0.1').status_code, 404)
+        self.assertEqual(self.client.get(reverse('profiles'), HTTP_X_FORWARDED_FOR='127.0.0.1').status_code, 404)
+        with override_settings(PROFILER=dict(settings.PROFILER, TOKEN='secret')):
+            # loopback still scrapes, anyone else needs the token
+            self.assertEqual(self.client.get(reverse('profiles')).status_code, 200)
+            self.assertEqual(self.client.get(reverse('profiles'), REMOTE_ADDR='10.0.0.1',
+                                             HTTP_AUTHORIZATION='Bearer wrong').status_code, 404)
+            response = self.client.get(reverse('profiles'), REMOTE_ADDR='10.0.0.1', HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(reverse('profile', kwargs={'profile_id': '1-2-3'})).status_code, 404)
+
+    def test_only_the_newest_are_kept(self):
+        store = ProfileStore(os.path.join(self.tmp.name, "kept"), keep=2)
+        for started in (1.0, 2.0, 3.0):
+            store.save({'started': started, 'path': '/preprod/collateral/', 'status': 200,
+                        'duration_ms': 600.0, 'samples': 1, 'collapsed': 'a;b 1\n'})
+        self.assertEqual([summary['started'] for summary in store.summaries()], [3.0, 2.0])
+        self.assertIsNone(store.load('../kept'))
+
+    @patch("api.validators.transaction.evaluate_transaction", side_effect=slow_evaluation)
+    def test_command_lists_and_prints(self, mock_evaluate):
+        self.client.post(self.url, {'tx_body': valid_tx_body_cbor_with_collateral()}, format='json')
+        out = io.StringIO()
+        call_command('profiles', '--json', stdout=out)
+        profiles = json.loads(out.getvalue())
+        self.assertEqual(len(profiles), 1)
+        out = io.StringIO()
+        call_command('profiles', profiles[0]['id'], stdout=out)
+        self.assertIn('slow_evaluation', out.getvalue())
@@ -1,14 +1,25 @@
 # api/tests.py
+import json
+import os
+import tempfile
+from unittest.mock import patch
+
 from django.core.cache import cache
-from django.test import TestCase
+from django.test import (AsyncRequestFactory, RequestFactory, TestCase,
+                         override_settings)
 from django.urls import reverse
 from rest_framework.test import APIClient
 
+from api.signature import create_witness_cbor, sign, tx_id
+from api.views import (AsyncProvideCollateralView, LeanProvideCollateralView,
+                       ProvideCollateralView)
+
 from .test_data import (invalid_tx_body_cbor_is_lying,
                         invalid_tx_body_cbor_missing_inputs,
                         invalid_tx_body_cbor_spending_collateral,
                         invalid_tx_body_missing_collateral,
-                        valid_tx_body_cbor_but_no_collateral)
+                        valid_tx_body_cbor_but_no_collateral,
+                        valid_tx_body_cbor_with_collateral)
 
 
 class ProvideCollateralTestCase(TestCase):
@@ -55,3 +66,232 @@ class ProvideCollateralTestCase(TestCase):
         }
         response = self.client.post(self.url, data, format='json')
         self.assertEqual(response.status_code, 400)
+
+
+class WitnessingTestMixin:
+    """Temporary keys and settings that match valid_tx_body_cbor_with_collateral."""
+    sk = "abffdc040fd4c5d3eb6ce962a968f57995edfb33c78a11a466446a649f3ed82c"
+    pk = "51c20cf4a8ed0e13cd65026625fe59d7ee8f8ef274a3d5575f8c30f9732cb3ed"
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        skey_path = os.path.join(self.tmp.name, "payment.skey")
+        vkey_path = os.path.join(self.tmp.name, "payment.vkey")
+        with open(skey_path, "w") as file:
+            json.dump({"cborHex": "5820" + self.sk}, file)
+        with open(vkey_path, "w") as file:
+            json.dump({"cborHex": "5820" + self.pk}, file)
+        self.settings_override = override_settings(
+            PKH='c59da4ec6e515c2efc8866274dee6ac9a64b5945efd365f3a999e760',
+            SKEY_PATH=skey_path,
+            VKEY_PATH=vkey_path,
+            ENVIRONMENTS={
+                'preprod': {
+                    'NETWORK': '--testnet-magic 1',
+                    'TXID': '1e0b413409dd9591b2a69bca80d7d776e8bb5130f02af0bf886e08ce5b6e183a',
+                    'TXIDX': 0,
+                },
+            },
+        )
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmp.cleanup()
+        cache.clear()
+
+
+class ProvideCollateralSuccessTestCase(WitnessingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient(HTTP_HOST='localhost')
+        self.url = reverse('collateral', kwargs={'environment': 'preprod'})
+
+    @patch("api.validators.transaction.evaluate_transaction", return_value={"result": []})
+    def test_valid_tx_body_is_witnessed(self, mock_evaluate):
+        tx_cbor = valid_tx_body_cbor_with_collateral()
+        response = self.client.post(self.url, {'tx_body': tx_cbor}, format='json')
+        self.assertEqual(response.status_code, 200)
+        witness = create_witness_cbor(self.pk, sign(self.sk, tx_id(tx_cbor)))
+        self.assertEqual(response.json(), {'witness': witness})
+        mock_evaluate.assert_called_once_with(tx_cbor, 'preprod')
+
+    @patch("api.validators.transaction.evaluate_transaction", return_value={"result": []})
+    def test_retry_is_served_from_the_verdict_cache(self, mock_evaluate):
+        tx_cbor = valid_tx_body_cbor_with_collateral()
+        first = self.client.post(self.url, {'tx_body': tx_cbor}, format='json')
+        with patch("api.signature.Signer.witness") as mock_witness:
+            second = self.client.post(self.url, {'tx_body': tx_cbor}, format='json')
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(first.json(), second.json())
+        # neither the upstream nor the signer ran for the retry
+        mock_evaluate.assert_called_once()
+        mock_witness.assert_not_called()
+
+    @patch("api.validators.transaction.evaluate_transaction", return_value={"error": {"code": 3010}})
+    def test_failing_verdict_is_cached(self, mock_evaluate):
+        tx_cbor = valid_tx_body_cbor_with_collateral()
+        for _ in range(2):
+            response = self.client.post(self.url, {'tx_body': tx_cbor}, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'tx_body': ['Transaction Fails Validation']})
+        mock_evaluate.assert_called_once()
+
+
+class BatchCollateralTestCase(WitnessingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient(HTTP_HOST='localhost')
+        self.url = reverse('collateral_batch', kwargs={'environment': 'preprod'})
+
+    def post(self, tx_bodies):
+        response = self.client.post(self.url, {'tx_bodies': tx_bodies}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        return sorted((json.loads(line) for line in lines), key=lambda line: line['index'])
+
+    @patch("api.validators.transaction.evaluate_transaction", return_value={"result": []})
+    def test_each_tx_gets_its_own_line(self, mock_evaluate):
+        tx_cbor = valid_tx_body_cbor_with_collateral()
+        lines = self.post([tx_cbor, 'acab', invalid_tx_body_missing_collateral()])
+        witness = create_witness_cbor(self.pk, sign(self.sk, tx_id(tx_cbor)))
+        self.assertEqual(lines, [
+            {'index': 0, 'witness': witness},
+            {'index': 1, 'error': {'tx_body': ['Invalid CBOR Data In Tx']}},
+            {'index': 2, 'error': {'tx_body': ['Collateral Is Not Being Used In Tx']}},
+        ])
+        # only the tx that passed the local checks reached the upstream
+        mock_evaluate.assert_called_once_with(tx_cbor, 'preprod')
+
+    @patch("api.validators.transaction.evaluate_transaction", return_value={"error": {"code": 3010}})
+    def test_failing_tx_matches_single_error_shape(self, mock_evaluate):
+        lines = self.post([valid_tx_body_cbor_with_collateral()])
+        self.assertEqual(lines, [{'index': 0, 'error': {'tx_body': ['Transaction Fails Validation']}}])
+
+    def test_invalid_batches(self):
+        response = self.client.post(self.url, {'tx_bodies': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('tx_bodies', response.json())
+        with self.settings(BATCH={'MAX_SIZE': 2, 'WORKERS': 2}):
+            response = self.client.post(self.url, {'tx_bodies': ['acab'] * 3}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'tx_bodies': ['Batch Exceeds 2 Transactions']})
+
+    def test_every_tx_counts_against_the_rate_limit(self):
+        lines = self.post(['acab'] * 50)
+        self.assertEqual(len(lines), 50)
+        response = self.client.post(self.url, {'tx_bodies': ['acab'] * 11}, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(len(self.post(['acab'] * 10)), 10)
+
+
+class AsyncProvideCollateralTestCase(WitnessingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.factory = AsyncRequestFactory()
+        self.view = AsyncProvideCollateralView.as_view()
+
+    async def post(self, data, content_type='application/json'):
+        body = data if isinstance(data, str) else json.dumps(data)
+        request = self.factory.post('/preprod/collateral/', body, content_type=content_type, REMOTE_ADDR='10.0.0.1')
+        response = await self.view(request, environment='preprod')
+        return response.status_code, json.loads(response.content)
+
+    @patch("api.validators.transaction.evaluate_transaction_async", return_value={"result": []})
+    async def test_valid_tx_body_is_witnessed(self, mock_evaluate):
+        tx_cbor = valid_tx_body_cbor_with_collateral()
+        status_code, data = await self.post({'tx_body': tx_cbor})
+        self.assertEqual(status_code, 200)
+        self.assertEqual(data, {'witness': create_witness_cbor(self.pk, sign(self.sk, tx_id(tx_cbor)))})
+        mock_evaluate.assert_awaited_once_with(tx_cbor, 'preprod')
+
+    @patch("api.validators.transaction.evaluate_transaction_async", return_value={"error": {"code": 3010}})
+    async def test_failing_tx_matches_sync_error_shape(self, mock_evaluate):
+        status_code, data = await self.post({'tx_body': valid_tx_body_cbor_with_collateral()})
+        self.assertEqual(status_code, 400)
+        self.assertEqual(data, {'tx_body': ['Transaction Fails Validation']})
+
+    async def test_local_check_errors(self):
+        self.assertEqual(await self.post({}), (400, {'tx_body': ['This field is required.']}))
+        self.assertEqual(await self.post({'tx_body': '  '}), (400, {'tx_body': ['This field may not be blank.']}))
+        self.assertEqual(await self.post({'tx_body': 'acab'}), (400, {'tx_body': ['Invalid CBOR Data In Tx']}))
+
+    async def test_invalid_json(self):
+        status_code, data = await self.post('{')
+        self.assertEqual(status_code, 400)
+        self.assertIn('JSON parse error', data['detail'])
+
+    async def test_method_not_allowed(self):
+        request = self.factory.get('/preprod/collateral/')
+        response = await self.view(request, environment='preprod')
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(json.loads(response.content), {"detail": "Method Not Allowed"})
+
+
+class LeanProvideCollateralTestCase(WitnessingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.factory = RequestFactory()
+        self.view = LeanProvideCollateralView.as_view()
+
+    def post(self, data, content_type='application/json', environment='preprod'):
+        body = data if isinstance(data, str) else json.dumps(data)
+        request = self.factory.post('/preprod/collateral/', body, content_type=content_type, REMOTE_ADDR='10.0.0.2')
+        response = self.view(request, environment=environment)
+        return response.status_code, json.loads(response.content)
+
+    @patch("api.validators.transaction.evaluate_transaction", return_value={"result": []})
+    def test_valid_tx_body_is_witnessed(self, mock_evaluate):
+        tx_cbor = valid_tx_body_cbor_with_collateral()
+        status_code, data = self.post({'tx_body': tx_cbor})
+        self.assertEqual(status_code, 200)
+        self.assertEqual(data, {'witness': create_witness_cbor(self.pk, sign(self.sk, tx_id(tx_cbor)))})
+
+    @patch("api.validators.transaction.evaluate_transaction", return_value={"error": {"code": 3010}})
+    def test_errors_match_the_drf_view(self, mock_evaluate):
+        self.assertEqual(self.post({'tx_body': valid_tx_body_cbor_with_collateral()}), (400, {'tx_body': ['Transaction Fails Validation']}))
+        self.assertEqual(self.post({}), (400, {'tx_body': ['This field is required.']}))
+        self.assertEqual(self.post({'tx_body': 'acab'}), (400, {'tx_body': ['Invalid CBOR Data In Tx']}))
+        self.assertEqual(self.post({'tx_body': 'acab'}, environment='nope'), (400, {'error': 'Invalid Environment'}))
+        status_code, data = self.post('{')
+        self.assertEqual(status_code, 400)
+        self.assertIn('JSON parse error', data['detail'])
+
+    def test_media_types_match_the_drf_view(self):
+        drf_view = ProvideCollateralView.as_view()
+        bodies = (
+            ('tx_body=acab', 'text/plain'),
+            ('<tx_body>acab</tx_body>', 'application/xml'),
+            ('tx_body=acab', 'application/x-www-form-urlencoded'),
+            ('', 'text/plain'),
+        )
+        for body, content_type in bodies:
+            responses = []
+            for view in (drf_view, self.view):
+                request = self.factory.post('/preprod/collateral/', body, content_type=content_type, REMOTE_ADDR='10.0.0.3')
+                response = view(request, environment='preprod')
+                if hasattr(response, 'render'):
+                    response.render()
+                responses.append((response.status_code, json.loads(response.content)))
+            self.assertEqual(responses[0], responses[1], content_type)
+        self.assertEqual(responses[0][0], 400)
+        self.assertEqual(self.post('tx_body=acab', content_type='text/plain'),
+                         (415, {'detail': 'Unsupported media type "text/plain" in request.'}))
+
+    def test_throttled_and_method_not_allowed(self):
+        response = self.view(self.factory.get('/preprod/collateral/'), environment='preprod')
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(json.loads(response.content), {"detail": "Method Not Allowed"})
+        with patch("api.views.ProvideCollateralThrottle.rate", "1/min"):
+            self.post({})
+            request = self.factory.post('/preprod/collateral/', '{}', content_type='application/json', REMOTE_ADDR='10.0.0.2')
+            response = self.view(request, environment='preprod')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+        self.assertEqual(response['X-RateLimit-Remaining'], '0')
+        self.assertIn('throttled', json.loads(response.content)['detail'])
@@ -0,0 +1,84 @@
+# api/tests/test_scanner.py
+import cbor2
+from django.test import TestCase
+
+from api.scanner import (CBORBudgetError, CBORScanError, array_item_span,
+                         item_end, map_item_spans, scan_tx, tx_body_span)
+from api.tests.test_data import valid_tx_body_cbor_with_collateral
+
+
+class ScannerTestCase(TestCase):
+
+    def test_item_end_matches_encoding_length(self):
+        items = [
+            0, 23, 24, 2**32, -1, b"", b"\x00" * 300, "acab", [], [1, [2, [3]]],
+            {1: {2: b"\x01"}}, {0, 1}, cbor2.CBORTag(121, [1, 2]), True, None, 1.5,
+        ]
+        for item in items:
+            data = cbor2.dumps(item)
+            self.assertEqual(item_end(data + b"\x00"), len(data))
+
+    def test_indefinite_lengths(self):
+        # [_ 1, (_ h'01', h'02'), {_ 1: 2}]
+        data = bytes.fromhex("9f01 5f41014102ff bf0102ff ff".replace(" ", ""))
+        self.assertEqual(item_end(data), len(data))
+        self.assertEqual(array_item_span(data, 1), (2, 8))
+
+    def test_truncated_cbor(self):
+        with self.assertRaises(CBORScanError):
+            item_end(bytes.fromhex("8301"))
+        with self.assertRaises(CBORScanError):
+            item_end(bytes.fromhex("5820acab"))
+
+    def test_unexpected_break(self):
+        with self.assertRaises(CBORScanError):
+            item_end(bytes.fromhex("81ff"))
+
+    def test_not_an_array(self):
+        with self.assertRaises(CBORScanError):
+            tx_body_span(bytes.fromhex("a0"))
+
+    def test_tx_body_span_matches_decoded_body(self):
+        tx_bytes = bytes.fromhex(valid_tx_body_cbor_with_collateral())
+        start, end = tx_body_span(tx_bytes)
+        self.assertEqual(cbor2.loads(tx_bytes[start:end]), cbor2.loads(tx_bytes)[0])
+
+    def test_non_canonical_body_is_kept_as_is(self):
+        # the same map with a non-minimal length encoding
+        body = bytes.fromhex("b8010000")
+        tx_bytes = bytes.fromhex("84") + body + bytes.fromhex("a0f5f6")
+        start, end = tx_body_span(tx_bytes)
+        self.assertEqual(tx_bytes[start:end], body)
+
+    def test_scan_tx_spans(self):
+        tx_bytes = bytes.fromhex(valid_tx_body_cbor_with_collateral())
+        scan = scan_tx(tx_bytes, 64, 10000)
+        self.assertEqual(scan.major, 4)
+        self.assertEqual(len(scan.spans), 4)
+        self.assertEqual(scan.spans[0], tx_body_span(tx_bytes))
+        self.assertEqual(tx_bytes[scan.spans[2][0]:scan.spans[2][1]], b"\xf5")
+        self.assertEqual(scan.body_entries, map_item_spans(tx_bytes, scan.spans[0][0]))
+
+    def test_scan_tx_depth_budget(self):
+        nested = b"\x81" * 100 + b"\x00"
+        tx_bytes = b"\x84\xa0" + nested + b"\xf5\xf6"
+        with self.assertRaises(CBORBudgetError):
+            scan_tx(tx_bytes, 64, 10000)
+        self.assertEqual(len(scan_tx(tx_bytes, 128, 10000).spans), 4)
+        # tags nest too
+        with self.assertRaises(CBORBudgetError):
+            scan_tx(b"\x84\xa0" + b"\xc1" * 100 + b"\x00\xf5\xf6", 64, 10000)
+
+    def test_scan_tx_item_budget(self):
+        tx_bytes = b"\x84\xa0\x99\x01\x00" + b"\x00" * 256 + b"\xf5\xf6"
+        with self.assertRaises(CBORBudgetError):
+            scan_tx(tx_bytes, 64, 100)
+        self.assertEqual(len(scan_tx(tx_bytes, 64, 300).spans), 4)
+        # the budget covers the body entries too
+        with self.assertRaises(CBORBudgetError):
+            scan_tx(b"\x84\xa1\x00\x99\x01\x00" + b"\x00" * 256 + b"\xa0\xf5\xf6", 64, 100)
+
+    def test_scan_tx_not_an_array(self):
+        self.assertEqual(scan_tx(b"\xa0", 64, 10000), (5, [], None))
+        with self.assertRaises(CBORScanError):
+            scan_tx(b"\xa1\x00", 64, 10000)
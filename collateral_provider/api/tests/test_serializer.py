@@ -1,9 +1,13 @@
 # api/tests/test_serializers.py
 
+from unittest.mock import patch
+
 from django.conf import settings
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from api.serializers import ProvideCollateralSerializer
+from api.signature import tx_id
+from api.verdicts import Verdict
 
 from .test_big_data import invalid_tx_body_too_big
 from .test_data import (invalid_tx_body_cbor_is_invalid_is_set,
@@ -11,7 +15,8 @@ from .test_data import (invalid_tx_body_cbor_is_invalid_is_set,
                         invalid_tx_body_cbor_missing_inputs,
                         invalid_tx_body_cbor_spending_collateral,
                         invalid_tx_body_missing_collateral,
-                        valid_tx_body_cbor_but_no_collateral)
+                        valid_tx_body_cbor_but_no_collateral,
+                        valid_tx_body_cbor_with_collateral)
 
 
 class ProvideCollateralSerializerTestCase(TestCase):
@@ -143,3 +148,28 @@ class ProvideCollateralSerializerTestCase(TestCase):
         )
         # serializer doesn't know
         self.assertFalse(serializer.is_valid())
+
+    @override_settings(PKH='c59da4ec6e515c2efc8866274dee6ac9a64b5945efd365f3a999e760')
+    @patch("api.pipeline.TransactionValidator.check_valid_tx", return_value=Verdict(True, None, None))
+    def test_valid_tx_body_is_parsed_once(self, mock_check_valid_tx):
+        data = {
+            'tx_body': valid_tx_body_cbor_with_collateral(),
+        }
+        serializer = ProvideCollateralSerializer(
+            data=data,
+            context={
+                'environment': self.environment,
+                'env_settings': {
+                    'TXID': '1e0b413409dd9591b2a69bca80d7d776e8bb5130f02af0bf886e08ce5b6e183a',
+                    'TXIDX': 0,
+                },
+                'ip_address': self.ip_address,
+                'networks': self.networks,
+            }
+        )
+        self.assertTrue(serializer.is_valid())
+        tx = serializer.validated_data['tx']
+        # the evaluator and the signer share the parsed transaction
+        mock_check_valid_tx.assert_called_once_with(tx.cbor_hex, self.environment, tx.tx_hash)
+        self.assertEqual(tx.tx_id, tx_id(valid_tx_body_cbor_with_collateral()))
+        self.assertEqual(tx.tx_bytes, bytes.fromhex(valid_tx_body_cbor_with_collateral()))
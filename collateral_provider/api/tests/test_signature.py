@@ -1,6 +1,10 @@
 # api/tests.py
+import json
+import os
+import tempfile
+
 from django.test import TestCase
-from api.signature import verify, sign, tx_id, create_witness_cbor
+from api.signature import verify, sign, tx_id, create_witness_cbor, Signer, witness_tx_cbor
 from api.tests.test_data import valid_tx_body_cbor_with_collateral, invalid_tx_body_missing_collateral
 
 class SignatureTestCase(TestCase):
@@ -52,3 +56,44 @@ class SignatureTestCase(TestCase):
         answer = "820082582051c20cf4a8ed0e13cd65026625fe59d7ee8f8ef274a3d5575f8c30f9732cb3ed584077589916b53ea6abfb4e9793770bf5fbb0bbe153046e12b91365832f2c1558aec34dcf8544b15fbdd1946b32b10b38dfa70defaeb827d98a4f959539000df502"
         self.assertEqual(witness_cbor, answer)
 
+
+
+class SignerTestCase(TestCase):
+
+    def setUp(self):
+        self.sk = "abffdc040fd4c5d3eb6ce962a968f57995edfb33c78a11a466446a649f3ed82c"
+        self.pk = "51c20cf4a8ed0e13cd65026625fe59d7ee8f8ef274a3d5575f8c30f9732cb3ed"
+        self.tmp = tempfile.TemporaryDirectory()
+        self.skey_path = os.path.join(self.tmp.name, "payment.skey")
+        self.vkey_path = os.path.join(self.tmp.name, "payment.vkey")
+        self.write_keys(self.sk, self.pk)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_keys(self, sk, pk):
+        with open(self.skey_path, "w") as file:
+            json.dump({"type": "PaymentSigningKeyShelley_ed25519", "cborHex": "5820" + sk}, file)
+        with open(self.vkey_path, "w") as file:
+            json.dump({"type": "PaymentVerificationKeyShelley_ed25519", "cborHex": "5820" + pk}, file)
+
+    def test_resident_witness_matches_reference(self):
+        tx_hash = tx_id(valid_tx_body_cbor_with_collateral())
+        signer = Signer(self.skey_path, self.vkey_path)
+        answer = create_witness_cbor(self.pk, sign(self.sk, tx_hash))
+        self.assertEqual(signer.witness(bytes.fromhex(tx_hash)), answer)
+
+    def test_witness_tx_cbor_uses_resident_signer(self):
+        witness_cbor = witness_tx_cbor(valid_tx_body_cbor_with_collateral(), self.skey_path, self.vkey_path)
+        answer = "820082582051c20cf4a8ed0e13cd65026625fe59d7ee8f8ef274a3d5575f8c30f9732cb3ed584077589916b53ea6abfb4e9793770bf5fbb0bbe153046e12b91365832f2c1558aec34dcf8544b15fbdd1946b32b10b38dfa70defaeb827d98a4f959539000df502"
+        self.assertEqual(witness_cbor, answer)
+
+    def test_signer_reloads_when_marked_stale(self):
+        signer = Signer(self.skey_path, self.vkey_path)
+        new_sk = "7ee70c8ff8cabd12e8453c942d65d5d5b504cc658028981f5ec16664d7b0acbd"
+        new_pk = signer.public_key.hex()
+        self.write_keys(new_sk, new_pk)
+        signer.mark_stale()
+        msg = "acab"
+        witness = signer.witness(bytes.fromhex(msg))
+        self.assertEqual(witness, create_witness_cbor(new_pk, sign(new_sk, msg)))
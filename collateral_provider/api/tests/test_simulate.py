@@ -0,0 +1,186 @@
+# api/tests/test_simulate.py
+import asyncio
+import json
+import threading
+import time
+from unittest.mock import Mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.test import TestCase, override_settings
+from rest_framework.exceptions import ValidationError
+
+from api.async_http import AsyncJSONPool
+from api.simulate import (EvaluationUnavailable, close_sessions, evaluate_transaction,
+                          evaluate_transaction_async, get_session)
+from api.validators.transaction import TransactionValidator
+from api.verdicts import get_verdict_cache
+
+
+class StubKoiosHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        server.requests += 1
+        server.peers.add(self.client_address)
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if server.failures > 0:
+            server.failures -= 1
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        time.sleep(server.delay)
+        payload = json.dumps({"jsonrpc": "2.0", "result": [], "echo": body["params"]["transaction"]["cbor"]}).encode()
+        if server.reply is not None:
+            status, reply = server.reply
+            payload = json.dumps(reply).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        if server.chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for chunk in (payload[:5], payload[5:]):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.write(b"0\r\n\r\n")
+            return
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubKoiosServer(ThreadingHTTPServer):
+
+    def handle_error(self, request, client_address):
+        # a client that timed out hangs up before the reply, that's the point of those tests
+        pass
+
+
+class EvaluateTransactionTestCase(TestCase):
+
+    def setUp(self):
+        self.server = StubKoiosServer(("127.0.0.1", 0), StubKoiosHandler)
+        self.server.requests = 0
+        self.server.peers = set()
+        self.server.failures = 0
+        self.server.delay = 0
+        self.server.chunked = False
+        self.server.reply = None
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{self.server.server_port}/api/v1/ogmios"
+        self.settings_override = override_settings(
+            ENVIRONMENTS={'preprod': {'KOIOS_URL': url}},
+            KOIOS={
+                'CONNECT_TIMEOUT': 1.0,
+                'READ_TIMEOUT': 0.2,
+                'RETRIES': 2,
+                'BACKOFF_FACTOR': 0,
+                'POOL_SIZE': 2,
+                'ASYNC_POOL_SIZE': 2,
+            },
+        )
+        self.settings_override.enable()
+        close_sessions()
+
+    def tearDown(self):
+        close_sessions()
+        self.settings_override.disable()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_is_reused(self):
+        self.assertEqual(evaluate_transaction("acab", "preprod")["echo"], "acab")
+        self.assertEqual(evaluate_transaction("abba", "preprod")["echo"], "abba")
+        self.assertEqual(self.server.requests, 2)
+        # both requests went over one keep-alive connection
+        self.assertEqual(len(self.server.peers), 1)
+        self.assertIs(get_session("preprod"), get_session("preprod"))
+
+    def test_unavailable_status_is_retried(self):
+        self.server.failures = 2
+        self.assertIn("result", evaluate_transaction("acab", "preprod"))
+        self.assertEqual(self.server.requests, 3)
+
+    def test_slow_upstream_times_out(self):
+        self.server.delay = 1.0
+        start = time.monotonic()
+        with self.assertRaises(EvaluationUnavailable):
+            evaluate_transaction("acab", "preprod")
+        # three bounded attempts, not one unbounded wait
+        self.assertLess(time.monotonic() - start, 3 * self.server.delay)
+
+    def test_async_connection_is_reused(self):
+        async def main():
+            first = await evaluate_transaction_async("acab", "preprod")
+            self.server.chunked = True
+            second = await evaluate_transaction_async("abba", "preprod")
+            return first, second
+        first, second = asyncio.run(main())
+        self.assertEqual((first["echo"], second["echo"]), ("acab", "abba"))
+        self.assertEqual(len(self.server.peers), 1)
+
+    def test_async_unavailable_status_is_retried(self):
+        self.server.failures = 2
+        self.assertIn("result", asyncio.run(evaluate_transaction_async("acab", "preprod")))
+        self.assertEqual(self.server.requests, 3)
+
+    def test_async_slow_upstream_times_out(self):
+        self.server.delay = 1.0
+        with self.assertRaises(EvaluationUnavailable):
+            asyncio.run(evaluate_transaction_async("acab", "preprod"))
+
+    def test_async_cancelled_exchange_closes_connection(self):
+        self.server.delay = 0.1
+        pool = AsyncJSONPool(f"http://127.0.0.1:{self.server.server_port}/api/v1/ogmios", 1, 1.0, 1.0)
+        opened = []
+
+        async def main():
+            open_connection = pool._open
+
+            async def record():
+                opened.append(await open_connection())
+                return opened[-1]
+            pool._open = record
+            task = asyncio.ensure_future(pool.post_json({"params": {"transaction": {"cbor": "acab"}}}))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        asyncio.run(main())
+        # closed, not left half read for the next request to pick up
+        self.assertEqual(pool._idle, [])
+        self.assertTrue(opened[0][1].is_closing())
+
+    def test_upstream_errors_are_not_cached_as_verdicts(self):
+        validator = TransactionValidator(Mock())
+        cache = get_verdict_cache()
+        for index, reply in enumerate([
+            (429, {"detail": "rate limited"}),
+            (500, {"jsonrpc": "2.0", "error": {"code": -32603, "message": "internal"}}),
+        ]):
+            self.server.reply = reply
+            tx_hash = bytes([index]) * 32
+            with self.assertRaises(ValidationError):
+                validator.check_valid_tx("acab", "preprod", tx_hash)
+            with self.assertRaises(ValidationError):
+                asyncio.run(validator.check_valid_tx_async("acab", "preprod", tx_hash))
+            self.assertIsNone(cache.get("preprod", tx_hash))
+
+    def test_evaluation_errors_are_cached(self):
+        # a tx that fails to evaluate may come back as a 400 with the JSON-RPC error
+        self.server.reply = (400, {"jsonrpc": "2.0", "error": {"code": 3010, "message": "failed"}})
+        with self.assertRaises(ValidationError):
+            TransactionValidator(Mock()).check_valid_tx("acab", "preprod", b"\x07" * 32)
+        self.assertFalse(get_verdict_cache().get("preprod", b"\x07" * 32).ok)
+        self.server.reply = (400, {"detail": "bad request"})
+        with self.assertRaises(EvaluationUnavailable):
+            evaluate_transaction("acab", "preprod")
@@ -0,0 +1,141 @@
+# api/tests/test_singleflight.py
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+
+from api.singleflight import (AsyncSingleFlight, LockTable, SingleFlight, coalesce,
+                             coalesce_async)
+from api.store import SharedStore
+
+
+class SingleFlightTestCase(TestCase):
+
+    def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight()
+        calls = []
+        started = threading.Event()
+
+        def work():
+            calls.append(1)
+            started.set()
+            time.sleep(0.2)
+            return "witness"
+
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            first = pool.submit(flight.do, "key", work)
+            started.wait()
+            rest = [pool.submit(flight.do, "key", work) for _ in range(4)]
+            results = [first.result()] + [f.result() for f in rest]
+        self.assertEqual(results, ["witness"] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_error_is_shared(self):
+        flight = SingleFlight()
+        started = threading.Event()
+
+        def work():
+            started.set()
+            time.sleep(0.1)
+            raise ValueError("bad tx")
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            first = pool.submit(flight.do, "key", work)
+            started.wait()
+            second = pool.submit(flight.do, "key", work)
+            with self.assertRaises(ValueError):
+                first.result()
+            with self.assertRaises(ValueError):
+                second.result()
+
+    def test_next_call_runs_again(self):
+        flight = SingleFlight()
+        self.assertEqual(flight.do("key", lambda: 1), 1)
+        self.assertEqual(flight.do("key", lambda: 2), 2)
+
+    def test_async_callers_share_one_call(self):
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "witness"
+
+        async def run():
+            return await asyncio.gather(*(coalesce_async("key", work, None) for _ in range(10)))
+
+        self.assertEqual(asyncio.run(run()), ["witness"] * 10)
+        self.assertEqual(len(calls), 1)
+
+    def test_async_cancelled_leader_is_not_shared(self):
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "witness"
+
+        async def run():
+            leader = asyncio.ensure_future(flight.do("key", work))
+            await asyncio.sleep(0)
+            followers = [asyncio.ensure_future(flight.do("key", work)) for _ in range(3)]
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            return await asyncio.gather(*followers)
+
+        # the followers start the call again instead of getting the leader's cancellation
+        self.assertEqual(asyncio.run(run()), ["witness"] * 3)
+        self.assertEqual(len(calls), 2)
+
+
+class LockTableTestCase(TestCase):
+
+    def setUp(self):
+        # the store coalesce finds through settings
+        self.path = settings.SHARED_STORE_PATH
+        self.locks = LockTable(SharedStore(self.path), ttl=30)
+        # a second worker sees the same file under another pid
+        self.other = LockTable(SharedStore(self.path), ttl=30)
+        self.other.owner = "other"
+
+    def test_one_holder_per_key(self):
+        self.assertTrue(self.locks.acquire("key"))
+        self.assertFalse(self.other.acquire("key"))
+        self.assertTrue(self.other.acquire("another"))
+        self.locks.release("key")
+        self.assertTrue(self.other.acquire("key"))
+
+    def test_release_only_drops_own_lease(self):
+        self.assertTrue(self.other.acquire("key"))
+        self.locks.release("key")
+        self.assertFalse(self.locks.acquire("key"))
+
+    def test_dead_holder_lease_expires(self):
+        self.assertTrue(self.other.acquire("key"))
+        with patch("api.singleflight.time.time", return_value=time.time() + 31):
+            self.assertTrue(self.locks.acquire("key"))
+
+    def test_waiter_takes_result_of_other_worker(self):
+        self.assertTrue(self.other.acquire("key"))
+        published = []
+        threading.Timer(0.1, published.append, ("witness",)).start()
+        config = {'ACROSS_WORKERS': True, 'WAIT': 5.0, 'POLL_INTERVAL': 0.01, 'LOCK_TTL': 30.0}
+        with override_settings(SINGLE_FLIGHT=config):
+            result = coalesce("key", lambda: self.fail("the other worker is evaluating"),
+                              lambda: published[0] if published else None)
+        self.assertEqual(result, "witness")
+
+    def test_waiter_runs_itself_when_lease_is_dropped(self):
+        self.assertTrue(self.other.acquire("key"))
+        threading.Timer(0.1, self.other.release, ("key",)).start()
+        config = {'ACROSS_WORKERS': True, 'WAIT': 5.0, 'POLL_INTERVAL': 0.01, 'LOCK_TTL': 30.0}
+        with override_settings(SINGLE_FLIGHT=config):
+            result = coalesce("key", lambda: "own", lambda: None)
+        self.assertEqual(result, "own")
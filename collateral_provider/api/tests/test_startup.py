@@ -0,0 +1,31 @@
+# api/tests/test_startup.py
+import os
+import subprocess
+import sys
+import unittest
+
+from django.conf import settings
+
+# a fresh worker booting the app, reporting the modules it loaded
+BOOT = """
+import os, sys
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'collateral_provider.settings')
+from django.core.wsgi import get_wsgi_application
+get_wsgi_application()
+import collateral_provider.urls
+print(' '.join(sys.modules))
+"""
+
+
+class StartupTestCase(unittest.TestCase):
+
+    def test_worker_does_not_load_heavy_modules(self):
+        result = subprocess.run(
+            [sys.executable, '-c', BOOT], cwd=settings.BASE_DIR, capture_output=True, text=True,
+            env=dict(os.environ, DJANGO_SETTINGS_MODULE='collateral_provider.settings'),
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        modules = set(result.stdout.split())
+        self.assertIn('api.views', modules)
+        for heavy in ('pycardano', 'websockets', 'django.contrib.auth.models', 'django.contrib.sessions.models'):
+            self.assertNotIn(heavy, modules)
@@ -0,0 +1,62 @@
+# api/tests/test_synthetic.py
+import logging
+
+from django.test import TestCase
+from rest_framework import serializers
+
+from api.validators.cbor import CborValidator
+from api.validators.plan import compile_plan
+
+from api.synthetic import (DEFAULT_COLLATERAL, DEFAULT_PKH, MAX_TX_SIZE,
+                           SHAPES, TxShape, synthetic_tx)
+
+logger = logging.getLogger('api.tests')
+
+
+class SyntheticTxTestCase(TestCase):
+
+    def setUp(self):
+        self.validator = CborValidator(logger)
+        env_settings = {'TXID': DEFAULT_COLLATERAL[0], 'TXIDX': DEFAULT_COLLATERAL[1]}
+        self.plan = compile_plan('preprod', env_settings, DEFAULT_PKH)
+
+    def check(self, tx_cbor):
+        tx_bytes = self.validator.check_cbor_hex(tx_cbor)
+        body = self.validator.check_tx_body(tx_bytes)
+        self.validator.check_body(body, self.plan)
+        return tx_bytes
+
+    def test_every_shape_passes_the_checks(self):
+        for name, shape in SHAPES.items():
+            with self.subTest(name):
+                self.check(synthetic_tx(shape, seed=1))
+
+    def test_seeds_are_reproducible(self):
+        shape = SHAPES['typical']
+        self.assertEqual(synthetic_tx(shape, seed=5), synthetic_tx(shape, seed=5))
+        self.assertNotEqual(synthetic_tx(shape, seed=5), synthetic_tx(shape, seed=6))
+
+    def test_shapes_are_controlled(self):
+        body = self.validator.check_tx_body(bytes.fromhex(synthetic_tx(
+            TxShape(inputs=5, outputs=7, reference_inputs=2, assets=3, tokens=2, datums=4), seed=2
+        )))
+        self.assertEqual(len(body[0]), 5)
+        self.assertEqual(len(body[1]), 7)
+        self.assertEqual(len(body[18]), 2)
+        # post alonzo outputs with an inline datum, the rest are legacy
+        self.assertEqual(sum(isinstance(output, dict) and 2 in output for output in body[1]), 4)
+        self.assertEqual(len(body[1][-1][1][1]), 3)
+
+    def test_size_stays_under_the_limit(self):
+        tx_bytes = self.check(synthetic_tx(SHAPES['max'], seed=3))
+        self.assertLessEqual(len(tx_bytes), MAX_TX_SIZE)
+        self.assertGreater(len(tx_bytes), MAX_TX_SIZE - 512)
+
+    def test_collateral_and_signer_can_be_left_out(self):
+        with self.assertRaisesMessage(serializers.ValidationError, 'Collateral Does Not Exist In Body'):
+            self.check(synthetic_tx(TxShape(collateral=False)))
+        with self.assertRaisesMessage(serializers.ValidationError, 'Required Signers Does Not Exist In Body'):
+            self.check(synthetic_tx(TxShape(signer=False)))
+        # another provider's collateral is in the tx, not this one's
+        with self.assertRaisesMessage(serializers.ValidationError, 'Collateral Is Not Being Used In Tx'):
+            self.check(synthetic_tx(collateral=('00' * 32, 1)))
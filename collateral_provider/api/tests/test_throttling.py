@@ -0,0 +1,73 @@
+# api/tests/test_throttling.py
+import os
+import tempfile
+import time
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api.store import SharedStore
+from api.throttling import TokenBuckets
+
+
+class TokenBucketsTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "shared.sqlite3")
+        self.buckets = TokenBuckets(SharedStore(self.path))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @patch("api.throttling.time.time", return_value=1000.0)
+    def test_burst_then_wait(self, mock_time):
+        for remaining in (2, 1, 0):
+            self.assertEqual(self.buckets.take("ip", 3, 1.0), (True, remaining, 0.0))
+        self.assertEqual(self.buckets.take("ip", 3, 1.0), (False, 0, 1.0))
+        # other clients have their own bucket
+        self.assertTrue(self.buckets.take("other", 3, 1.0)[0])
+
+    def test_refill(self):
+        for _ in range(3):
+            self.buckets.take("ip", 3, 1.0)
+        with patch("api.throttling.time.time", return_value=time.time() + 2):
+            allowed, remaining, _ = self.buckets.take("ip", 3, 1.0)
+        self.assertTrue(allowed)
+        self.assertAlmostEqual(remaining, 1.0, places=1)
+
+    def test_cost(self):
+        self.assertTrue(self.buckets.take("ip", 10, 1.0, cost=8)[0])
+        allowed, _, wait = self.buckets.take("ip", 10, 1.0, cost=5)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 3.0, places=1)
+
+    def test_buckets_are_shared_between_workers(self):
+        self.buckets.take("ip", 2, 1.0, cost=2)
+        # a second worker has its own connection to the same file
+        other = TokenBuckets(SharedStore(self.path))
+        self.assertFalse(other.take("ip", 2, 1.0)[0])
+
+
+class ThrottleHeadersTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient(HTTP_HOST='localhost')
+        self.url = reverse('collateral', kwargs={'environment': 'preprod'})
+
+    def test_quota_headers(self):
+        response = self.client.post(self.url, {'tx_body': 'acab'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response['X-RateLimit-Limit'], '60')
+        self.assertEqual(response['X-RateLimit-Remaining'], '59')
+        self.assertEqual(response['X-RateLimit-Reset'], '1')
+
+    def test_throttled_request_is_told_when_to_retry(self):
+        for _ in range(60):
+            self.client.post(self.url, {'tx_body': 'acab'}, format='json')
+        response = self.client.post(self.url, {'tx_body': 'acab'}, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(response['X-RateLimit-Remaining'], '0')
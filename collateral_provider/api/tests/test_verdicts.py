@@ -0,0 +1,47 @@
+# api/tests/test_verdicts.py
+import os
+import tempfile
+import time
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from api.store import SharedStore
+from api.verdicts import VerdictCache
+
+
+class VerdictCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "shared.sqlite3")
+        self.cache = VerdictCache(SharedStore(self.path), ttl=60, failure_ttl=5, max_entries=3)
+        self.tx_hash = bytes(32)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_miss(self):
+        self.assertIsNone(self.cache.get("preprod", self.tx_hash))
+
+    def test_verdict_is_shared_between_workers(self):
+        self.cache.put("preprod", self.tx_hash, True)
+        self.cache.put_witness("preprod", self.tx_hash, "8200")
+        # a second worker has its own process cache but the same file
+        other = VerdictCache(SharedStore(self.path), ttl=60, failure_ttl=5, max_entries=3)
+        verdict = other.get("preprod", self.tx_hash)
+        self.assertTrue(verdict.ok)
+        self.assertEqual(verdict.witness, "8200")
+        self.assertIsNone(other.get("mainnet", self.tx_hash))
+
+    def test_failures_expire_sooner(self):
+        self.cache.put("preprod", self.tx_hash, False, "bad")
+        with patch("api.verdicts.time.time", return_value=time.time() + 10):
+            self.assertIsNone(self.cache.get("preprod", self.tx_hash))
+
+    def test_prune_bounds_the_table(self):
+        for i in range(5):
+            self.cache.put("preprod", bytes([i]) * 32, True)
+        self.cache.prune()
+        (count,) = self.cache.store.connection().execute("SELECT COUNT(*) FROM verdicts").fetchone()
+        self.assertEqual(count, 3)
@@ -1,8 +1,10 @@
 import unittest
 from unittest.mock import Mock, patch
 
+from django.test import override_settings
 from rest_framework.exceptions import ValidationError
 
+from api.ban_list import BanList
 from api.tests.test_big_data import invalid_tx_body_too_big
 from api.validators.cbor import CborValidator
 
@@ -38,6 +40,43 @@ class TestCborValidator(unittest.TestCase):
             # Extract the error message from the ValidationError
             self.assertIn("tx_body is too large", str(context.exception.detail))
 
+    def test_too_large_is_rejected_before_decoding(self):
+        # not even hex, the length alone rejects it
+        with self.assertRaises(ValidationError) as context:
+            self.validator.check_cbor_hex("zz" * 16385)
+        self.assertIn("Tx Is Too Large", str(context.exception.detail))
+
+    def test_shape_is_checked_from_raw_bytes(self):
+        cases = {
+            "8301a0f5": "Tx Body Is Not A Dict",
+            "83a0a0f5": "Tx Is Not A Four Element List",
+            "84a0a0f4f6": "Boolean Can't Be False",
+            "84a0a001f6": "Boolean Is Not A Bool",
+            "82a0a0": "Boolean Does Not Exist In Tx",
+            "a0": "Tx Is Not A List",
+            "84a0a0f5": "Invalid CBOR Data In Tx",
+        }
+        for cbor_hex, message in cases.items():
+            with self.assertRaises(ValidationError) as context:
+                self.validator.check_tx_shape(bytes.fromhex(cbor_hex))
+            self.assertIn(message, str(context.exception.detail), cbor_hex)
+
+    @patch("api.validators.cbor.cbor2.loads")
+    def test_deep_nesting_is_rejected_before_decoding(self, mock_loads):
+        tx_bytes = b"\x84\xa0" + b"\x81" * 5000 + b"\x00\xf5\xf6"
+        with self.assertRaises(ValidationError) as context:
+            self.validator.check_tx_body(tx_bytes)
+        self.assertIn("Tx Is Too Complex", str(context.exception.detail))
+        mock_loads.assert_not_called()
+
+    def test_scan_budget_comes_from_settings(self):
+        tx_bytes = b"\x84\xa0" + b"\x81" * 8 + b"\x00\xf5\xf6"
+        self.validator.check_tx_shape(tx_bytes)
+        with override_settings(CBOR_SCAN={'MAX_DEPTH': 4, 'MAX_ITEMS': 10000}):
+            with self.assertRaises(ValidationError) as context:
+                self.validator.check_tx_shape(tx_bytes)
+        self.assertIn("Tx Is Too Complex", str(context.exception.detail))
+
     def test_not_valid_cbor(self):
         # Test for an allowed IP
         cbor_hex = "acab"
@@ -132,8 +171,8 @@ class TestCborValidator(unittest.TestCase):
             # Extract the error message from the ValidationError
             self.assertIn("outputs are not a list", str(context.exception.detail))
 
-    @patch("api.validators.cbor.banned_addresses", ["7025891024cd6915ab6f7d85d43869c7bfc7021b7008bad86e70a7c6ce"])
-    def test_check_address_banned(self):
+    @patch("api.validators.cbor.get_ban_list", return_value=BanList(addresses=["7025891024cd6915ab6f7d85d43869c7bfc7021b7008bad86e70a7c6ce"]))
+    def test_check_address_banned(self, mock_ban_list):
         address = "7025891024cd6915ab6f7d85d43869c7bfc7021b7008bad86e70a7c6ce"
         cbor_hex = "84a900d9010282825820e0f9a1641be97add010356e8f8ac278372e2acac24ee21f169f861cddb3c55c500825820e0f9a1641be97add010356e8f8ac278372e2acac24ee21f169f861cddb3c55c5010182a300581d7025891024cd6915ab6f7d85d43869c7bfc7021b7008bad86e70a7c6ce011a001605bc028201d81843d87980a300581d70c757598c8d204251f0e102b5092adf5627aeed553911cd6f82bd315401821a00184476a1581c20d133fb8814f3f6e9aa7777d73aab7c8cdfa7d9b2d1c94ba0f94100a1582000aeb168c1c5a787d5de5cbc0760d078bcc51b22ba8fa69e432a89137f17d9f601028201d818585bd8799f1b00000192ea62da801b00000192ea676e601a000493e0581c20d133fb8814f3f6e9aa7777d73aab7c8cdfa7d9b2d1c94ba0f94100582000aeb168c1c5a787d5de5cbc0760d078bcc51b22ba8fa69e432a89137f17d9f6ff021a000186a0031a047eb7ff081a047eb5a60b582001ca3d633ca222424e36c1ba5a9cd5501fd4b19f3f6b136af820dd4b3ccdf3490dd90102818258201d388e615da2dca607e28f704130d04e39da6f251d551d66d054b75607e0393f000ed9010281581c7c24c22d1dc252d31f6022ff22ccc838c2ab83a461172d7c2dae61f412d9010282825820680d6b17aeac96bd3c965f6e9a6b45082870e267ea260e4aeac31550719d315901825820724b724ec5c489dff4d70a2cf94389aac21f88193891a2d6b3e02b4e2997d39501a105a282000082d87a8082000082000182d87980820000f5f6"
         tx_bytes = self.validator.check_cbor_hex(cbor_hex)
@@ -1,6 +1,7 @@
 import unittest
 from unittest.mock import Mock, patch
 
+from api.ban_list import BanList
 from api.validators.environment import EnvironmentValidator
 from rest_framework.exceptions import ValidationError
 
@@ -13,8 +14,8 @@ class TestEnvironmentValidator(unittest.TestCase):
         # Initialize EnvironmentValidator with the mock logger
         self.validator = EnvironmentValidator(self.mock_logger)
 
-    @patch("api.validators.environment.banned_ip_address", ["127.0.0.1"])
-    def test_check_ip_address_banned(self):
+    @patch("api.validators.environment.get_ban_list", return_value=BanList(ip_addresses=["127.0.0.1"]))
+    def test_check_ip_address_banned(self, mock_ban_list):
         ip_address = "127.0.0.1"
         with self.assertRaises(ValidationError) as context:
             self.validator.check_ip_address(ip_address)
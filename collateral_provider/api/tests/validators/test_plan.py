@@ -0,0 +1,73 @@
+import unittest
+from unittest.mock import Mock
+
+from rest_framework.exceptions import ValidationError
+
+from api.tests.test_data import (invalid_tx_body_cbor_missing_inputs,
+                                 invalid_tx_body_cbor_spending_collateral,
+                                 invalid_tx_body_missing_collateral,
+                                 valid_tx_body_cbor_but_no_collateral,
+                                 valid_tx_body_cbor_with_collateral)
+from api.validators.cbor import CborValidator
+from api.validators.plan import compile_plan
+
+PKH = "c59da4ec6e515c2efc8866274dee6ac9a64b5945efd365f3a999e760"
+ENV_SETTINGS = {
+    'TXID': "1e0b413409dd9591b2a69bca80d7d776e8bb5130f02af0bf886e08ce5b6e183a",
+    'TXIDX': 0,
+}
+
+
+class TestValidationPlan(unittest.TestCase):
+
+    def setUp(self):
+        self.validator = CborValidator(Mock())
+        self.plan = compile_plan('preprod', ENV_SETTINGS, PKH)
+
+    def body(self, cbor_hex):
+        return self.validator.check_tx_body(self.validator.check_cbor_hex(cbor_hex))
+
+    def separate_checks(self, body):
+        self.validator.check_inputs(body, ENV_SETTINGS)
+        self.validator.check_outputs(body)
+        self.validator.check_collateral(body, ENV_SETTINGS)
+        self.validator.check_signers(body, PKH)
+
+    def test_compiled_values(self):
+        self.assertEqual(self.plan.collateral, (bytes.fromhex(ENV_SETTINGS['TXID']), 0))
+        self.assertEqual(self.plan.pkh, bytes.fromhex(PKH))
+
+    def test_valid_body_passes(self):
+        self.validator.check_body(self.body(valid_tx_body_cbor_with_collateral()), self.plan)
+
+    def test_same_errors_as_the_separate_checks(self):
+        for cbor_hex in (invalid_tx_body_cbor_missing_inputs(),
+                         invalid_tx_body_cbor_spending_collateral(),
+                         invalid_tx_body_missing_collateral(),
+                         valid_tx_body_cbor_but_no_collateral()):
+            body = self.body(cbor_hex)
+            with self.assertRaises(ValidationError) as separate:
+                self.separate_checks(body)
+            with self.assertRaises(ValidationError) as fused:
+                self.validator.check_body(body, self.plan)
+            self.assertEqual(fused.exception.detail, separate.exception.detail)
+
+    def test_many_inputs(self):
+        body = {
+            0: {(bytes([i % 256]) * 32, i) for i in range(500)},
+            1: [],
+            13: {self.plan.collateral},
+            14: {self.plan.pkh},
+        }
+        self.validator.check_body(body, self.plan)
+        body[0].add(self.plan.collateral)
+        with self.assertRaises(ValidationError) as context:
+            self.validator.check_body(body, self.plan)
+        self.assertIn("Collateral Is Being Spent In Tx", str(context.exception.detail))
+
+    def test_malformed_signer_is_still_reported(self):
+        body = dict(self.body(valid_tx_body_cbor_with_collateral()))
+        body[14] = {1}
+        with self.assertRaises(ValidationError) as context:
+            self.validator.check_body(body, self.plan)
+        self.assertIn("Tx Signer Is Not Bytes", str(context.exception.detail))
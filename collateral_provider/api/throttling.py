@@ -0,0 +1,158 @@
+import logging
+import math
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from rest_framework import throttling
+
+from api import metrics
+from api.store import get_store
+
+logger = logging.getLogger('api')
+
+# what the client is told about its quota after a request
+RateLimit = namedtuple('RateLimit', ['limit', 'remaining', 'reset'])
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS buckets ("
+    "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS buckets_full_at ON buckets (full_at)",
+)
+
+# drop refilled buckets once every this many takes
+PRUNE_EVERY = 1024
+
+
+class TokenBuckets:
+    """
+    Token buckets in the shared store so every worker enforces the same
+    limit. Each key is one row holding its tokens and when it was last
+    refilled, updated inside one write transaction. A bucket that has
+    refilled is the same as no bucket, so those rows are pruned.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._takes = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        self.store.ensure_schema('buckets', SCHEMA)
+        return self.store.connection()
+
+    def take(self, key: str, capacity: float, refill_rate: float, cost: float = 1) -> tuple:
+        """
+        Takes `cost` tokens from a bucket if it holds enough.
+
+        Args:
+            key (str): The bucket, e.g. the scope and the client ip.
+            capacity (float): The most tokens a bucket holds, the burst.
+            refill_rate (float): Tokens added per second.
+            cost (float): Tokens this request needs.
+
+        Returns:
+            tuple: Whether it was allowed, the tokens left and the seconds until `cost` tokens are available.
+        """
+        cost = min(cost, capacity)
+        now = time.time()
+        with self._lock:
+            self._takes += 1
+            prune = self._takes % PRUNE_EVERY == 0
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                tokens = capacity
+            else:
+                tokens = min(capacity, row[0] + max(0.0, now - row[1]) * refill_rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)",
+                (key, tokens, now, now + (capacity - tokens) / refill_rate),
+            )
+            if prune:
+                conn.execute("DELETE FROM buckets WHERE full_at <= ?", (now,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        wait = 0.0 if allowed else (cost - tokens) / refill_rate
+        return allowed, tokens, wait
+
+
+# one set of buckets per store path for the life of the worker
+_buckets = {}
+
+
+def get_buckets(path: str = None) -> TokenBuckets:
+    store = get_store(path)
+    buckets = _buckets.get(store.path)
+    if buckets is None:
+        buckets = _buckets.setdefault(store.path, TokenBuckets(store))
+    return buckets
+
+
+class TokenBucketThrottle(throttling.BaseThrottle):
+    """
+    An anonymous per ip throttle backed by a shared token bucket. The rate
+    reads like a drf rate, '60/min' holds 60 tokens that refill at one a
+    second. The state per client is constant size, it isn't evicted under
+    many clients and every worker sees it. The quota left is put on the
+    request for the response headers.
+    """
+    scope = 'anon'
+    rate = None
+
+    def __init__(self):
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        self._wait = None
+
+    @staticmethod
+    def parse_rate(rate):
+        num, period = rate.split('/')
+        duration = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period[0]]
+        return int(num), duration
+
+    def get_cost(self, request):
+        return 1
+
+    def get_cache_key(self, request, view):
+        return f"{self.scope}:{self.get_ident(request)}"
+
+    def allow_request(self, request, view):
+        refill_rate = self.num_requests / self.duration
+        try:
+            allowed, remaining, wait = get_buckets().take(
+                self.get_cache_key(request, view), self.num_requests, refill_rate, self.get_cost(request)
+            )
+        except sqlite3.Error as e:
+            # the upstream has its own limits, an unreadable store must not take the api down
+            logger.warning("Throttle Store Failed: %s", e, extra={'ip': self.get_ident(request)})
+            return True
+        self._wait = wait
+        reset = (self.num_requests - remaining) / refill_rate
+        request.rate_limit = RateLimit(self.num_requests, int(remaining), math.ceil(reset))
+        if not allowed:
+            metrics.reject('Throttled')
+        return allowed
+
+    def wait(self):
+        # whole seconds, rounded up so a client that waits this long gets in
+        return math.ceil(self._wait) if self._wait else None
+
+
+def add_rate_limit_headers(request, response):
+    """
+    Tells the client its quota and when it is full again.
+    """
+    rate_limit = getattr(request, 'rate_limit', None)
+    if rate_limit is not None:
+        response['X-RateLimit-Limit'] = str(rate_limit.limit)
+        response['X-RateLimit-Remaining'] = str(rate_limit.remaining)
+        response['X-RateLimit-Reset'] = str(rate_limit.reset)
+    return response
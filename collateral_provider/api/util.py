@@ -1,10 +1,48 @@
 # utils.py
+import hmac
+import ipaddress
 
 from rest_framework import serializers
 
+from api.ban_list import NetworkIndex
+
 
 def log_and_raise_error(logger, message, log_level="error"):
     # Log the error with the specified logging level
     getattr(logger, log_level)(message)
     # Raise the ValidationError with the message
     raise serializers.ValidationError(message)
+
+
+def get_client_ip(request):
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if x_forwarded_for:
+        # Get the first IP from the list
+        ip = x_forwarded_for.split(',')[0]
+    else:
+        ip = request.META.get('REMOTE_ADDR')
+    return ip
+
+
+_internal_networks = {}
+
+
+def internal_request_allowed(request, token, allowed_ips) -> bool:
+    """
+    Whether a request may read an internal endpoint. A direct request from
+    `allowed_ips` is let in, a proxied one could be anyone. With a token set
+    a request sending it as a bearer token is let in too, from anywhere.
+    """
+    if token:
+        sent = request.META.get('HTTP_AUTHORIZATION', '')
+        if hmac.compare_digest(sent.encode(), f'Bearer {token}'.encode()):
+            return True
+    if request.META.get('HTTP_X_FORWARDED_FOR'):
+        return False
+    allowed_ips = tuple(allowed_ips)
+    networks = _internal_networks.get(allowed_ips)
+    if networks is None:
+        networks = _internal_networks[allowed_ips] = NetworkIndex(
+            ipaddress.ip_network(entry.strip(), strict=False) for entry in allowed_ips
+        )
+    return request.META.get('REMOTE_ADDR', '') in networks
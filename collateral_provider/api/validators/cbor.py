@@ -1,8 +1,15 @@
 import cbor2
+from django.conf import settings
 
-from api.ban_list import banned_addresses
+from api.ban_list import get_ban_list
+from api.parsed import TransactionView
+from api.scanner import CBORBudgetError, CBORScanError, scan_tx
 from api.util import log_and_raise_error
 
+# the raw encodings of the is-valid flag
+CBOR_TRUE = 0xF5
+CBOR_FALSE = 0xF4
+
 
 class CborValidator:
     def __init__(self, logger):
@@ -13,62 +20,120 @@ class CborValidator:
         if not tx_body_cbor:
             log_and_raise_error(self.logger, "Tx Can't Be Empty")
 
+        # Enforce maximum transaction size before decoding anything
+        if len(tx_body_cbor) > 2 * max_tx_size:
+            log_and_raise_error(self.logger, "Tx Is Too Large")
+
         # ensure that the cbor decodes correctly
         try:
             tx_bytes = bytes.fromhex(tx_body_cbor)
         except ValueError:
             log_and_raise_error(self.logger, "Invalid Hex Data In Tx")
 
-        # Enforce maximum transaction size
-        tx_size = len(tx_bytes)
-        if tx_size > max_tx_size:
-            log_and_raise_error(self.logger, "Tx Is Too Large")
-
         # need to return the tx in byte form
         return tx_bytes
 
-    def check_tx_body(self, tx_bytes):
+    def check_tx_shape(self, tx_bytes, max_depth=None, max_items=None):
+        """
+        Checks the raw bytes before anything is decoded: the whole tx must
+        be well formed CBOR within the nesting and item budgets, an array
+        whose body is a map, with a true is-valid flag and four elements.
+        The budgets default to settings.CBOR_SCAN. Returns the TxScan with
+        the element and body entry offsets.
+        """
+        budget = settings.CBOR_SCAN
         try:
-            tx_body = cbor2.loads(tx_bytes)
-        except cbor2.CBORDecodeError:
+            scan = scan_tx(tx_bytes, max_depth or budget['MAX_DEPTH'], max_items or budget['MAX_ITEMS'])
+        except CBORBudgetError:
+            log_and_raise_error(self.logger, "Tx Is Too Complex")
+        except CBORScanError:
             log_and_raise_error(self.logger, "Invalid CBOR Data In Tx")
 
-        # ensure that the tx body decodes correctly
-        if not isinstance(tx_body, list):
+        major, spans, body_entries = scan
+        if major != 4:
             log_and_raise_error(self.logger, "Tx Is Not A List")
 
         # can't be invalid script that purposes takes collateral
-        try:
-            boolean = tx_body[2]
-        except IndexError:
+        if len(spans) < 3:
             log_and_raise_error(self.logger, "Boolean Does Not Exist In Tx")
-        if not isinstance(boolean, bool):
-            log_and_raise_error(self.logger, "Boolean Is Not A Bool")
-        if boolean is False:
+        start, end = spans[2]
+        boolean = tx_bytes[start] if end - start == 1 else None
+        if boolean == CBOR_FALSE:
             log_and_raise_error(self.logger, "Boolean Can't Be False")
+        if boolean != CBOR_TRUE:
+            log_and_raise_error(self.logger, "Boolean Is Not A Bool")
 
-        # ensure the actual body decodes correctly
-        try:
-            body = tx_body[0]
-        except IndexError:
-            log_and_raise_error(self.logger, "Body Does Not Exist In Tx")
-        if not isinstance(body, dict):
+        # the body is a map, the scan indexed it
+        if body_entries is None:
             log_and_raise_error(self.logger, "Tx Body Is Not A Dict")
 
-        # return the body
-        return body
+        # body, witness set, is-valid flag and auxiliary data
+        if len(spans) != 4:
+            log_and_raise_error(self.logger, "Tx Is Not A Four Element List")
+        return scan
 
-    def check_inputs(self, body, env_settings):
-        # check if inputs is correct form (0)
+    def check_tx_body(self, tx_bytes, scan=None):
+        # junk is rejected from the raw bytes before anything is decoded
+        if scan is None:
+            scan = self.check_tx_shape(tx_bytes)
+
+        # only the body fields the checks read get decoded
+        try:
+            return TransactionView(tx_bytes, scan.body_entries)
+        except (CBORScanError, cbor2.CBORDecodeError):
+            log_and_raise_error(self.logger, "Invalid CBOR Data In Tx")
+
+    def field(self, body, key, missing_message):
         try:
-            inputs = body[0]
+            return body[key]
         except KeyError:
-            log_and_raise_error(self.logger, "Inputs Does Not Exist In Body")
+            log_and_raise_error(self.logger, missing_message)
+        except cbor2.CBORDecodeError:
+            # a field of a lazy body is decoded here for the first time
+            log_and_raise_error(self.logger, "Invalid CBOR Data In Tx")
+
+    def check_body(self, body, plan):
+        """
+        Runs every body check against a compiled plan, in the order and with
+        the errors of check_inputs, check_outputs, check_collateral and
+        check_signers. Nothing is hex encoded, the collateral and the pkh
+        are looked up in their sets as raw values.
+        """
+        self._check_inputs(body, plan.collateral)
+        self._check_outputs(body, get_ban_list())
+        self._check_collateral(body, plan.collateral)
+        self._check_signers(body, plan.pkh)
+
+    @staticmethod
+    def collateral_of(env_settings):
+        # settings without a collateral never match a utxo
+        if 'TXID' not in env_settings:
+            return (None, None)
+        return (bytes.fromhex(env_settings['TXID']), env_settings['TXIDX'])
+
+    def check_inputs(self, body, env_settings):
+        self._check_inputs(body, self.collateral_of(env_settings))
+
+    def check_outputs(self, body):
+        self._check_outputs(body, get_ban_list())
+
+    def check_collateral(self, body, env_settings):
+        self._check_collateral(body, self.collateral_of(env_settings))
+
+    def check_signers(self, body, pkh):
+        self._check_signers(body, bytes.fromhex(pkh))
+
+    def _check_inputs(self, body, collateral):
+        # check if inputs is correct form (0)
+        inputs = self.field(body, 0, "Inputs Does Not Exist In Body")
         if not isinstance(inputs, set):
             log_and_raise_error(self.logger, "Inputs Are Not A Set")
 
-        # check if collateral input is not in inputs
-        being_spent_flag = False
+        # the tx is trying to spend the collateral
+        if collateral in inputs:
+            log_and_raise_error(self.logger, "Collateral Is Being Spent In Tx")
+
+        tx_id, tx_idx = collateral
         for utxo in inputs:
             if not isinstance(utxo, tuple):
                 log_and_raise_error(self.logger, "UTxO Is Not A Tuple")
@@ -87,21 +152,12 @@ class CborValidator:
             if not isinstance(utxo[1], int):
                 log_and_raise_error(self.logger, "TxIdx Is Not An Int")
 
-            # put it in proper format
-            tx_id = utxo[0].hex()
-            tx_idx = int(utxo[1])
-            if tx_id == env_settings['TXID'] and tx_idx == env_settings['TXIDX']:
-                # the tx is trying to spend the collateral
-                being_spent_flag = True
-                break
-        if being_spent_flag is True:
-            log_and_raise_error(self.logger, "Collateral Is Being Spent In Tx")
+            # a utxo with extra fields doesn't hash like the collateral
+            if utxo[0] == tx_id and utxo[1] == tx_idx:
+                log_and_raise_error(self.logger, "Collateral Is Being Spent In Tx")
 
-    def check_outputs(self, body):
-        try:
-            outputs = body[1]
-        except KeyError:
-            log_and_raise_error(self.logger, "Outputs Does Not Exist In Body")
+    def _check_outputs(self, body, ban_list):
+        outputs = self.field(body, 1, "Outputs Does Not Exist In Body")
 
         if not isinstance(outputs, list):
             log_and_raise_error(self.logger, "Outputs Are Not A List")
@@ -118,21 +174,22 @@ class CborValidator:
             if not isinstance(utxo[0], bytes):
                 log_and_raise_error(self.logger, "TxId Is Not Bytes")
 
-            address = utxo[0].hex()
-            if address in banned_addresses:
-                log_and_raise_error(self.logger, f"The Address: {address} Is Banned")
+            # the raw address bytes are looked up, hex is only for the error
+            if ban_list.address_is_banned(utxo[0]):
+                log_and_raise_error(self.logger, f"The Address: {utxo[0].hex()} Is Banned")
 
-    def check_collateral(self, body, env_settings):
+    def _check_collateral(self, body, collateral):
         # check if collateral inputs is correct form(13)
-        try:
-            collaterals = body[13]
-        except KeyError:
-            log_and_raise_error(self.logger, "Collateral Does Not Exist In Body")
+        collaterals = self.field(body, 13, "Collateral Does Not Exist In Body")
 
         if not isinstance(collaterals, set):
             log_and_raise_error(self.logger, "Collateral Is Not A Set")
 
-        being_used_flag = False
+        # being used properly
+        if collateral in collaterals:
+            return
+
+        tx_id, tx_idx = collateral
         for utxo in collaterals:
             if not isinstance(utxo, tuple):
                 log_and_raise_error(self.logger, "UTxO Is Not A Tuple")
@@ -153,35 +210,23 @@ class CborValidator:
             if not isinstance(utxo[1], int):
                 log_and_raise_error(self.logger, "TxIdx Is Not A Int")
 
-            # put it in proper format
-            tx_id = utxo[0].hex()
-            tx_idx = int(utxo[1])
-            if tx_id == env_settings['TXID'] and tx_idx == env_settings['TXIDX']:
-                # being used properly
-                being_used_flag = True
-                break
-        if being_used_flag is False:
-            log_and_raise_error(self.logger, "Collateral Is Not Being Used In Tx")
+            if utxo[0] == tx_id and utxo[1] == tx_idx:
+                return
+        log_and_raise_error(self.logger, "Collateral Is Not Being Used In Tx")
 
-    def check_signers(self, body, pkh):
+    def _check_signers(self, body, pkh):
         # check if required signers is in correct form
-        try:
-            required_signers = body[14]
-        except KeyError:
-            log_and_raise_error(self.logger, "Required Signers Does Not Exist In Body")
+        required_signers = self.field(body, 14, "Required Signers Does Not Exist In Body")
 
         if not isinstance(required_signers, set):
             log_and_raise_error(self.logger, "Required Signers Is Not A Set")
 
         # check if pkh is in required signers
-        being_signed_flag = False
+        if pkh in required_signers:
+            return
+
         for signer in required_signers:
             if not isinstance(signer, bytes):
                 log_and_raise_error(self.logger, "Tx Signer Is Not Bytes")
 
-            if signer.hex() == pkh:
-                being_signed_flag = True
-                break
-
-        if being_signed_flag is False:
-            log_and_raise_error(self.logger, "Collateral Public Key Hash Is Not Being Used")
+        log_and_raise_error(self.logger, "Collateral Public Key Hash Is Not Being Used")
@@ -1,4 +1,4 @@
-from api.ban_list import banned_ip_address
+from api.ban_list import get_ban_list
 from api.util import log_and_raise_error
 
 
@@ -7,7 +7,7 @@ class EnvironmentValidator:
         self.logger = logger
 
     def check_ip_address(self, ip_address):
-        if ip_address in banned_ip_address:
+        if get_ban_list().ip_is_banned(ip_address):
             log_and_raise_error(self.logger, f"The IP: {ip_address} Is Banned")
 
     def check_environment(self, environment, networks):
@@ -0,0 +1,55 @@
+import logging
+import threading
+from collections import namedtuple
+
+from django.conf import settings
+
+logger = logging.getLogger('api')
+
+# what the body checks compare against, in the form cbor2 decodes to
+ValidationPlan = namedtuple('ValidationPlan', ['environment', 'collateral', 'pkh'])
+
+
+def compile_plan(environment: str, env_settings: dict, pkh: str) -> ValidationPlan:
+    """
+    Turns the hex settings of an environment into raw values.
+
+    Args:
+        environment (str): The network name.
+        env_settings (dict): Its settings with the collateral TXID and TXIDX.
+        pkh (str): The collateral public key hash.
+
+    Returns:
+        ValidationPlan: The collateral as a (bytes, int) tuple and the pkh as bytes.
+    """
+    collateral = (bytes.fromhex(env_settings['TXID']), int(env_settings['TXIDX']))
+    return ValidationPlan(environment, collateral, bytes.fromhex(pkh))
+
+
+# plans keyed by the values they were compiled from, so changed settings get a new plan
+_plans = {}
+_plans_lock = threading.Lock()
+
+
+def get_plan(environment: str, env_settings: dict) -> ValidationPlan:
+    key = (environment, env_settings['TXID'], env_settings['TXIDX'], settings.PKH)
+    plan = _plans.get(key)
+    if plan is None:
+        with _plans_lock:
+            plan = _plans.get(key)
+            if plan is None:
+                plan = compile_plan(environment, env_settings, settings.PKH)
+                _plans[key] = plan
+    return plan
+
+
+def compile_plans() -> None:
+    """
+    Compiles a plan for every configured environment at startup.
+    """
+    for environment, env_settings in settings.ENVIRONMENTS.items():
+        try:
+            get_plan(environment, env_settings)
+        except (KeyError, TypeError, ValueError) as e:
+            # management commands must still run with a half configured env
+            logger.error("Invalid Collateral Settings For %s: %s", environment, e)
@@ -1,14 +1,70 @@
-from api.simulate import evaluate_transaction
+import asyncio
+
+from api.metrics import stage
+from api.simulate import EvaluationUnavailable, evaluate_transaction, evaluate_transaction_async
 from api.util import log_and_raise_error
+from api.verdicts import Verdict, get_verdict_cache
 
 
 class TransactionValidator:
     def __init__(self, logger):
         self.logger = logger
 
-    def check_valid_tx(self, tx_body_cbor, environment):
-        is_valid = evaluate_transaction(tx_body_cbor, environment)
-        try:
-            is_valid['result']
-        except KeyError:
+    def check_valid_tx(self, tx_body_cbor, environment, tx_hash=None):
+        # retries of the same tx reuse the verdict instead of evaluating again
+        cache = get_verdict_cache() if tx_hash is not None else None
+        verdict = cache.get(environment, tx_hash) if cache is not None else None
+        if verdict is None:
+            try:
+                # the upstream call alone, evaluate also counts cache and coalescing
+                with stage('upstream'):
+                    is_valid = evaluate_transaction(tx_body_cbor, environment)
+            except EvaluationUnavailable as e:
+                self.unavailable(e)
+            verdict = self.verdict(is_valid)
+            if verdict is None:
+                self.unavailable(f"Unexpected Reply: {str(is_valid)[:200]}")
+            if cache is not None:
+                cache.put(environment, tx_hash, verdict.ok, verdict.reason)
+        return self.check_verdict(verdict)
+
+    async def check_valid_tx_async(self, tx_body_cbor, environment, tx_hash=None):
+        # the shared store is file backed so it is read off the event loop
+        cache = get_verdict_cache() if tx_hash is not None else None
+        verdict = await asyncio.to_thread(cache.get, environment, tx_hash) if cache is not None else None
+        if verdict is None:
+            try:
+                with stage('upstream'):
+                    is_valid = await evaluate_transaction_async(tx_body_cbor, environment)
+            except EvaluationUnavailable as e:
+                self.unavailable(e)
+            verdict = self.verdict(is_valid)
+            if verdict is None:
+                self.unavailable(f"Unexpected Reply: {str(is_valid)[:200]}")
+            if cache is not None:
+                await asyncio.to_thread(cache.put, environment, tx_hash, verdict.ok, verdict.reason)
+        return self.check_verdict(verdict)
+
+    def unavailable(self, error):
+        # an unreachable or erroring upstream can't vouch for the tx, nothing is cached
+        self.logger.warning("Evaluation Unavailable: %s", error)
+        log_and_raise_error(self.logger, "Transaction Fails Validation")
+
+    @staticmethod
+    def verdict(is_valid):
+        """
+        The verdict of a JSON-RPC evaluation reply, or None when the reply
+        is neither a result nor an evaluation error.
+        """
+        if not isinstance(is_valid, dict):
+            return None
+        if 'result' in is_valid:
+            return Verdict(True, None, None)
+        if 'error' in is_valid:
+            return Verdict(False, str(is_valid['error'])[:512], None)
+        return None
+
+    def check_verdict(self, verdict):
+        if verdict.ok is False:
             log_and_raise_error(self.logger, "Transaction Fails Validation")
+        return verdict
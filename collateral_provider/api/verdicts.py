@@ -0,0 +1,156 @@
+import logging
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from cachetools import TTLCache
+from django.conf import settings
+
+from api.store import get_store
+
+logger = logging.getLogger('api')
+
+# ok is the evaluation outcome, witness is only set once a passing tx is signed
+Verdict = namedtuple('Verdict', ['ok', 'reason', 'witness'])
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS verdicts ("
+    "key TEXT PRIMARY KEY, ok INTEGER NOT NULL, reason TEXT, witness TEXT, expires REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS verdicts_expires ON verdicts (expires)",
+)
+
+# prune the shared table once every this many writes
+PRUNE_EVERY = 256
+
+
+class VerdictCache:
+    """
+    A bounded TTL cache of evaluation verdicts and witnesses keyed by the
+    environment and the tx body hash. A per-process TTLCache sits in front
+    of the table in the shared store so every worker sees each verdict. The
+    cache is best effort, a store error is logged and treated as a miss.
+    """
+
+    def __init__(self, store, ttl: int, failure_ttl: int, max_entries: int):
+        self.store = store
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.max_entries = max_entries
+        self._local = TTLCache(maxsize=min(max_entries, 4096), ttl=max(ttl, failure_ttl))
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        self.store.ensure_schema('verdicts', SCHEMA)
+        return self.store.connection()
+
+    @staticmethod
+    def key(environment: str, tx_hash: bytes) -> str:
+        return f"{environment}:{tx_hash.hex()}"
+
+    def get(self, environment: str, tx_hash: bytes):
+        """
+        Returns the cached verdict for a tx, or None on a miss.
+        """
+        key = self.key(environment, tx_hash)
+        now = time.time()
+        with self._lock:
+            entry = self._local.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        try:
+            row = self._conn().execute(
+                "SELECT ok, reason, witness, expires FROM verdicts WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Verdict Cache Read Failed: %s", e)
+            return None
+        if row is None or row[3] <= now:
+            return None
+        verdict = Verdict(bool(row[0]), row[1], row[2])
+        with self._lock:
+            self._local[key] = (row[3], verdict)
+        return verdict
+
+    def put(self, environment: str, tx_hash: bytes, ok: bool, reason: str = None, witness: str = None) -> Verdict:
+        """
+        Stores a verdict, failures live for the shorter failure ttl.
+        """
+        key = self.key(environment, tx_hash)
+        expires = time.time() + (self.ttl if ok else self.failure_ttl)
+        verdict = Verdict(ok, reason, witness)
+        with self._lock:
+            self._local[key] = (expires, verdict)
+            self._writes += 1
+            prune = self._writes % PRUNE_EVERY == 0
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO verdicts (key, ok, reason, witness, expires) VALUES (?, ?, ?, ?, ?)",
+                (key, int(ok), reason, witness, expires),
+            )
+            if prune:
+                self.prune(conn)
+        except sqlite3.Error as e:
+            logger.warning("Verdict Cache Write Failed: %s", e)
+        return verdict
+
+    def put_witness(self, environment: str, tx_hash: bytes, witness: str) -> None:
+        """
+        Attaches the finished witness to a passing verdict.
+        """
+        key = self.key(environment, tx_hash)
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is not None and entry[1].ok:
+                self._local[key] = (entry[0], entry[1]._replace(witness=witness))
+        try:
+            self._conn().execute("UPDATE verdicts SET witness = ? WHERE key = ? AND ok = 1", (witness, key))
+        except sqlite3.Error as e:
+            logger.warning("Verdict Cache Write Failed: %s", e)
+
+    def prune(self, conn: sqlite3.Connection = None) -> None:
+        """
+        Drops expired rows, then the soonest to expire above the bound.
+        """
+        conn = conn or self._conn()
+        conn.execute("DELETE FROM verdicts WHERE expires <= ?", (time.time(),))
+        (count,) = conn.execute("SELECT COUNT(*) FROM verdicts").fetchone()
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM verdicts WHERE key IN (SELECT key FROM verdicts ORDER BY expires LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+
+# one cache per store path for the life of the worker
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_verdict_cache():
+    """
+    Returns the verdict cache, or None when it is disabled in settings.
+    """
+    config = settings.VERDICT_CACHE
+    if not config['ENABLED']:
+        return None
+    path = settings.SHARED_STORE_PATH
+    cache = _caches.get(path)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(path)
+            if cache is None:
+                cache = VerdictCache(get_store(path), config['TTL'], config['FAILURE_TTL'], config['MAX_ENTRIES'])
+                _caches[path] = cache
+    return cache
+
+
+def remember_witness(environment: str, tx, witness: str) -> None:
+    """
+    Caches a freshly made witness so a retry of the same tx skips signing.
+    """
+    cache = get_verdict_cache()
+    if cache is not None and tx.witness != witness:
+        cache.put_witness(environment, tx.tx_hash, witness)
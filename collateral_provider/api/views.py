@@ -1,47 +1,76 @@
+import asyncio
 import json
 import logging
-import os
+from concurrent.futures import as_completed
 
+import orjson
 from django.conf import settings
-from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.http import (HttpResponse, HttpResponseBadRequest, JsonResponse,
+                         StreamingHttpResponse)
 from django.shortcuts import redirect
-from rest_framework import status, throttling
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, serializers, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .serializers import ProvideCollateralSerializer
-from .signature import witness_tx_cbor
+from . import metrics
+from .known_hosts import TRANSPORTS, get_known_hosts, respond
+from .pipeline import (check_tx, collateral_for, evaluate, evaluate_async,
+                       get_batch_pool, witness_for)
+from .profiler import get_profile_store
+from .serializers import BatchCollateralSerializer, ProvideCollateralSerializer
+from .throttling import TokenBucketThrottle, add_rate_limit_headers
+from .util import get_client_ip, internal_request_allowed
 
 logger = logging.getLogger('api')
 
 
-class ProvideCollateralThrottle(throttling.AnonRateThrottle):
+class ProvideCollateralThrottle(TokenBucketThrottle):
     # set this to whatever makes sense
     # the real limit here is the simulate api
     rate = '60/min'
 
 
+class BatchCollateralThrottle(ProvideCollateralThrottle):
+    """
+    Every tx in a batch uses up the quota of one single request, and the
+    quota is shared with the single endpoint.
+    """
+
+    def get_cost(self, request):
+        tx_bodies = request.data.get('tx_bodies') if isinstance(request.data, dict) else None
+        cost = len(tx_bodies) if isinstance(tx_bodies, list) and tx_bodies else 1
+        # oversized batches are rejected by the serializer, don't let them drain the quota
+        return min(cost, settings.BATCH['MAX_SIZE'])
+
+
 class ProvideCollateralView(APIView):
     throttle_classes = [ProvideCollateralThrottle]
 
     def http_method_not_allowed(self, request, *args, **kwargs):
         ip_address = self.get_client_ip(request)
-        logger.warning(f'Get Request Received From IP: {ip_address} Method Not Allowed: {request.method} On {request.path}')
+        logger.warning('Get Request Received From IP: %s Method Not Allowed: %s On %s', ip_address, request.method, request.path, extra={'ip': ip_address})
         return Response(
             {"detail": "Method Not Allowed"},
             status=status.HTTP_405_METHOD_NOT_ALLOWED
         )
 
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        return add_rate_limit_headers(request, response)
+
     def post(self, request, environment):
         # Get client's IP address
         ip_address = self.get_client_ip(request)
-        logger.debug(f'Request Received From IP: {ip_address} For Environment: {environment}')
+        logger.debug('Request Received From IP: %s For Environment: %s', ip_address, environment, extra={'ip': ip_address})
 
         # Check if the environment is valid
         networks = list(settings.ENVIRONMENTS.keys())
         env_settings = settings.ENVIRONMENTS.get(environment)
         if not env_settings:
-            logger.error(f'Invalid Environment {environment} From IP: {ip_address}')
+            logger.error('Invalid Environment %s From IP: %s', environment, ip_address, extra={'ip': ip_address})
+            metrics.reject('Invalid Environment')
             return Response({"error": "Invalid Environment"}, status=status.HTTP_400_BAD_REQUEST)
 
         # Serialize the incoming data
@@ -57,39 +86,215 @@ class ProvideCollateralView(APIView):
 
         # If its valid then witness the transaction
         if serializer.is_valid():
-            tx_body_cbor = serializer.validated_data['tx_body']
-            
-            witness_cbor = witness_tx_cbor(tx_body_cbor, settings.SKEY_PATH, settings.VKEY_PATH)
-            logger.debug(f'Successfully Processed Tx Witness For IP: {ip_address} On Environment: {environment}')
+            tx = serializer.validated_data['tx']
+
+            witness_cbor = witness_for(environment, tx)
+            logger.debug('Successfully Processed Tx Witness For IP: %s On Environment: %s', ip_address, environment, extra={'ip': ip_address})
 
             # Return the witness data
             return Response({'witness': witness_cbor}, status=status.HTTP_200_OK)
 
         else:
-            logger.error(f'Invalid Data From IP: {ip_address}: {serializer.errors}')
+            logger.error('Invalid Data From IP: %s: %s', ip_address, serializer.errors, extra={'ip': ip_address})
+            metrics.reject(serializer.errors)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def get_client_ip(self, request):
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            # Get the first IP from the list
-            ip = x_forwarded_for.split(',')[0]
+        return get_client_ip(request)
+
+
+class BatchCollateralView(ProvideCollateralView):
+    """
+    Witnesses a list of txs in one exchange. Each tx goes through the same
+    checks as the single endpoint and the evaluations run concurrently on a
+    bounded pool. One NDJSON line is streamed per tx as soon as it finishes,
+    in completion order, carrying its index in the request.
+    """
+    throttle_classes = [BatchCollateralThrottle]
+
+    def post(self, request, environment):
+        # Get client's IP address
+        ip_address = self.get_client_ip(request)
+        logger.debug('Batch Request Received From IP: %s For Environment: %s', ip_address, environment, extra={'ip': ip_address})
+
+        # Check if the environment is valid
+        networks = list(settings.ENVIRONMENTS.keys())
+        env_settings = settings.ENVIRONMENTS.get(environment)
+        if not env_settings:
+            logger.error('Invalid Environment %s From IP: %s', environment, ip_address, extra={'ip': ip_address})
+            metrics.reject('Invalid Environment')
+            return Response({"error": "Invalid Environment"}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = BatchCollateralSerializer(
+            data=request.data,
+            context={
+                'environment': environment,
+                'ip_address': ip_address,
+                'networks': networks,
+            }
+        )
+        if not serializer.is_valid():
+            logger.error('Invalid Batch From IP: %s: %s', ip_address, serializer.errors, extra={'ip': ip_address})
+            metrics.reject(serializer.errors)
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        tx_bodies = serializer.validated_data['tx_bodies']
+        results = stream_batch(tx_bodies, environment, env_settings, ip_address, networks)
+        return StreamingHttpResponse(results, content_type='application/x-ndjson')
+
+
+def stream_batch(tx_bodies, environment, env_settings, ip_address, networks):
+    """
+    Yields one NDJSON line per tx as its witness or its error is ready.
+    """
+    pool = get_batch_pool()
+    futures = {
+        pool.submit(collateral_for, tx_body_cbor, environment, env_settings, ip_address, networks, logger): index
+        for index, tx_body_cbor in enumerate(tx_bodies)
+    }
+    try:
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                line = {'index': index, 'witness': future.result()}
+            except serializers.ValidationError as e:
+                # the same error body the single endpoint returns
+                line = {'index': index, 'error': {'tx_body': e.detail}}
+                metrics.reject(e.detail)
+            except Exception:
+                logger.exception('Batch Tx %s Failed For IP: %s', index, ip_address, extra={'ip': ip_address})
+                line = {'index': index, 'error': {'detail': 'Internal Server Error'}}
+            yield json.dumps(line) + '\n'
+        logger.debug('Successfully Processed Batch Of %s For IP: %s On Environment: %s', len(tx_bodies), ip_address, environment, extra={'ip': ip_address})
+    finally:
+        # a client that hung up doesn't keep the pool busy
+        for future in futures:
+            future.cancel()
+
+
+# the same field the serializer uses, so the async view reports identical errors
+tx_body_field = serializers.CharField(allow_blank=False, trim_whitespace=True)
+
+# the bodies drf's default form and multipart parsers accept, json aside
+FORM_MEDIA_TYPES = ('application/x-www-form-urlencoded', 'multipart/form-data')
+
+
+class PlainCollateralView(View):
+    """
+    What the collateral views built on a plain django view share, the csrf
+    exemption, the throttles and reading the tx_body, all with the error
+    shapes of ProvideCollateralView.
+    """
+    throttle_classes = [ProvideCollateralThrottle]
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # anonymous api, same as drf views
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    @staticmethod
+    def json_response(data, status):
+        return JsonResponse(data, status=status)
+
+    def check_throttles(self, request):
+        for throttle in [throttle() for throttle in self.throttle_classes]:
+            if not throttle.allow_request(request, self):
+                wait = throttle.wait()
+                response = self.json_response({"detail": exceptions.Throttled(wait).detail}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+                if wait is not None:
+                    response['Retry-After'] = str(wait)
+                return response
+        return None
+
+    @staticmethod
+    def tx_body_from(request):
+        # an empty body is no data whatever its type, like drf
+        if not request.body:
+            data = {}
+        elif request.content_type == 'application/json':
+            try:
+                data = orjson.loads(request.body)
+            except orjson.JSONDecodeError as e:
+                raise exceptions.ParseError(f'JSON parse error - {e}')
+        elif request.content_type in FORM_MEDIA_TYPES:
+            data = request.POST
         else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
+            raise exceptions.UnsupportedMediaType(request.content_type)
+        if not isinstance(data, dict):
+            data = {}
+        return tx_body_field.run_validation(data.get('tx_body', serializers.empty))
+
+
+class AsyncProvideCollateralView(PlainCollateralView):
+    """
+    The collateral endpoint as a native async view for ASGI servers. The
+    decode, the local checks and the signing run in worker threads while
+    the evaluation is awaited on the event loop, so one process can hold
+    many evaluations in flight. Responses match ProvideCollateralView.
+    """
+
+    async def http_method_not_allowed(self, request, *args, **kwargs):
+        ip_address = get_client_ip(request)
+        logger.warning('Get Request Received From IP: %s Method Not Allowed: %s On %s', ip_address, request.method, request.path, extra={'ip': ip_address})
+        return JsonResponse({"detail": "Method Not Allowed"}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    async def dispatch(self, request, *args, **kwargs):
+        response = await super().dispatch(request, *args, **kwargs)
+        return add_rate_limit_headers(request, response)
+
+    async def post(self, request, environment):
+        # Get client's IP address
+        ip_address = get_client_ip(request)
+        logger.debug('Request Received From IP: %s For Environment: %s', ip_address, environment, extra={'ip': ip_address})
+
+        # the buckets live in the shared store, a file, so they are read off the loop
+        throttled = await asyncio.to_thread(self.check_throttles, request)
+        if throttled is not None:
+            return throttled
+
+        # Check if the environment is valid
+        networks = list(settings.ENVIRONMENTS.keys())
+        env_settings = settings.ENVIRONMENTS.get(environment)
+        if not env_settings:
+            logger.error('Invalid Environment %s From IP: %s', environment, ip_address, extra={'ip': ip_address})
+            metrics.reject('Invalid Environment')
+            return JsonResponse({"error": "Invalid Environment"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            tx_body_cbor = self.tx_body_from(request)
+            # cpu bound work stays off the event loop
+            tx = await asyncio.to_thread(check_tx, tx_body_cbor, environment, env_settings, ip_address, networks, logger)
+            await evaluate_async(environment, tx, logger)
+        except (exceptions.ParseError, exceptions.UnsupportedMediaType) as e:
+            metrics.reject(e.detail)
+            return JsonResponse({"detail": e.detail}, status=e.status_code)
+        except serializers.ValidationError as e:
+            logger.error('Invalid Data From IP: %s: %s', ip_address, e.detail, extra={'ip': ip_address})
+            metrics.reject(e.detail)
+            return JsonResponse({'tx_body': e.detail}, status=status.HTTP_400_BAD_REQUEST)
+
+        witness_cbor = await asyncio.to_thread(witness_for, environment, tx)
+        logger.debug('Successfully Processed Tx Witness For IP: %s On Environment: %s', ip_address, environment, extra={'ip': ip_address})
+
+        # Return the witness data
+        return JsonResponse({'witness': witness_cbor}, status=status.HTTP_200_OK)
 
 
 # very simply landing page that auto loads from the known.host.json file
 def landing_page(request):
-    # Get the parent directory of BASE_DIR
-    parent_dir = os.path.abspath(os.path.join(settings.BASE_DIR, os.pardir))
-    # Load the JSON file from the parent directory
-    json_file_path = os.path.join(parent_dir, 'known.hosts.json')
-    with open(json_file_path, 'r') as json_file:
-        data = json.load(json_file)
+    # rendered once per version of the file and served from memory
+    known_hosts = get_known_hosts()
+    rendered = known_hosts.rendered(
+        ('landing_page', settings.PKH, settings.STATIC_URL),
+        lambda hosts: (render_landing_page(hosts.data).encode(), 'text/html; charset=utf-8'),
+    )
+    return respond(request, rendered)
+
+
+def render_landing_page(data):
     content = data.get(
         settings.PKH, "Public Key Hash Not Found In Known Hosts")
-    return HttpResponse(f"""
+    return f"""
         <!DOCTYPE html>
         <html lang="en">
             <head>
@@ -141,27 +346,124 @@ def landing_page(request):
                 </footer>
             </body>
         </html>
-    """)
+    """
 
 
 def custom_page_not_found(request, exception):
     return redirect('/')
 
 
+def metrics_view(request):
+    if not metrics.enabled() or not metrics.scrape_allowed(request):
+        return JsonResponse({'detail': 'Not Found'}, status=404)
+    text = metrics.render(metrics.get_exporter().collect())
+    return HttpResponse(text, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def profiles_allowed(request):
+    return internal_request_allowed(request, settings.PROFILER.get('TOKEN'), settings.PROFILER['ALLOWED_IPS'])
+
+
+def profiles_view(request):
+    if not profiles_allowed(request):
+        return JsonResponse({'detail': 'Not Found'}, status=404)
+    return JsonResponse({'profiles': get_profile_store().summaries()})
+
+
+def profile_view(request, profile_id):
+    if not profiles_allowed(request):
+        return JsonResponse({'detail': 'Not Found'}, status=404)
+    profile = get_profile_store().load(profile_id)
+    if profile is None:
+        return JsonResponse({'detail': 'Not Found'}, status=404)
+    if request.GET.get('format') == 'json':
+        return JsonResponse(profile)
+    # collapsed stacks, ready for flamegraph.pl or speedscope
+    return HttpResponse(profile['collapsed'], content_type='text/plain; charset=utf-8')
+
+
 def known_hosts_view(request):
-    # Get the parent directory of BASE_DIR
-    parent_dir = os.path.abspath(os.path.join(settings.BASE_DIR, os.pardir))
-    # Load the JSON file from the parent directory
-    json_file_path = os.path.join(parent_dir, 'known.hosts.json')
-    try:
-        with open(json_file_path, 'r') as json_file:
-            data = json.load(json_file)
-    except FileNotFoundError:
+    known_hosts = get_known_hosts()
+    if not known_hosts.found:
         return JsonResponse({'error': 'File Not Found'}, status=404)
-    # Return the JSON response
-    return JsonResponse(data)
+    network = request.GET.get('network') or None
+    pkh = request.GET.get('pkh') or None
+    transport = request.GET.get('transport') or None
+    if transport is not None and transport not in TRANSPORTS:
+        return JsonResponse({'error': f'Invalid Transport: {transport}'}, status=400)
+    if network is None and pkh is None and transport is None:
+        # Return the JSON response
+        rendered = known_hosts.rendered(
+            ('known_hosts',),
+            lambda hosts: (json.dumps(hosts.data).encode(), 'application/json'),
+        )
+    else:
+        # answered from the indexes, one cached rendering per filter
+        key = known_hosts.filter_key(network, pkh, transport)
+        rendered = known_hosts.rendered(
+            ('known_hosts',) + key,
+            lambda hosts: (json.dumps(hosts.select(*key)).encode(), 'application/json'),
+        )
+    return respond(request, rendered)
 
 
 def custom_disallowed_host_handler(request, exception):
-    logger.warning(f"DisallowedHost: {request.get_host()}")
+    logger.warning("DisallowedHost: %s", request.get_host())
     return HttpResponseBadRequest("Invalid Host Header")
+
+
+class LeanProvideCollateralView(PlainCollateralView):
+    """
+    The collateral endpoint without drf. The body is parsed with orjson,
+    the checks run directly and the response is written as is, with no
+    content negotiation, parser selection or serializer. Responses match
+    ProvideCollateralView.
+    """
+
+    @staticmethod
+    def json_response(data, status):
+        return HttpResponse(orjson.dumps(data), content_type='application/json', status=status)
+
+    def http_method_not_allowed(self, request, *args, **kwargs):
+        ip_address = get_client_ip(request)
+        logger.warning('Get Request Received From IP: %s Method Not Allowed: %s On %s', ip_address, request.method, request.path, extra={'ip': ip_address})
+        return self.json_response({"detail": "Method Not Allowed"}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    def dispatch(self, request, *args, **kwargs):
+        response = super().dispatch(request, *args, **kwargs)
+        return add_rate_limit_headers(request, response)
+
+    def post(self, request, environment):
+        # Get client's IP address
+        ip_address = get_client_ip(request)
+        logger.debug('Request Received From IP: %s For Environment: %s', ip_address, environment, extra={'ip': ip_address})
+
+        throttled = self.check_throttles(request)
+        if throttled is not None:
+            return throttled
+
+        # Check if the environment is valid
+        networks = list(settings.ENVIRONMENTS.keys())
+        env_settings = settings.ENVIRONMENTS.get(environment)
+        if not env_settings:
+            logger.error('Invalid Environment %s From IP: %s', environment, ip_address, extra={'ip': ip_address})
+            metrics.reject('Invalid Environment')
+            return self.json_response({"error": "Invalid Environment"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            tx_body_cbor = self.tx_body_from(request)
+            tx = check_tx(tx_body_cbor, environment, env_settings, ip_address, networks, logger)
+            evaluate(environment, tx, logger)
+        except (exceptions.ParseError, exceptions.UnsupportedMediaType) as e:
+            metrics.reject(e.detail)
+            return self.json_response({"detail": e.detail}, status=e.status_code)
+        except serializers.ValidationError as e:
+            logger.error('Invalid Data From IP: %s: %s', ip_address, e.detail, extra={'ip': ip_address})
+            metrics.reject(e.detail)
+            return self.json_response({'tx_body': e.detail}, status=status.HTTP_400_BAD_REQUEST)
+
+        witness_cbor = witness_for(environment, tx)
+        logger.debug('Successfully Processed Tx Witness For IP: %s On Environment: %s', ip_address, environment, extra={'ip': ip_address})
+
+        # Return the witness data
+        return self.json_response({'witness': witness_cbor}, status=status.HTTP_200_OK)
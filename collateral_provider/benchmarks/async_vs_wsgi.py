@@ -0,0 +1,104 @@
+"""
+Compares the WSGI collateral view with the async view under a slow upstream.
+
+The WSGI side is a fixed pool of threads, each standing in for one sync
+gunicorn worker that blocks for the whole evaluation. The async side is a
+single event loop that keeps every request in flight at once. Both go
+through the full middleware stack against a local stub Koios that answers
+after --latency seconds. The verdict cache and throttling are disabled and
+every request sends its own tx, so each one is evaluated.
+
+    cd collateral_provider
+    python -m benchmarks.async_vs_wsgi --requests 400 --concurrency 200 --workers 4 --latency 0.25
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from benchmarks.common import (report, setup_django, start_stub_koios,
+                               temporary_directory)
+from benchmarks.fixtures import bench_settings
+
+setup_django()
+
+from django.test import AsyncClient, Client, override_settings  # noqa: E402
+from django.urls import re_path  # noqa: E402
+
+from api.simulate import close_sessions  # noqa: E402
+from api.synthetic import SHAPES, synthetic_tx  # noqa: E402
+from api.views import AsyncProvideCollateralView, ProvideCollateralView  # noqa: E402
+
+urlpatterns = [
+    re_path(r'^wsgi/(?P<environment>[^/]+)/collateral/?$', ProvideCollateralView.as_view()),
+    re_path(r'^asgi/(?P<environment>[^/]+)/collateral/?$', AsyncProvideCollateralView.as_view()),
+]
+
+
+def run_wsgi(workers: int, bodies: list) -> tuple:
+    client = Client(headers={'host': 'testserver'})
+
+    def one(body):
+        start = time.perf_counter()
+        response = client.post('/wsgi/preprod/collateral/', body, content_type='application/json')
+        assert response.status_code == 200, response.content
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        latencies = list(pool.map(one, bodies))
+    return latencies, time.perf_counter() - start
+
+
+async def run_asgi(concurrency: int, bodies: list) -> tuple:
+    client = AsyncClient()
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(body):
+        async with slots:
+            start = time.perf_counter()
+            response = await client.post('/asgi/preprod/collateral/', body, content_type='application/json')
+            assert response.status_code == 200, response.content
+            return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(one(body) for body in bodies))
+    return latencies, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=100, help='in-flight requests on the async view')
+    parser.add_argument('--workers', type=int, default=4, help='sync workers on the wsgi view')
+    parser.add_argument('--latency', type=float, default=0.25, help='seconds the stub upstream takes')
+    args = parser.parse_args()
+
+    stub = start_stub_koios(args.latency)
+    # a distinct tx per request, single-flight would coalesce copies of one into a single evaluation
+    bodies = [{'tx_body': synthetic_tx(SHAPES['minimal'], seed=seed)} for seed in range(2 * args.requests)]
+    with temporary_directory() as directory:
+        overrides = bench_settings(directory, f'http://127.0.0.1:{stub.server_port}/api/v1/ogmios')
+        overrides['KOIOS'] = {
+            'CONNECT_TIMEOUT': 3.05,
+            'READ_TIMEOUT': 30.0,
+            'RETRIES': 0,
+            'BACKOFF_FACTOR': 0,
+            'POOL_SIZE': args.workers,
+            'ASYNC_POOL_SIZE': args.concurrency,
+        }
+        overrides['VERDICT_CACHE'] = {'ENABLED': False, 'TTL': 0, 'FAILURE_TTL': 0, 'MAX_ENTRIES': 0}
+        with override_settings(ROOT_URLCONF=__name__, **overrides), \
+                patch('api.views.ProvideCollateralThrottle.allow_request', return_value=True):
+            print(f"{args.requests} requests, upstream latency {args.latency * 1000:.0f} ms")
+            latencies, elapsed = run_wsgi(args.workers, bodies[:args.requests])
+            report(f"wsgi {args.workers} workers", latencies, elapsed)
+            latencies, elapsed = asyncio.run(run_asgi(args.concurrency, bodies[args.requests:]))
+            report(f"asgi {args.concurrency} in flight", latencies, elapsed)
+            close_sessions()
+    stub.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+Shared setup for the benchmarks in this folder. Run them from the
+collateral_provider folder, e.g. `python -m benchmarks.async_vs_wsgi`.
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+
+def setup_django():
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'collateral_provider.settings')
+    import django
+    django.setup()
+
+
+# the evaluation error of a tx that fails, as koios and ogmios send it
+EVALUATION_ERROR = {'code': 3010, 'message': 'Some scripts of the transaction terminated with error(s).'}
+
+
+def stub_outcome(server) -> str:
+    """Picks how the stub answers one evaluation, by the server's rates."""
+    roll = random.random()
+    if roll < server.error_rate:
+        return 'error'
+    if roll < server.error_rate + server.reject_rate:
+        return 'reject'
+    return 'pass'
+
+
+class StubKoiosHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(self.server.latency)
+        outcome = stub_outcome(self.server)
+        if outcome == 'error':
+            # the pooled session retries a 503, then gives up on the upstream
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        reply = {'jsonrpc': '2.0', 'method': 'evaluateTransaction'}
+        if outcome == 'reject':
+            reply['error'] = EVALUATION_ERROR
+        else:
+            reply['result'] = []
+        payload = json.dumps(reply).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_koios(latency: float, error_rate: float = 0.0, reject_rate: float = 0.0,
+                     port: int = 0) -> ThreadingHTTPServer:
+    """
+    A local Koios that answers after `latency` seconds. An `error_rate`
+    fraction of evaluations get a 503 and a `reject_rate` fraction fail,
+    the rest pass.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubKoiosHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.error_rate = error_rate
+    server.reject_rate = reject_rate
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_stub_ogmios(latency: float, error_rate: float = 0.0, reject_rate: float = 0.0,
+                      port: int = 0) -> SimpleNamespace:
+    """
+    A local Ogmios websocket with the same rates as start_stub_koios. An
+    error closes the connection, failing whatever is in flight on it, like
+    a restarting node. Returns the port and a stop function.
+    """
+    import asyncio
+
+    import websockets
+
+    settings = SimpleNamespace(latency=latency, error_rate=error_rate, reject_rate=reject_rate)
+
+    async def answer(ws, request):
+        await asyncio.sleep(latency)
+        outcome = stub_outcome(settings)
+        if outcome == 'error':
+            await ws.close()
+            return
+        reply = {'jsonrpc': '2.0', 'method': 'evaluateTransaction', 'id': request.get('id')}
+        if outcome == 'reject':
+            reply['error'] = EVALUATION_ERROR
+        else:
+            reply['result'] = []
+        try:
+            await ws.send(json.dumps(reply))
+        except websockets.ConnectionClosed:
+            pass
+
+    async def handler(ws):
+        # evaluations on one socket are answered concurrently, matched by id
+        tasks = set()
+        try:
+            async for message in ws:
+                task = asyncio.ensure_future(answer(ws, json.loads(message)))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except websockets.ConnectionClosed:
+            # a worker going away mid run
+            pass
+
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+    stub = SimpleNamespace(port=None)
+
+    async def serve():
+        server = await websockets.serve(handler, '127.0.0.1', port)
+        stub.port = server.sockets[0].getsockname()[1]
+        stub.server = server
+        ready.set()
+        await server.wait_closed()
+
+    def stop():
+        loop.call_soon_threadsafe(stub.server.close)
+
+    stub.stop = stop
+    threading.Thread(target=loop.run_until_complete, args=(serve(),), daemon=True).start()
+    ready.wait()
+    return stub
+
+
+def temporary_directory():
+    return tempfile.TemporaryDirectory()
+
+
+def percentile(samples: list, q: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def report(name: str, latencies: list, elapsed: float) -> None:
+    print(
+        f"{name:<24} {len(latencies) / elapsed:>9.1f} req/s"
+        f"  p50 {percentile(latencies, 50) * 1000:>8.1f} ms"
+        f"  p95 {percentile(latencies, 95) * 1000:>8.1f} ms"
+        f"  p99 {percentile(latencies, 99) * 1000:>8.1f} ms"
+    )
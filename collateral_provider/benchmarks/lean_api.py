@@ -0,0 +1,103 @@
+"""
+Measures what the framework costs per /collateral/ request, the drf view
+behind the full middleware stack against the lean view behind the lean
+stack. The checks, the evaluation and the signing are stubbed out so only
+the request path is timed: middleware, parsing, validation plumbing and
+rendering. Both sides go through the same django test client, so its own
+cost is in both numbers and cancels out of the difference.
+
+    cd collateral_provider
+    python -m benchmarks.lean_api --requests 5000
+"""
+import argparse
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from benchmarks.common import percentile, setup_django, temporary_directory
+from benchmarks.fixtures import FIXTURE_TX, bench_settings
+
+setup_django()
+
+from django.test import Client, override_settings  # noqa: E402
+from django.urls import re_path  # noqa: E402
+
+from api.views import LeanProvideCollateralView, ProvideCollateralView  # noqa: E402
+
+urlpatterns = [
+    re_path(r'^drf/(?P<environment>[^/]+)/collateral/?$', ProvideCollateralView.as_view()),
+    re_path(r'^lean/(?P<environment>[^/]+)/collateral/?$', LeanProvideCollateralView.as_view()),
+]
+
+FULL_MIDDLEWARE = [
+    'api.middleware.HandleDisallowedHostMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
+]
+
+LEAN_MIDDLEWARE = [
+    'api.middleware.HandleDisallowedHostMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
+]
+
+# what the stubbed pipeline hands back, the witness is a fixed string
+STUB_TX = SimpleNamespace(witness=None)
+STUB_WITNESS = '825820' + '00' * 32 + '5840' + '00' * 64
+
+
+def run(path: str, middleware: list, requests: int, body: dict) -> list:
+    with override_settings(MIDDLEWARE=middleware):
+        # a new client builds its handler, and so its middleware chain, under these settings
+        client = Client(headers={'host': 'testserver'})
+        # warm up imports, url resolution and the middleware chain
+        for _ in range(50):
+            client.post(path, body, content_type='application/json')
+        latencies = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            response = client.post(path, body, content_type='application/json')
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.content
+    return latencies
+
+
+def report(name: str, latencies: list) -> float:
+    p50 = percentile(latencies, 50) * 1e6
+    print(
+        f"{name:<28} p50 {p50:>8.1f} us"
+        f"  p95 {percentile(latencies, 95) * 1e6:>8.1f} us"
+        f"  p99 {percentile(latencies, 99) * 1e6:>8.1f} us"
+    )
+    return p50
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    # one body is enough, the requests go one at a time and the evaluation is stubbed,
+    # so single-flight never has two of them to coalesce
+    body = {'tx_body': FIXTURE_TX}
+    with temporary_directory() as directory:
+        overrides = bench_settings(directory, 'http://127.0.0.1:9/unused')
+        with override_settings(ROOT_URLCONF=__name__, **overrides), \
+                patch('api.views.ProvideCollateralThrottle.allow_request', return_value=True), \
+                patch('api.serializers.check_tx', return_value=STUB_TX), \
+                patch('api.serializers.evaluate'), \
+                patch('api.views.check_tx', return_value=STUB_TX), \
+                patch('api.views.evaluate'), \
+                patch('api.views.witness_for', return_value=STUB_WITNESS):
+            print(f"{args.requests} requests, pipeline stubbed, framework only")
+            drf = report("drf view, full middleware", run('/drf/preprod/collateral/', FULL_MIDDLEWARE, args.requests, body))
+            lean = report("lean view, lean middleware", run('/lean/preprod/collateral/', LEAN_MIDDLEWARE, args.requests, body))
+            print(f"{'saved per request':<28} p50 {drf - lean:>8.1f} us ({(drf - lean) / drf * 100:.0f}%)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Measures what it costs to boot one worker: the time to import and set up
+the app and the resident memory once it is loaded. Each run is a fresh
+interpreter, as a new gunicorn worker would be, that builds the WSGI or
+ASGI application and imports the url conf, which pulls in every view.
+
+    cd collateral_provider
+    python -m benchmarks.startup --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# modules the request path should not need, reported when a worker loads them
+HEAVY = ['pycardano', 'cryptography', 'typeguard', 'pydantic', 'websockets', 'django.contrib.auth.models']
+
+CHILD = """
+import json, os, sys, time
+start = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'collateral_provider.settings')
+if {asgi}:
+    from django.core.asgi import get_asgi_application as get_application
+else:
+    from django.core.wsgi import get_wsgi_application as get_application
+get_application()
+import collateral_provider.urls
+elapsed = time.perf_counter() - start
+with open('/proc/self/status') as status:
+    rss = next(int(line.split()[1]) for line in status if line.startswith('VmRSS:'))
+print(json.dumps({{
+    'seconds': elapsed,
+    'rss_kb': rss,
+    'modules': len(sys.modules),
+    'heavy': [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+
+def boot(asgi: bool) -> dict:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD.format(asgi=asgi, heavy=HEAVY)],
+        cwd=root, capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--asgi', action='store_true', help='boot the ASGI application instead')
+    args = parser.parse_args()
+
+    runs = [boot(args.asgi) for _ in range(args.runs)]
+    seconds = [run['seconds'] * 1000 for run in runs]
+    rss = [run['rss_kb'] / 1024 for run in runs]
+    print(f"{args.runs} {'asgi' if args.asgi else 'wsgi'} worker boots")
+    print(f"{'import and setup':<20} median {statistics.median(seconds):>7.1f} ms  min {min(seconds):>7.1f} ms")
+    print(f"{'resident memory':<20} median {statistics.median(rss):>7.1f} MB  max {max(rss):>7.1f} MB")
+    print(f"{'modules loaded':<20} {runs[-1]['modules']}")
+    print(f"{'heavy modules':<20} {', '.join(runs[-1]['heavy']) or 'none'}")
+
+
+if __name__ == '__main__':
+    main()
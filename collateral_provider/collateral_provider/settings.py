@@ -20,8 +20,9 @@ environ.Env.read_env(env_file)
 
 # Add your variables here
 PKH = env('PKH')
-SKEY_PATH = os.path.join(BASE_DIR, 'api/key/payment.skey')
-VKEY_PATH = os.path.join(BASE_DIR, 'api/key/payment.vkey')
+# the collateral keys, elsewhere e.g. for throwaway keys under a load test
+SKEY_PATH = env('SKEY_PATH', default=os.path.join(BASE_DIR, 'api/key/payment.skey'))
+VKEY_PATH = env('VKEY_PATH', default=os.path.join(BASE_DIR, 'api/key/payment.vkey'))
 SECRET_KEY = env('DJANGO_SECRET_KEY')
 ENVIRONMENT = env('ENVIRONMENT')
 
@@ -31,22 +32,148 @@ ENVIRONMENTS = {
         'NETWORK': env("PREPROD_NETWORK"),
         'TXID': env('PREPROD_TXID'),
         'TXIDX': env.int('PREPROD_TXIDX'),
+        'KOIOS_URL': env('PREPROD_KOIOS_URL', default='https://preprod.koios.rest/api/v1/ogmios'),
+        # koios or ogmios
+        'EVALUATOR': env('PREPROD_EVALUATOR', default='koios'),
+        'OGMIOS_URL': env('PREPROD_OGMIOS_URL', default='ws://127.0.0.1:1337'),
     },
     'mainnet': {
         'NETWORK': env("MAINNET_NETWORK"),
         'TXID': env('MAINNET_TXID'),
         'TXIDX': env.int('MAINNET_TXIDX'),
+        'KOIOS_URL': env('MAINNET_KOIOS_URL', default='https://api.koios.rest/api/v1/ogmios'),
+        # koios or ogmios
+        'EVALUATOR': env('MAINNET_EVALUATOR', default='koios'),
+        'OGMIOS_URL': env('MAINNET_OGMIOS_URL', default='ws://127.0.0.1:1337'),
     },
 }
 
+# pooled http client used to evaluate transactions on koios
+KOIOS = {
+    # seconds to wait for the tcp/tls connection
+    'CONNECT_TIMEOUT': env.float('KOIOS_CONNECT_TIMEOUT', default=3.05),
+    # seconds to wait between bytes of the response
+    'READ_TIMEOUT': env.float('KOIOS_READ_TIMEOUT', default=10.0),
+    # retries on connection errors and 502/503/504, evaluation is idempotent
+    'RETRIES': env.int('KOIOS_RETRIES', default=2),
+    'BACKOFF_FACTOR': env.float('KOIOS_BACKOFF_FACTOR', default=0.1),
+    # keep-alive connections per environment and worker
+    'POOL_SIZE': env.int('KOIOS_POOL_SIZE', default=10),
+    # connections per environment for the async view, which holds many requests at once
+    'ASYNC_POOL_SIZE': env.int('KOIOS_ASYNC_POOL_SIZE', default=100),
+}
+
+# sqlite file shared by every worker on the host, e.g. for the verdict cache
+SHARED_STORE_PATH = env('SHARED_STORE_PATH', default=os.path.join(BASE_DIR, 'shared.sqlite3'))
+
+# evaluation verdicts and witnesses keyed by tx hash so retries skip the upstream
+VERDICT_CACHE = {
+    'ENABLED': env.bool('VERDICT_CACHE_ENABLED', default=True),
+    # seconds a passing verdict and its witness are reused
+    'TTL': env.int('VERDICT_CACHE_TTL', default=300),
+    # seconds a failing verdict is reused, short so chained txs can pass soon after
+    'FAILURE_TTL': env.int('VERDICT_CACHE_FAILURE_TTL', default=30),
+    'MAX_ENTRIES': env.int('VERDICT_CACHE_MAX_ENTRIES', default=10000),
+}
+
+# banned ip addresses, CIDR ranges and addresses, reloaded when the file changes
+BAN_LIST_PATH = env('BAN_LIST_PATH', default=os.path.join(BASE_DIR.parent, 'ban.list.json'))
+
+# the known hosts file behind the landing page, reloaded when the file changes
+KNOWN_HOSTS_PATH = env('KNOWN_HOSTS_PATH', default=os.path.join(BASE_DIR.parent, 'known.hosts.json'))
+# seconds clients and proxies may reuse the landing page and known hosts
+KNOWN_HOSTS_MAX_AGE = env.int('KNOWN_HOSTS_MAX_AGE', default=300)
+
+# per stage latency, rejections and requests in flight, added up across
+# workers through the shared store and served on /metrics to ALLOWED_IPS
+METRICS = {
+    'ENABLED': env.bool('METRICS_ENABLED', default=True),
+    # seconds between each worker's writes to the shared store
+    'FLUSH_INTERVAL': env.float('METRICS_FLUSH_INTERVAL', default=1.0),
+    # seconds after which a silent worker's counters are folded into one row
+    'RETIRE_AFTER': env.float('METRICS_RETIRE_AFTER', default=3600.0),
+    # addresses or CIDR ranges allowed to scrape /metrics directly, not through a proxy
+    'ALLOWED_IPS': env.list('METRICS_ALLOWED_IPS', default=['127.0.0.1', '::1']),
+    # when set, scrapers sending it as a bearer token are let in too, from anywhere
+    'TOKEN': env('METRICS_TOKEN', default=None),
+}
+
+# samples a fraction of /collateral/ requests with a stack sampler and
+# tracemalloc and keeps dumps of the slow ones, read on /profiles/ or with
+# `python manage.py profiles`
+PROFILER = {
+    'ENABLED': env.bool('PROFILER_ENABLED', default=False),
+    # fraction of collateral requests profiled
+    'SAMPLE_RATE': env.float('PROFILER_SAMPLE_RATE', default=0.01),
+    # profiled requests slower than this are kept
+    'THRESHOLD_MS': env.float('PROFILER_THRESHOLD_MS', default=500.0),
+    # milliseconds between stack samples
+    'INTERVAL_MS': env.float('PROFILER_INTERVAL_MS', default=5.0),
+    'MEMORY': env.bool('PROFILER_MEMORY', default=True),
+    # lines that allocated the most, kept with a slow request's dump
+    'TOP_ALLOCATIONS': env.int('PROFILER_TOP_ALLOCATIONS', default=10),
+    # newest dumps kept, older ones are deleted
+    'KEEP': env.int('PROFILER_KEEP', default=50),
+    'DIR': env('PROFILER_DIR', default=os.path.join(BASE_DIR, 'profiles')),
+    # same rules as /metrics, a bearer token or a direct request from ALLOWED_IPS
+    'ALLOWED_IPS': env.list('PROFILER_ALLOWED_IPS', default=['127.0.0.1', '::1']),
+    'TOKEN': env('PROFILER_TOKEN', default=None),
+}
+
+# opt in, appends a sample of /collateral/ requests to a JSONL file for
+# scripts/stress_test/replay.py, the client ip is replaced by a keyed hash
+CAPTURE = {
+    'PATH': env('CAPTURE_PATH', default=None),
+    # fraction of requests captured
+    'SAMPLE_RATE': env.float('CAPTURE_SAMPLE_RATE', default=1.0),
+    # capturing stops once the file holds this many bytes, 0 for no limit
+    'MAX_BYTES': env.int('CAPTURE_MAX_BYTES', default=100 * 1024 * 1024),
+}
+
+# the budget a tx's raw CBOR is scanned within before anything is decoded,
+# a deeper or larger tx is rejected as too complex
+CBOR_SCAN = {
+    'MAX_DEPTH': env.int('CBOR_SCAN_MAX_DEPTH', default=64),
+    'MAX_ITEMS': env.int('CBOR_SCAN_MAX_ITEMS', default=10000),
+}
+
+# the batch endpoint, txs per request and evaluations in flight per worker
+BATCH = {
+    'MAX_SIZE': env.int('BATCH_MAX_SIZE', default=50),
+    'WORKERS': env.int('BATCH_WORKERS', default=8),
+}
+
+# identical requests in flight share one evaluation, across workers through the shared store
+SINGLE_FLIGHT = {
+    'ACROSS_WORKERS': env.bool('SINGLE_FLIGHT_ACROSS_WORKERS', default=True),
+    # seconds a waiting worker polls for the result of another before evaluating itself
+    'WAIT': env.float('SINGLE_FLIGHT_WAIT', default=15.0),
+    'POLL_INTERVAL': env.float('SINGLE_FLIGHT_POLL_INTERVAL', default=0.05),
+    # seconds before the lease of a worker that died is taken over
+    'LOCK_TTL': env.float('SINGLE_FLIGHT_LOCK_TTL', default=30.0),
+}
+
+# persistent websocket used when an environment evaluates on a self-hosted ogmios
+OGMIOS = {
+    'CONNECT_TIMEOUT': env.float('OGMIOS_CONNECT_TIMEOUT', default=5.0),
+    # seconds to wait for an evaluation reply
+    'TIMEOUT': env.float('OGMIOS_TIMEOUT', default=10.0),
+}
+
 # False is production
 DEBUG = False
 
+# serve /collateral/ with the async view, run under ASGI when this is on
+ASYNC_API = env.bool('ASYNC_API', default=False)
+
+# serve /collateral/ with the view that skips drf, and drop the csrf and
+# common middleware the anonymous api never uses
+LEAN_API = env.bool('LEAN_API', default=False)
+
 ALLOWED_HOSTS = ['127.0.0.1', 'localhost'] if ENVIRONMENT == "development" else env.list('ALLOWED_HOSTS')
 
+# the api is anonymous and stateless, no auth, contenttypes or sessions
 INSTALLED_APPS = [
-    'django.contrib.auth',
-    'django.contrib.contenttypes',
     'django.contrib.staticfiles',
     'rest_framework',
     'corsheaders',
@@ -54,16 +181,28 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'api.middleware.HandleDisallowedHostMiddleware',
+    'api.middleware.ProfilerMiddleware',
+    'api.middleware.CaptureMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
     'corsheaders.middleware.CorsMiddleware',
 ]
 
+if LEAN_API:
+    MIDDLEWARE = [
+        'api.middleware.MetricsMiddleware',
+        'api.middleware.HandleDisallowedHostMiddleware',
+        'api.middleware.ProfilerMiddleware',
+        'api.middleware.CaptureMiddleware',
+        'django.middleware.security.SecurityMiddleware',
+        'django.middleware.clickjacking.XFrameOptionsMiddleware',
+        'corsheaders.middleware.CorsMiddleware',
+    ]
+
 ROOT_URLCONF = 'collateral_provider.urls'
 
 WSGI_APPLICATION = 'collateral_provider.wsgi.application'
@@ -78,8 +217,6 @@ TEMPLATES = [
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
-                'django.contrib.auth.context_processors.auth',
-                'django.contrib.messages.context_processors.messages',
             ],
         },
     },
@@ -92,6 +229,9 @@ DATABASES = {
     }
 }
 
+# the tests get their own shared store, emptied before each test
+TEST_RUNNER = 'collateral_provider.test_runner.TestRunner'
+
 LANGUAGE_CODE = 'en-us'
 
 TIME_ZONE = 'UTC'
@@ -103,6 +243,10 @@ USE_TZ = True
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
+    # anonymous requests only, so drf never loads django.contrib.auth
+    'DEFAULT_AUTHENTICATION_CLASSES': [],
+    'DEFAULT_PERMISSION_CLASSES': [],
+    'UNAUTHENTICATED_USER': None,
     'DEFAULT_THROTTLE_CLASSES': [
         'rest_framework.throttling.AnonRateThrottle',
     ],
@@ -115,6 +259,17 @@ REST_FRAMEWORK = {
 CORS_ALLOW_ALL_ORIGINS = True
 
 # Logging configuration
+# DEBUG logs every request, keep production at INFO or above
+LOG_LEVEL = env('LOG_LEVEL', default='DEBUG' if ENVIRONMENT == 'development' else 'INFO')
+LOG_PATH = env('LOG_PATH', default=os.path.join(BASE_DIR, 'debug.log'))
+# json lines, or verbose for plain text
+LOG_FORMAT = env('LOG_FORMAT', default='json')
+# the same message from the same ip is logged at most BURST times per WINDOW seconds, 0 logs all
+LOG_SAMPLING = {
+    'BURST': env.int('LOG_SAMPLE_BURST', default=5),
+    'WINDOW': env.float('LOG_SAMPLE_WINDOW', default=60.0),
+}
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -127,6 +282,16 @@ LOGGING = {
             'format': '{levelname} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'api.log.JsonFormatter',
+        },
+    },
+    'filters': {
+        'sample': {
+            '()': 'api.log.SampleFilter',
+            'burst': LOG_SAMPLING['BURST'],
+            'window': LOG_SAMPLING['WINDOW'],
+        },
     },
     'handlers': {
         'console': {
@@ -134,11 +299,13 @@ LOGGING = {
             'class': 'logging.StreamHandler',
             'formatter': 'simple',
         },
+        # written by a background thread, requests never wait on the disk
         'file': {
-            'level': 'DEBUG',
-            'class': 'logging.handlers.RotatingFileHandler',
-            'filename': os.path.join(BASE_DIR, 'debug.log'),
-            'formatter': 'verbose',
+            'level': LOG_LEVEL,
+            '()': 'api.log.QueuedHandler',
+            'filename': LOG_PATH,
+            'formatter': LOG_FORMAT,
+            'filters': ['sample'],
             'maxBytes': 1024 * 1024 * 1,
             'backupCount': 3,
         },
@@ -146,12 +313,12 @@ LOGGING = {
     'loggers': {
         'django': {
             'handlers': ['file'],
-            'level': 'DEBUG',
+            'level': LOG_LEVEL,
             'propagate': True,
         },
         'api': {
             'handlers': ['file'],
-            'level': 'DEBUG',
+            'level': LOG_LEVEL,
             'propagate': False,
         },
         'django.security.DisallowedHost': {
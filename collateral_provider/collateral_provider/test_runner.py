@@ -0,0 +1,50 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+from api import verdicts
+from api.store import get_store
+
+
+def empty_shared_store() -> None:
+    # the tables stay, every feature created its schema once per process
+    conn = get_store().connection()
+    tables = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+    for (table,) in tables:
+        conn.execute(f'DELETE FROM "{table}"')
+    # and the per-process caches in front of them start empty too
+    with verdicts._caches_lock:
+        verdicts._caches.clear()
+
+
+class SharedStoreResult(unittest.TextTestResult):
+    """Every test starts from an empty shared store, no buckets or verdicts left over."""
+
+    def startTest(self, test):
+        empty_shared_store()
+        super().startTest(test)
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Runs the tests against a shared store in a temporary directory, so
+    neither the tests nor the metrics exporter thread write to the working
+    tree's SHARED_STORE_PATH.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.store_directory = tempfile.mkdtemp(prefix='collateral-tests-')
+        # left in place at teardown, the exporter thread writes until the process exits
+        override_settings(SHARED_STORE_PATH=os.path.join(self.store_directory, 'shared.sqlite3')).enable()
+
+    def teardown_test_environment(self, **kwargs):
+        shutil.rmtree(self.store_directory, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
+
+    def get_resultclass(self):
+        return super().get_resultclass() or SharedStoreResult
@@ -1,11 +1,26 @@
-from api.views import (ProvideCollateralView, custom_disallowed_host_handler,
-                       custom_page_not_found, known_hosts_view, landing_page)
+from api.views import (AsyncProvideCollateralView, BatchCollateralView,
+                       LeanProvideCollateralView, ProvideCollateralView,
+                       custom_disallowed_host_handler, custom_page_not_found,
+                       known_hosts_view, landing_page, metrics_view,
+                       profile_view, profiles_view)
+from django.conf import settings
 from django.urls import path, re_path
 
+if settings.ASYNC_API:
+    collateral_view = AsyncProvideCollateralView
+elif settings.LEAN_API:
+    collateral_view = LeanProvideCollateralView
+else:
+    collateral_view = ProvideCollateralView
+
 urlpatterns = [
     path('', landing_page, name='landing_page'),
-    re_path(r'^(?P<environment>[^/]+)/collateral/?$', ProvideCollateralView.as_view(), name='collateral'),
+    re_path(r'^(?P<environment>[^/]+)/collateral/?$', collateral_view.as_view(), name='collateral'),
+    re_path(r'^(?P<environment>[^/]+)/collateral/batch/?$', BatchCollateralView.as_view(), name='collateral_batch'),
     re_path(r'^known_hosts/?$', known_hosts_view, name='known_hosts'),
+    re_path(r'^metrics/?$', metrics_view, name='metrics'),
+    re_path(r'^profiles/?$', profiles_view, name='profiles'),
+    re_path(r'^profiles/(?P<profile_id>[0-9-]+)/?$', profile_view, name='profile'),
 ]
 
 handler404 = custom_page_not_found
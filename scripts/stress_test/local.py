@@ -0,0 +1,140 @@
+"""
+Load tests the provider offline. A stub Koios or Ogmios answers every
+evaluation after --latency seconds, with --error-rate of them failing
+upstream and --reject-rate of them rejecting the tx. The app is served by
+gunicorn with throwaway keys, a temporary shared store and log, and the
+fixture collateral and pkh the locustfile's valid txs are built for.
+Locust then runs headless against it and the stats of each scenario are
+printed at the end.
+
+    pip install locust
+    cd scripts
+    python -m stress_test.local --users 50 --spawn-rate 10 --run-time 1m --workers 4 --latency 0.05
+
+Settings still exit without collateral_provider/.env, an empty one is
+enough, every value the run needs is set here.
+"""
+import argparse
+import csv
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'collateral_provider'))
+sys.path.insert(0, APP_DIR)
+
+from benchmarks.common import start_stub_koios, start_stub_ogmios  # noqa: E402
+from benchmarks.fixtures import (FIXTURE_PKH, FIXTURE_TXID,  # noqa: E402
+                                 FIXTURE_TXIDX, write_keys)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def app_environment(directory: str, args, evaluator_url: str) -> dict:
+    skey_path, vkey_path = write_keys(directory)
+    environment = dict(os.environ)
+    environment.update({
+        'PKH': FIXTURE_PKH,
+        'SKEY_PATH': skey_path,
+        'VKEY_PATH': vkey_path,
+        'DJANGO_SECRET_KEY': 'stress-test-only',
+        'ENVIRONMENT': 'production',
+        'ALLOWED_HOSTS': '127.0.0.1,localhost',
+        'SHARED_STORE_PATH': os.path.join(directory, 'shared.sqlite3'),
+        'LOG_PATH': os.path.join(directory, 'debug.log'),
+        'LOG_LEVEL': 'WARNING',
+        'PREPROD_NETWORK': '--testnet-magic 1',
+        'PREPROD_TXID': FIXTURE_TXID,
+        'PREPROD_TXIDX': str(FIXTURE_TXIDX),
+        'PREPROD_EVALUATOR': args.evaluator,
+        'PREPROD_KOIOS_URL': evaluator_url,
+        'PREPROD_OGMIOS_URL': evaluator_url,
+        # settings read mainnet too, it is never requested here
+        'MAINNET_NETWORK': '--mainnet',
+        'MAINNET_TXID': FIXTURE_TXID,
+        'MAINNET_TXIDX': str(FIXTURE_TXIDX),
+    })
+    return environment
+
+
+def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"The App Exited With {process.returncode}")
+        try:
+            urllib.request.urlopen(url, timeout=1)
+            return
+        except urllib.error.HTTPError:
+            # any answer means the workers are serving
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit(f"The App Did Not Come Up On {url}")
+
+
+def report(stats_path: str) -> None:
+    with open(stats_path, newline='') as file:
+        rows = list(csv.DictReader(file))
+    print(f"{'scenario':<12} {'requests':>9} {'failures':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for row in rows:
+        print(
+            f"{row['Name']:<12} {row['Request Count']:>9} {row['Failure Count']:>9} "
+            f"{float(row['Requests/s']):>8.1f} {row['50%']:>8} {row['95%']:>8} {row['99%']:>8}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--spawn-rate', type=float, default=10)
+    parser.add_argument('--run-time', default='1m')
+    parser.add_argument('--workers', type=int, default=4, help="gunicorn workers")
+    parser.add_argument('--threads', type=int, default=4, help="threads per gunicorn worker")
+    parser.add_argument('--evaluator', choices=('koios', 'ogmios'), default='koios')
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds the stub takes per evaluation")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of evaluations failing upstream")
+    parser.add_argument('--reject-rate', type=float, default=0.0, help="fraction of evaluations rejecting the tx")
+    args = parser.parse_args()
+
+    if args.evaluator == 'ogmios':
+        stub = start_stub_ogmios(args.latency, args.error_rate, args.reject_rate)
+        evaluator_url = f"ws://127.0.0.1:{stub.port}"
+    else:
+        stub = start_stub_koios(args.latency, args.error_rate, args.reject_rate)
+        evaluator_url = f"http://127.0.0.1:{stub.server_address[1]}"
+
+    with tempfile.TemporaryDirectory() as directory:
+        port = free_port()
+        host = f"http://127.0.0.1:{port}"
+        app = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', 'collateral_provider.wsgi',
+             '--bind', f"127.0.0.1:{port}", '--workers', str(args.workers), '--threads', str(args.threads)],
+            cwd=APP_DIR, env=app_environment(directory, args, evaluator_url),
+        )
+        try:
+            wait_until_up(f"{host}/known_hosts/", app)
+            stats = os.path.join(directory, 'stats')
+            subprocess.run(
+                [sys.executable, '-m', 'locust', '-f', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'locustfile.py'),
+                 '--headless', '--host', host, '--users', str(args.users), '--spawn-rate', str(args.spawn_rate),
+                 '--run-time', args.run_time, '--csv', stats, '--only-summary'],
+                check=False,
+            )
+            report(f"{stats}_stats.csv")
+        finally:
+            app.terminate()
+            app.wait()
+
+
+if __name__ == '__main__':
+    main()
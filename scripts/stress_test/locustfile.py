@@ -1,17 +1,69 @@
+"""
+Load test of the collateral endpoint through Locust's own client, so every
+scenario shows up in its stats with its throughput and percentiles.
+
+The mix is weighted: fresh valid txs, a valid tx that doesn't use the
+collateral, an oversized tx and the fixture tx sent over and over. The valid
+txs are built by api/synthetic.py for the fixture collateral and
+pkh, so only a provider running with those settings witnesses them.
+local.py starts one against a stub evaluator:
+
+    cd scripts
+    python -m stress_test.local --users 50 --run-time 1m
+"""
+import os
+import random
+import sys
+
 from locust import HttpUser, between, task
-from py.query import collat_witness
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'collateral_provider'))
+
+from api.synthetic import MAX_TX_SIZE, SHAPES, TxShape, synthetic_tx  # noqa: E402
+from benchmarks.fixtures import FIXTURE_TX  # noqa: E402
+
+ENVIRONMENT = os.environ.get('STRESS_ENVIRONMENT', 'preprod')
+
+# the shapes of the fresh valid txs, building the larger ones costs the load generator more
+VALID_SHAPES = [SHAPES['minimal'], SHAPES['typical'], SHAPES['typical'], SHAPES['scripts']]
+
+INVALID_TX = synthetic_tx(TxShape(collateral=False))
+OVERSIZED_TX = synthetic_tx(TxShape(size=2 * MAX_TX_SIZE))
+DUPLICATE_TX = FIXTURE_TX
+
+
+class CollateralUser(HttpUser):
+    # the provider allows 60 requests a minute per ip, each user stays under it
+    wait_time = between(1, 2)
+
+    def on_start(self):
+        # every user is its own client, throttled on its own
+        ip = f"10.{random.randrange(256)}.{random.randrange(256)}.{random.randrange(1, 255)}"
+        self.headers = {'X-Forwarded-For': ip}
+        self.path = f"/{ENVIRONMENT}/collateral/"
+
+    def post(self, name: str, tx_body: str, expected: int):
+        with self.client.post(self.path, json={'tx_body': tx_body}, headers=self.headers,
+                              name=name, catch_response=True) as response:
+            if response.status_code == expected:
+                response.success()
+            else:
+                response.failure(f"Expected {expected}, Got {response.status_code}: {response.text[:200]}")
+
+    @task(6)
+    def valid(self):
+        # a new tx every time, nothing is cached
+        self.post('valid', synthetic_tx(random.choice(VALID_SHAPES), random.getrandbits(64)), 200)
 
-class LoadTestUser(HttpUser):
-    wait_time = between(1, 5)
+    @task(2)
+    def invalid(self):
+        self.post('invalid', INVALID_TX, 400)
 
-    @task
-    def test_collat_witness(self):
-        tx_cbor = '84ab00d901028182582041921857027783d566a758c3c77e07804e75313f80c7d3eff63ed8964b467705010dd90102818258201d388e615da2dca607e28f704130d04e39da6f251d551d66d054b75607e0393f0012d901028182582004c9ee8e85ebe51a9702f0cdfab4b2d44dc57a083aeaf478f4829612017eff18010182a300581d705c0cfc947012e6f2b9da8968a592df56109179173d0e05bb37b8f31601821a0018dbfca1581cec0023109dc706d4f894e7b2a908fb715e3599dac3b51e3baa781876a158205eed0e1f746573740141921857027783d566a758c3c77e07804e75313f80c7d301028201d8185868d8799f583097f1d3a73197d7942695638c4fa9ac0fc3688c4f9774b905a14e3a3f171bac586c55e83ff97a1aeffb3af00adb22c6bb5830a06ac9cbf5044a9263a72ce83e6d02d290830c32f3a3b853dc0df631556462f1e39a1f861958bd9202815473a16b994dff82581d60a2d0bdf9260505f38e22ea0fb3bbedc327b7eaea628f9317bcbab9be1a024d08d81082581d60a2d0bdf9260505f38e22ea0fb3bbedc327b7eaea628f9317bcbab9be1a004718bb111a00053285021a000377030ed9010282581c7c24c22d1dc252d31f6022ff22ccc838c2ab83a461172d7c2dae61f4581ca2d0bdf9260505f38e22ea0fb3bbedc327b7eaea628f9317bcbab9be09a1581cec0023109dc706d4f894e7b2a908fb715e3599dac3b51e3baa781876a158205eed0e1f746573740141921857027783d566a758c3c77e07804e75313f80c7d3010b5820130bbefb6d657d98ec4995253b334f886eb53cb4b82a5cde64fc1860a4a88dd407582081c9ab8a4bcdccff7b0e928b51c085dae13ca4099cc42b89ba2d10228f5f8df9a105a1820100824474657374821a000136a41a016239eaf5d90103a100a1006461636162'
+    @task(1)
+    def oversized(self):
+        self.post('oversized', OVERSIZED_TX, 400)
 
-        try:
-            # Call the collat_witness function imported from api_requests
-            witness = collat_witness(tx_cbor, "preprod")
-            print(witness)
-        except Exception as e:
-            print("Exception:", e)
+    @task(2)
+    def duplicate(self):
+        # retries of one tx, answered from the verdict cache
+        self.post('duplicate', DUPLICATE_TX, 200)
@@ -0,0 +1,181 @@
+"""
+Replays a capture of /collateral/ requests, see CAPTURE_PATH in
+collateral_provider/sample.env, against a running provider and diffs each
+outcome and the latencies against the recording.
+
+Requests go out at their recorded arrival offsets divided by --speed, or
+as fast as --concurrency allows with --speed max. Each captured client gets
+its own X-Forwarded-For, so the throttle sees the same clients it did.
+
+    cd scripts
+    python -m stress_test.replay /path/to/capture.jsonl --host http://127.0.0.1:8000 --speed 10 --concurrency 32
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'collateral_provider'))
+
+from api.reasons import outcome_of  # noqa: E402
+
+
+def load(path: str, limit: int = None) -> list:
+    lines = []
+    skipped = 0
+    with open(path) as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                entry = None
+            if isinstance(entry, dict) and isinstance(entry.get('tx_body'), str):
+                lines.append(entry)
+            elif line.strip():
+                skipped += 1
+    if skipped:
+        # e.g. a line cut short when the provider was stopped mid write
+        print(f"Skipped {skipped} Lines That Are Not Captured Requests", file=sys.stderr)
+    lines.sort(key=lambda entry: entry.get('arrival', 0))
+    return lines[:limit] if limit else lines
+
+
+def client_ip(client: str) -> str:
+    # a stable private address per captured client
+    value = int(client[:6], 16) if client else 0
+    return f"10.{value >> 16 & 255}.{value >> 8 & 255}.{value & 255}"
+
+
+def percentile(samples: list, q: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+class Replayer:
+
+    def __init__(self, host: str, timeout: float):
+        self.host = host.rstrip('/')
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def session(self) -> requests.Session:
+        # one keep-alive connection per thread
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def send(self, entry: dict) -> dict:
+        start = time.perf_counter()
+        try:
+            response = self.session().post(
+                f"{self.host}/{entry['environment']}/collateral/",
+                json={'tx_body': entry['tx_body']},
+                headers={'X-Forwarded-For': client_ip(entry.get('client', ''))},
+                timeout=self.timeout,
+            )
+            status, outcome = response.status_code, outcome_of(response.status_code, response.content)
+        except requests.RequestException as e:
+            status, outcome = None, f"Request Failed: {type(e).__name__}"
+        return {'status': status, 'outcome': outcome, 'latency_ms': (time.perf_counter() - start) * 1000}
+
+
+def replay(lines: list, replayer: Replayer, speed, concurrency: int) -> tuple:
+    first = lines[0].get('arrival', 0)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        futures = []
+        for entry in lines:
+            if speed is not None:
+                due = (entry.get('arrival', first) - first) / speed
+                delay = start + due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            futures.append(pool.submit(replayer.send, entry))
+        results = [future.result() for future in futures]
+    return results, time.perf_counter() - start
+
+
+def latency_row(name: str, recorded: list, replayed: list) -> str:
+    cells = [name, str(len(replayed))]
+    for q in (50, 95, 99):
+        cells.append(f"{percentile(recorded, q):.1f}")
+        cells.append(f"{percentile(replayed, q):.1f}")
+    return "{:<10} {:>7}  {:>9} {:>9}  {:>9} {:>9}  {:>9} {:>9}".format(*cells)
+
+
+def report(lines: list, results: list, elapsed: float, show: int) -> int:
+    recorded_span = lines[-1].get('arrival', 0) - lines[0].get('arrival', 0)
+    print(f"replayed {len(results)} requests in {elapsed:.1f} s, {len(results) / elapsed:.1f} req/s", end='')
+    if recorded_span > 0:
+        print(f", recorded at {len(lines) / recorded_span:.1f} req/s")
+    else:
+        print()
+
+    changed = Counter(
+        (entry.get('outcome'), result['outcome'])
+        for entry, result in zip(lines, results) if entry.get('outcome') != result['outcome']
+    )
+    mismatches = sum(changed.values())
+    print(f"outcomes matched {len(results) - mismatches}/{len(results)}")
+    for (recorded, replayed), count in changed.most_common(show):
+        print(f"  {count:>7}  {recorded} -> {replayed}")
+
+    print("{:<10} {:>7}  {:>9} {:>9}  {:>9} {:>9}  {:>9} {:>9}".format(
+        'ms', 'count', 'rec p50', 'p50', 'rec p95', 'p95', 'rec p99', 'p99'))
+    groups = (
+        ('all', lambda outcome: True),
+        ('witness', lambda outcome: outcome == 'witness'),
+        ('rejected', lambda outcome: outcome != 'witness'),
+    )
+    for name, keep in groups:
+        pairs = [(entry, result) for entry, result in zip(lines, results) if keep(entry.get('outcome'))]
+        if pairs:
+            print(latency_row(
+                name,
+                [entry['latency_ms'] for entry, _ in pairs if 'latency_ms' in entry],
+                [result['latency_ms'] for _, result in pairs],
+            ))
+    return mismatches
+
+
+def speed_of(value: str):
+    if value == 'max':
+        return None
+    speed = float(value.rstrip('x'))
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("the speed must be above 0, or max")
+    return speed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('capture', help="the captured JSONL file")
+    parser.add_argument('--host', default='http://127.0.0.1:8000')
+    parser.add_argument('--speed', type=speed_of, default=1.0, help="1, 10 or 10x for ten times faster, or max")
+    parser.add_argument('--concurrency', type=int, default=16, help="requests in flight at most")
+    parser.add_argument('--limit', type=int, default=None, help="replay only the first this many")
+    parser.add_argument('--timeout', type=float, default=30.0, help="seconds before a request is given up")
+    parser.add_argument('--show', type=int, default=10, help="changed outcomes listed")
+    parser.add_argument('--strict', action='store_true', help="exit 1 when any outcome changed")
+    args = parser.parse_args()
+
+    lines = load(args.capture, args.limit)
+    if not lines:
+        raise SystemExit(f"Nothing To Replay In {args.capture}")
+    results, elapsed = replay(lines, Replayer(args.host, args.timeout), args.speed, args.concurrency)
+    mismatches = report(lines, results, elapsed, args.show)
+    if args.strict and mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()